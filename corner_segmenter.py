@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Segmentación de la vuelta en curvas a partir de los datos (en lugar de los tres SECTORS fijos).
+
+segment_lap() detecta en una vuelta, con operaciones vectorizadas sobre los canales:
+  - zona de frenada (brake > BRAKE_THRESHOLD antes del vértice)
+  - turn-in (|lat_accel| suavizada supera LAT_THRESHOLD; cada sentido de giro es una curva,
+    así una S son dos curvas)
+  - vértice (velocidad mínima; también se guarda dónde está el pico de |lat_accel|)
+  - salida (|lat_accel| vuelve a bajar) y punto de gas (throttle > THROTTLE_ON tras el vértice)
+Todas las posiciones son LapDistPct.
+
+CornerTable es la tabla de curvas del circuito: con una rejilla de LapDistPct precalculada,
+lookup(pct) devuelve la curva y la fase (braking, entry, exit, straight) en O(1) para etiquetar
+cada tick en vivo, y as_sectors() da micro-sectores con el formato de SECTORS para
+SectorTracker / LapAggregator. Se guarda en JSON (corners.json).
+
+Uso offline: python corner_segmenter.py session_*.laps lap_*.json -o corners.json
+"""
+import argparse
+import json
+import os
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from persistence import atomic_write, json_serializer
+
+# Umbrales (unidades de nuestra captura: m/s², km/h, pedales 0..1, LapDistPct 0..1)
+LAT_THRESHOLD = 5.0        # |lat_accel| a partir de la cual se considera que se está girando
+BRAKE_THRESHOLD = 0.1
+THROTTLE_ON = 0.5
+SMOOTH_SAMPLES = 5         # media móvil para que el ruido no parta las curvas
+MERGE_GAP = 0.02           # tramos del mismo sentido separados por menos de esto son la misma curva
+MIN_CORNER_LENGTH = 0.005  # tramos más cortos se ignoran
+
+# Celdas de la rejilla de lookup()
+GRID_SIZE = 10000
+
+# Fases dentro de la zona de cada curva (de su entrada a la entrada de la siguiente)
+PHASES = ("braking", "entry", "exit", "straight")
+
+CORNERS_FILE = "corners.json"
+
+# Canales que usa segment_lap, en el orden de sus argumentos
+SEGMENT_KEYS = ("LapDistPct", "speed", "brake", "throttle", "lat_accel")
+
+Corner = namedtuple("Corner", "entry brake_start turn_in apex peak_lat exit throttle_on "
+                              "direction min_speed peak_lat_accel")
+
+# Campos de Corner que son LapDistPct (la mediana tiene que respetar el paso por 1.0 -> 0.0)
+POSITION_FIELDS = ("entry", "brake_start", "turn_in", "apex", "peak_lat", "exit", "throttle_on")
+
+
+def _runs(mask):
+    """Tramos [inicio, fin) donde mask es True."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _smooth(values, samples=SMOOTH_SAMPLES):
+    if samples <= 1 or len(values) < samples:
+        return values
+    return np.convolve(values, np.ones(samples) / samples, mode="same")
+
+
+def segment_lap(lap_dist_pct, speed, brake, throttle, lat_accel):
+    """
+    Curvas de una vuelta (arrays por canal, en orden de captura). Devuelve una lista de
+    Corner ordenada por vértice desde la línea de meta.
+    """
+    pct = np.asarray(lap_dist_pct, dtype=np.float64)
+    channels = np.array([np.asarray(column, dtype=np.float64) for column in (speed, brake, throttle, lat_accel)])
+    valid = ~np.isnan(pct)
+    pct, channels = pct[valid], np.nan_to_num(channels[:, valid])
+    order = np.argsort(pct, kind="stable")
+    pct, (speed, brake, throttle, lat_accel) = pct[order], channels[:, order]
+    if len(pct) < 2 * SMOOTH_SAMPLES:
+        return []
+
+    # Empezamos a contar en el punto más recto, así ninguna curva queda partida por la meta
+    lat = _smooth(lat_accel)
+    start = int(np.argmin(np.abs(lat)))
+    pct = np.roll(pct, -start)
+    pct = np.where(np.arange(len(pct)) < len(pct) - start, pct, pct + 1.0)
+    speed, brake, throttle, lat, lat_accel = (np.roll(column, -start) for column in (speed, brake, throttle, lat, lat_accel))
+
+    # Tramos girando, por sentido de giro
+    segments = []
+    for direction in (1, -1):
+        starts, ends = _runs(direction * lat > LAT_THRESHOLD)
+        if not len(starts):
+            continue
+        # Unir tramos muy próximos del mismo sentido
+        keep = np.concatenate(([True], pct[starts[1:]] - pct[ends[:-1] - 1] > MERGE_GAP))
+        starts, ends = starts[keep], np.concatenate((ends[np.flatnonzero(keep[1:])], ends[-1:]))
+        long_enough = pct[ends - 1] - pct[starts] >= MIN_CORNER_LENGTH
+        segments += [(s, e, direction) for s, e in zip(starts[long_enough].tolist(), ends[long_enough].tolist())]
+    segments.sort()
+
+    apexes, peaks = [], []
+    for s, e, _ in segments:
+        peak = s + int(np.argmax(np.abs(lat_accel[s:e])))
+        apex = s + int(np.argmin(speed[s:e]))
+        if not s < apex < e - 1:
+            # Curva rápida sin mínimo de velocidad dentro (se acelera o se frena a lo largo de
+            # toda ella): el vértice es el pico de aceleración lateral
+            apex = peak
+        apexes.append(apex)
+        peaks.append(peak)
+
+    # Cada frenada es de la primera curva cuyo vértice llega después de soltar el freno
+    # (así una frenada que empieza en una curva rápida cuenta para la lenta que viene detrás);
+    # si hay varias, la zona de frenada empieza en la primera
+    brake_starts, brake_ends = _runs(brake > BRAKE_THRESHOLD)
+    owners = np.searchsorted(np.array(apexes), brake_ends - 1)
+    first_brake = {}
+    for owner, brake_start in zip(owners.tolist(), brake_starts.tolist()):
+        first_brake.setdefault(owner, brake_start)
+
+    corners = []
+    for i, (s, e, direction) in enumerate(segments):
+        apex, peak = apexes[i], peaks[i]
+        brake_start = first_brake.get(i)
+
+        throttle_on = np.flatnonzero(throttle[apex:] > THROTTLE_ON)
+        throttle_on = apex + int(throttle_on[0]) if len(throttle_on) else None
+
+        entry = min(s, brake_start) if brake_start is not None else s
+        corners.append(Corner(
+            entry=float(pct[entry] % 1.0),
+            brake_start=float(pct[brake_start] % 1.0) if brake_start is not None else None,
+            turn_in=float(pct[s] % 1.0),
+            apex=float(pct[apex] % 1.0),
+            peak_lat=float(pct[peak] % 1.0),
+            exit=float(pct[e - 1] % 1.0),
+            throttle_on=float(pct[throttle_on] % 1.0) if throttle_on is not None else None,
+            direction=direction,
+            min_speed=float(speed[apex]),
+            peak_lat_accel=float(np.abs(lat_accel[peak])),
+        ))
+
+    corners.sort(key=lambda corner: corner.apex)
+    return corners
+
+
+class CornerTable:
+    def __init__(self, corners):
+        """corners: lista de Corner (de segment_lap o de un corners.json)."""
+        self.corners = sorted(corners, key=lambda corner: corner.apex)
+        self.names = tuple(f"T{i + 1}" for i in range(len(self.corners)))
+
+        # Rejilla: curva dueña de cada celda (desde su entrada hasta la entrada de la siguiente)
+        # y fase dentro de esa zona
+        self._corner_grid = np.full(GRID_SIZE, -1, dtype=np.int16)
+        self._phase_grid = np.full(GRID_SIZE, PHASES.index("straight"), dtype=np.int8)
+        if not self.corners:
+            return
+        cells = (np.arange(GRID_SIZE) + 0.5) / GRID_SIZE
+        entries = np.array([corner.entry for corner in self.corners])
+        by_entry = np.argsort(entries, kind="stable")
+        owner = np.searchsorted(entries[by_entry], cells, side="right") - 1
+        # Antes de la primera entrada seguimos en la zona de la última curva (cruza la meta)
+        self._corner_grid[:] = by_entry[owner]
+
+        offset = (cells - entries[self._corner_grid]) % 1.0
+        turn_in, apex, exit = (
+            (np.array([getattr(corner, field) for corner in self.corners]) - entries) % 1.0
+            for field in ("turn_in", "apex", "exit")
+        )
+        corner = self._corner_grid
+        self._phase_grid[:] = np.select(
+            [offset < turn_in[corner], offset < apex[corner], offset <= exit[corner]],
+            [PHASES.index("braking"), PHASES.index("entry"), PHASES.index("exit")],
+            PHASES.index("straight"),
+        )
+
+    @classmethod
+    def from_lap(cls, lap_dist_pct, speed, brake, throttle, lat_accel):
+        return cls(segment_lap(lap_dist_pct, speed, brake, throttle, lat_accel))
+
+    @classmethod
+    def from_laps(cls, laps):
+        """
+        Tabla a partir de varias vueltas (dicts canal -> array). Se segmenta cada una; las
+        curvas de una vuelta con el número de curvas más habitual se buscan en el resto (mismo
+        sentido y el tramo turn-in..salida que más se solapa) y se toma la mediana de cada campo.
+        Las curvas que no aparecen en al menos la mitad de las vueltas se descartan, y de dos
+        curvas que se solapan (una curva larga partida en la vuelta de referencia) queda la que
+        aparece en más vueltas.
+        """
+        segmented = [segment_lap(*(lap[key] for key in SEGMENT_KEYS)) for lap in laps]
+        segmented = [corners for corners in segmented if corners]
+        if not segmented:
+            return cls([])
+        count = Counter(len(corners) for corners in segmented).most_common(1)[0][0]
+        reference = next(corners for corners in segmented if len(corners) == count)
+
+        candidates_by_support = []
+        for reference_corner in reference:
+            matches = []
+            for lap_corners in segmented:
+                candidates = [(_overlap(corner, reference_corner), i)
+                              for i, corner in enumerate(lap_corners) if corner.direction == reference_corner.direction]
+                overlap, i = max(candidates, default=(0.0, None))
+                if overlap > 0.0:
+                    matches.append(lap_corners[i])
+            if 2 * len(matches) < len(segmented):
+                continue
+
+            median = {"direction": reference_corner.direction}
+            for field in Corner._fields:
+                if field == "direction":
+                    continue
+                values = [getattr(corner, field) for corner in matches if getattr(corner, field) is not None]
+                if 2 * len(values) < len(matches):
+                    median[field] = None
+                elif field in POSITION_FIELDS:
+                    median[field] = _circular_median(values)
+                else:
+                    median[field] = float(np.median(values))
+            candidates_by_support.append((len(matches), Corner(**median)))
+
+        corners = []
+        for _, corner in sorted(candidates_by_support, key=lambda item: -item[0]):
+            if not any(other.direction == corner.direction and _overlap(corner, other) > 0.0 for other in corners):
+                corners.append(corner)
+        return cls(corners)
+
+    @classmethod
+    def load(cls, filename=CORNERS_FILE):
+        """Carga una tabla guardada con save(); None si no existe o no se puede leer."""
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(filename, "r") as f:
+                data = json.load(f)
+            return cls([Corner(*(corner.get(field) for field in Corner._fields)) for corner in data.get("corners", [])])
+        except Exception as e:
+            print(f"Error cargando {filename}: {e}")
+            return None
+
+    def to_dict(self):
+        return {"corners": [dict(corner._asdict(), name=name) for name, corner in zip(self.names, self.corners)]}
+
+    def save(self, filename=CORNERS_FILE):
+        atomic_write(filename, json_serializer(self.to_dict()))
+
+    def __len__(self):
+        return len(self.corners)
+
+    def lookup(self, position):
+        """(nombre de la curva, fase) en LapDistPct = position, O(1); (None, None) sin curvas."""
+        if not self.corners:
+            return None, None
+        cell = int(position % 1.0 * GRID_SIZE)
+        return self.names[self._corner_grid[cell]], PHASES[self._phase_grid[cell]]
+
+    def as_sectors(self):
+        """
+        Micro-sectores con el formato de SECTORS: cada curva desde su entrada hasta la entrada
+        de la siguiente. El primero empieza en 0.0 (incluye el tramo de recta antes de la
+        primera entrada) y el último acaba en 1.0.
+        """
+        if not self.corners:
+            return {"lap": (0.0, 1.0)}
+        by_entry = sorted(zip(self.names, (corner.entry for corner in self.corners)), key=lambda item: item[1])
+        bounds = [0.0] + [entry for _, entry in by_entry[1:]] + [1.0]
+        return {name: (bounds[i], bounds[i + 1]) for i, (name, _) in enumerate(by_entry)}
+
+
+def _overlap(a, b):
+    """Solape (en LapDistPct) de los tramos turn-in..salida de dos curvas, dando la vuelta por la meta."""
+    start = (b.turn_in - a.turn_in) % 1.0
+    length_a = (a.exit - a.turn_in) % 1.0
+    length_b = (b.exit - b.turn_in) % 1.0
+    # b empieza dentro de a, o a empieza dentro de b
+    if start <= length_a:
+        return min(length_a - start, length_b)
+    start = (a.turn_in - b.turn_in) % 1.0
+    if start <= length_b:
+        return min(length_b - start, length_a)
+    return 0.0
+
+
+def _circular_median(values):
+    if not values:
+        return None
+    values = np.asarray(values)
+    # Referencia: el primer valor; se desenvuelve todo a ±0.5 de él
+    unwrapped = values[0] + (values - values[0] + 0.5) % 1.0 - 0.5
+    return float(np.median(unwrapped) % 1.0)
+
+
+def segment_store(path):
+    """Segmenta en bloque las vueltas completas de un lap store: lista de (índice, [Corner])."""
+    from lap_store import LapStoreReader
+
+    reader = LapStoreReader(path)
+    try:
+        result = []
+        for i, lap in enumerate(reader.laps):
+            if lap["lap_time"] is None:
+                continue
+            columns = reader.read_lap(i, keys=SEGMENT_KEYS)
+            result.append((i, segment_lap(*(columns[key] for key in SEGMENT_KEYS))))
+        return result
+    finally:
+        reader.close()
+
+
+def _load_laps(files):
+    """Vueltas (dicts canal -> array) de lap stores y de JSON con el formato de lap_*.json."""
+    from lap_store import LapStoreReader, STORE_SUFFIX
+
+    laps = []
+    for path in files:
+        if path.endswith(STORE_SUFFIX):
+            reader = LapStoreReader(path)
+            laps += [{key: np.array(reader.read(key, lap=i), dtype=np.float64) for key in SEGMENT_KEYS}
+                     for i, lap in enumerate(reader.laps) if lap["lap_time"] is not None]
+            reader.close()
+        else:
+            with open(path, "r") as f:
+                lap_data = json.load(f).get("lap_data", [])
+            laps.append({key: np.array([data.get(key) for data in lap_data], dtype=np.float64) for key in SEGMENT_KEYS})
+    return laps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detecta las curvas del circuito a partir de vueltas grabadas")
+    parser.add_argument("files", nargs="+", help="lap stores (.laps) o JSON de vueltas (lap_*.json, best_lap.json)")
+    parser.add_argument("-o", "--output", default=CORNERS_FILE, help=f"tabla de curvas (por defecto {CORNERS_FILE})")
+    args = parser.parse_args()
+
+    laps = _load_laps(args.files)
+    table = CornerTable.from_laps(laps)
+    print(f"{len(table)} curvas a partir de {len(laps)} vueltas:")
+    for name, corner in zip(table.names, table.corners):
+        brake = f"frenada {corner.brake_start:.3f}" if corner.brake_start is not None else "sin frenada"
+        print(f"  {name}: {brake}, turn-in {corner.turn_in:.3f}, vértice {corner.apex:.3f} "
+              f"({corner.min_speed:.1f} km/h), salida {corner.exit:.3f}")
+    table.save(args.output)
+    print(f"Tabla guardada en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,9 @@ import json
 import numpy as np
 import pandas as pd
 
-# Definimos sectores para Tsukuba, ejemplo ficticio (ajusta porcentajes reales)
-SECTORS = {
-    "sector1": (0.00, 0.33),  # LapDistPct de 0% a 33%
-    "sector2": (0.33, 0.66),  # 33% a 66%
-    "sector3": (0.66, 1.00)   # 66% a 100%
-}
+# Sectores compartidos con el seguimiento en vivo de LapManager
+from sector_tracker import SECTORS
+from lap_features import LapAggregator, FEATURES_FILE, read_lap_features
 
 def process_lap_file(filepath):
     """
@@ -89,8 +86,23 @@ def build_laps_dataset(folder="."):
     df = pd.DataFrame(records)
     return df
 
+def build_features_dataset(folder="."):
+    """
+    Igual que build_laps_dataset, pero con los agregados por sector que LapManager calcula
+    durante la captura (FEATURES_FILE). Vacío si no hay archivo.
+    Los sectores son los de cada fila (SECTORS, o uno por curva si había corners.json).
+    """
+    rows = read_lap_features(os.path.join(folder, FEATURES_FILE))
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame(rows)
+    return df.drop(columns=LapAggregator().lap_columns(), errors="ignore")
+
 def main():
-    df = build_laps_dataset(".")
+    # Agregados de la captura si los hay; si no, se recorren los lap_*.json
+    df = build_features_dataset(".")
+    if df.empty:
+        df = build_laps_dataset(".")
     if df.empty:
         print("No se han encontrado vueltas válidas.")
         return
@@ -1,12 +1,19 @@
 #!python3
 
 import re
+import os
+import json
 import argparse
 import mmap
+import time
 import struct
 import ctypes
+import queue
 import yaml
-from threading import Thread
+from collections import namedtuple
+from operator import itemgetter
+from concurrent.futures import Future
+from threading import Thread, Condition, Event
 from urllib import request, error
 from yaml.reader import Reader as YamlReader
 
@@ -15,9 +22,15 @@ try:
 except ImportError:
     from yaml import SafeLoader as YamlSafeLoader
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 VERSION = '1.3.5'
 
 SIM_STATUS_URL = 'http://127.0.0.1:32034/get_sim_status?object=simStatus'
+SIM_STATUS_TIMEOUT = 2
 
 DATAVALIDEVENTNAME = 'Local\\IRSDKDataValidEvent'
 MEMMAPFILE = 'Local\\IRSDKMemMapFileName'
@@ -25,6 +38,19 @@ MEMMAPFILESIZE = 1164 * 1024
 BROADCASTMSGNAME = 'IRSDK_BROADCASTMSG'
 
 VAR_TYPE_MAP = ['c', '?', 'i', 'I', 'f', 'd']
+VAR_TYPE_MAP_NUMPY = ['S1', '?', 'i4', 'u4', 'f4', 'f8']
+
+Tick = namedtuple('Tick', 'tick_count dropped timestamp')
+SimStatusEvent = namedtuple('SimStatusEvent', 'running timestamp')
+
+IBT_LAP_INDEX_SUFFIX = '.laps.json'
+# bumped when the way lap times are computed changes, so old cached indexes are rebuilt
+IBT_LAP_INDEX_VERSION = 2
+# a Lap change only counts as a start/finish line crossing if LapDistPct wraps from
+# within this margin of 1.0 to within this margin of 0.0 (not a reset, tow or pit exit)
+LAP_WRAP_MARGIN = 0.1
+
+SESSION_INFO_SECTION_RE = re.compile(rb'\n(\w+):\n')
 
 YAML_TRANSLATER = bytes.maketrans(b'\x81\x8D\x8F\x90\x9D', b'     ')
 YAML_CODE_PAGE = 'cp1252'
@@ -269,44 +295,86 @@ class TrackWetness:
 
 
 class IRSDKStruct:
-    @classmethod
-    def property_value(cls, offset, var_type):
-        struct_type = struct.Struct(var_type)
-        return property(lambda self: self.get(offset, struct_type))
-
-    @classmethod
-    def property_value_str(cls, offset, var_type):
-        struct_type = struct.Struct(var_type)
-        return property(lambda self: self.get(offset, struct_type).strip(b'\x00').decode('latin-1'))
+    # all fields are decoded at once with one precompiled struct into __slots__,
+    # fields that sim changes while running are decoded again only by refresh()
+    __slots__ = ('_shared_mem', '_offset')
+    _fields = {}
+    _str_fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if '_fields' in cls.__dict__:
+            cls._struct = cls.compile_struct(cls._fields)
+            cls._struct_offset = min(cls._fields.values())[0]
+            cls._struct_names = tuple(sorted(cls._fields, key=cls._fields.get))
+
+    @staticmethod
+    def compile_struct(fields):
+        # fields: {name: (offset, var_type)}, gaps between fields become pad bytes
+        fmt = '='
+        pos = None
+        for offset, var_type in sorted(fields.values()):
+            if pos is not None and offset > pos:
+                fmt += '%dx' % (offset - pos)
+            fmt += var_type
+            pos = offset + struct.calcsize('=' + var_type)
+        return struct.Struct(fmt)
 
     def __init__(self, shared_mem, offset=0):
         self._shared_mem = shared_mem
         self._offset = offset
+        self._decode()
 
     def __repr__(self):
         return f'''<{self.__class__.__module__}.{self.__class__.__name__} {', '.join(
                 f'{k}={getattr(self, k)!r}'
-                for k, p in vars(self.__class__).items()
-                if not k.startswith('_') and isinstance(p, property)
+                for k in self._fields
+                if not k.startswith('_')
             )}>'''
 
+    def refresh(self):
+        self._decode()
+
+    def _decode(self):
+        values = self._struct.unpack_from(self._shared_mem, self._offset + self._struct_offset)
+        for name, value in zip(self._struct_names, values):
+            setattr(self, name, value)
+        for name in self._str_fields:
+            setattr(self, name, getattr(self, name).strip(b'\x00').decode('latin-1'))
+
     def get(self, offset, struct_type):
         return struct_type.unpack_from(self._shared_mem, self._offset + offset)[0]
 
+    @classmethod
+    def pack_into(cls, buffer, buffer_offset=0, /, **values):
+        # counterpart of decoding, used to write irsdk memory layouts and ibt files, missing fields are zero
+        args = []
+        for name in cls._struct_names:
+            var_type = cls._fields[name][1]
+            value = values.get(name, b'' if var_type.endswith('s') else 0)
+            if name in cls._str_fields and isinstance(value, str):
+                value = value.encode('latin-1')
+            args.append(value)
+        cls._struct.pack_into(buffer, buffer_offset + cls._struct_offset, *args)
+
 class Header(IRSDKStruct):
-    version = IRSDKStruct.property_value(0, 'i')
-    status = IRSDKStruct.property_value(4, 'i')
-    tick_rate = IRSDKStruct.property_value(8, 'i')
+    _fields = dict(
+        version=(0, 'i'),
+        status=(4, 'i'),
+        tick_rate=(8, 'i'),
 
-    session_info_update = IRSDKStruct.property_value(12, 'i')
-    session_info_len = IRSDKStruct.property_value(16, 'i')
-    session_info_offset = IRSDKStruct.property_value(20, 'i')
+        session_info_update=(12, 'i'),
+        session_info_len=(16, 'i'),
+        session_info_offset=(20, 'i'),
 
-    num_vars = IRSDKStruct.property_value(24, 'i')
-    var_header_offset = IRSDKStruct.property_value(28, 'i')
+        num_vars=(24, 'i'),
+        var_header_offset=(28, 'i'),
 
-    num_buf = IRSDKStruct.property_value(32, 'i')
-    buf_len = IRSDKStruct.property_value(36, 'i')
+        num_buf=(32, 'i'),
+        buf_len=(36, 'i'),
+    )
+    __slots__ = tuple(_fields) + ('var_buf', '_tick_counts_struct')
+    _refresh_struct = struct.Struct('=7i')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -315,23 +383,53 @@ class Header(IRSDKStruct):
             VarBuffer(self._shared_mem, 48 + i * 16, buf_len=self.buf_len)
             for i in range(self.num_buf)
         ]
+        # tick count of every var buffer
+        self._tick_counts_struct = struct.Struct('=' + 'i12x' * self.num_buf)
+
+    def refresh(self):
+        # re-read only header fields sim changes while running (status to var_header_offset)
+        (self.status, self.tick_rate, self.session_info_update, self.session_info_len,
+            self.session_info_offset, self.num_vars, self.var_header_offset) = \
+            self._refresh_struct.unpack_from(self._shared_mem, self._offset + 4)
+
+    def refresh_tick_counts(self):
+        for var_buf, tick_count in zip(self.var_buf, self._tick_counts_struct.unpack_from(self._shared_mem, 48)):
+            var_buf.tick_count = tick_count
 
 class VarBuffer(IRSDKStruct):
-    tick_count = IRSDKStruct.property_value(0, 'i')
-    _buf_offset = IRSDKStruct.property_value(4, 'i')
+    _fields = dict(
+        tick_count=(0, 'i'),
+        _buf_offset=(4, 'i'),
+    )
+    __slots__ = tuple(_fields) + ('is_memory_frozen', 'frozen_tick_count', '_frozen_memory', '_buf_len')
+    _tick_count_struct = struct.Struct('=i')
 
     def __init__(self, *args, buf_len, **kwargs):
         super().__init__(*args, **kwargs)
         self.is_memory_frozen = False
+        self.frozen_tick_count = None
         self._frozen_memory = None
         self._buf_len = buf_len
 
+    def refresh_tick_count(self):
+        self.tick_count = self._tick_count_struct.unpack_from(self._shared_mem, self._offset)[0]
+        return self.tick_count
+
     def freeze(self):
-        self._frozen_memory = self._shared_mem[self._buf_offset : self._buf_offset + self._buf_len]
+        # copy var buffer into preallocated memory (allocated only once),
+        # returns False if sim wrote a new tick into this buffer while we were copying
+        tick_count = self.refresh_tick_count()
+        if self._frozen_memory is None:
+            self._frozen_memory = bytearray(self._buf_len)
+        buf_offset = self._buf_offset
+        with memoryview(self._shared_mem) as shared_mem, memoryview(self._frozen_memory) as frozen_memory:
+            frozen_memory[:] = shared_mem[buf_offset : buf_offset + self._buf_len]
+        self.frozen_tick_count = tick_count
         self.is_memory_frozen = True
+        return self.refresh_tick_count() == tick_count
 
     def unfreeze(self):
-        self._frozen_memory = None
+        self.frozen_tick_count = None
         self.is_memory_frozen = False
 
     def get_memory(self):
@@ -342,24 +440,250 @@ class VarBuffer(IRSDKStruct):
         return 0 if self.is_memory_frozen else self._buf_offset
 
 class VarHeader(IRSDKStruct):
-    type = IRSDKStruct.property_value(0, 'i')
-    offset = IRSDKStruct.property_value(4, 'i')
-    count = IRSDKStruct.property_value(8, 'i')
-    count_as_time = IRSDKStruct.property_value(12, '?')
-    name = IRSDKStruct.property_value_str(16, '32s')
-    desc = IRSDKStruct.property_value_str(48, '64s')
-    unit = IRSDKStruct.property_value_str(112, '32s')
+    _fields = dict(
+        type=(0, 'i'),
+        offset=(4, 'i'),
+        count=(8, 'i'),
+        count_as_time=(12, '?'),
+        name=(16, '32s'),
+        desc=(48, '64s'),
+        unit=(112, '32s'),
+    )
+    _str_fields = ('name', 'desc', 'unit')
+    __slots__ = tuple(_fields)
 
 class DiskSubHeader(IRSDKStruct):
-    session_start_date = IRSDKStruct.property_value(0, 'Q')
-    session_start_time = IRSDKStruct.property_value(8, 'd')
-    session_end_time = IRSDKStruct.property_value(16, 'd')
-    session_lap_count = IRSDKStruct.property_value(24, 'i')
-    session_record_count = IRSDKStruct.property_value(28, 'i')
+    _fields = dict(
+        session_start_date=(0, 'Q'),
+        session_start_time=(8, 'd'),
+        session_end_time=(16, 'd'),
+        session_lap_count=(24, 'i'),
+        session_record_count=(28, 'i'),
+    )
+    __slots__ = tuple(_fields)
+
+def var_headers_dtype(var_headers, buf_len):
+    # numpy structured dtype laid over one var buffer, array vars become subarray fields
+    if np is None:
+        raise ImportError('numpy is required for structured var buffer arrays')
+    return np.dtype({
+        'names': [var_header.name for var_header in var_headers],
+        'formats': [
+            VAR_TYPE_MAP_NUMPY[var_header.type] if var_header.count == 1 else
+            (VAR_TYPE_MAP_NUMPY[var_header.type], (var_header.count,))
+            for var_header in var_headers
+        ],
+        'offsets': [var_header.offset for var_header in var_headers],
+        'itemsize': buf_len,
+    })
+
+def lap_crossing(time_before, pct_before, time_after, pct_after):
+    # start/finish line crossing between two records (scalars or arrays): session time interpolated
+    # across the LapDistPct wrap and whether LapDistPct really wrapped (see LAP_WRAP_MARGIN)
+    if np is None:
+        raise ImportError('numpy is required for lap crossings')
+    dist_before = 1.0 - np.asarray(pct_before, dtype=np.float64)
+    dist_after = np.asarray(pct_after, dtype=np.float64)
+    total = dist_before + dist_after
+    ratio = np.divide(dist_before, total, out=np.ones_like(total), where=total > 0)
+    crossing_time = time_before + (time_after - time_before) * ratio
+    wrapped = (dist_before >= 0.0) & (dist_before <= LAP_WRAP_MARGIN) & (dist_after >= 0.0) & (dist_after <= LAP_WRAP_MARGIN)
+    return crossing_time, wrapped
+
+class VarReader:
+    # reads several variables from one var buffer with a single precompiled struct,
+    # recompiled whenever the var headers layout changes (e.g. after a car change)
+    def __init__(self, ir, keys, named=False):
+        self._ir = ir
+        self.keys = tuple(keys)
+        self.record = namedtuple('VarRecord', self.keys, rename=True) if named else None
+        # tick_count of the var buffer the last read() came from
+        self.tick_count = None
+
+        self._layout = None
+        self._struct = None
+        self._start = 0
+        self._getter = None
+
+    def __call__(self):
+        return self.read()
+
+    def read(self):
+        ir = self._ir
+        if not ir._header:
+            return None
+        ir._header.refresh()
+        var_buf_latest = ir._var_buffer_latest
+        layout = ir._var_headers_layout
+        if layout != self._layout:
+            self._compile()
+            self._layout = layout
+        values = self._getter(self._struct.unpack_from(
+            var_buf_latest.get_memory(),
+            var_buf_latest.buf_offset + self._start))
+        self.tick_count = var_buf_latest.frozen_tick_count if var_buf_latest.is_memory_frozen else var_buf_latest.tick_count
+        return self.record._make(values) if self.record else values
+
+    def _compile(self):
+        var_headers_dict = self._ir._var_headers_dict
+        var_headers = sorted(
+            {var_headers_dict[key].name: var_headers_dict[key] for key in self.keys if key in var_headers_dict}.values(),
+            key=lambda v: v.offset)
+
+        fmt = '='
+        pos = self._start = var_headers[0].offset if var_headers else 0
+        index = 0
+        slices = {}
+        for var_header in var_headers:
+            var_type = VAR_TYPE_MAP[var_header.type]
+            count = var_header.count
+            if var_header.offset > pos:
+                fmt += '%dx' % (var_header.offset - pos)
+            fmt += var_type * count
+            pos = var_header.offset + struct.calcsize('=' + var_type) * count
+            slices[var_header.name] = (index, count)
+            index += count
+        self._struct = struct.Struct(fmt)
+
+        fields = [slices.get(key) for key in self.keys]
+        if fields and all(field and field[1] == 1 for field in fields):
+            if len(fields) == 1:
+                i = fields[0][0]
+                self._getter = lambda values: (values[i],)
+            else:
+                self._getter = itemgetter(*(field[0] for field in fields))
+        else:
+            def getter(values):
+                return tuple(
+                    None if field is None else
+                    values[field[0]] if field[1] == 1 else
+                    list(values[field[0]:field[0] + field[1]])
+                    for field in fields)
+            self._getter = getter
+
+class SessionInfoWorker:
+    # one long lived thread parsing session info sections for IRSDK(parse_yaml_async=True),
+    # a newer request for a key replaces a pending one, requests for outdated updates are dropped
+    def __init__(self, ir):
+        self._ir = ir
+        self._pending = {}
+        self._condition = Condition()
+        self._thread = None
+        self._stopped = False
+
+    def submit(self, key, session_data, session_info_update):
+        with self._condition:
+            future = session_data.get('future')
+            if future is None or future.done():
+                future = session_data['future'] = Future()
+            self._pending[key] = (session_info_update, session_data, future)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._pending.clear()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                key = next(iter(self._pending))
+                session_info_update, session_data, future = self._pending.pop(key)
+
+            last_session_info_update = self._ir.last_session_info_update
+            if session_info_update == last_session_info_update:
+                try:
+                    self._ir._parse_yaml(key, session_data, session_info_update)
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+            # resolve only if parsed data is still current, otherwise parse it again for latest update
+            with self._condition:
+                if self._stopped or key in self._pending:
+                    continue
+                if self._ir.last_session_info_update == session_info_update:
+                    future.set_result(session_data['data'])
+                else:
+                    self._pending[key] = (self._ir.last_session_info_update, session_data, future)
+
+class ConnectionManager:
+    # probes sim status from a background thread, with timeout and exponential backoff while sim is down,
+    # so loops using IRSDK never block on http; every change of sim running state is put to events queue
+    def __init__(self, status_url=SIM_STATUS_URL, timeout=SIM_STATUS_TIMEOUT,
+            min_interval=0.5, max_interval=10.0, check_interval=2.0):
+        self.status_url = status_url
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.check_interval = check_interval
+
+        self.events = queue.Queue()
+        self.running = Event()
+        self._stopped = Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def wait_running(self, timeout=None):
+        return self.running.wait(timeout)
+
+    def next_event(self, timeout=None):
+        # next change of sim running state from events queue, None if none came within timeout (0: don't wait)
+        try:
+            return self.events.get(timeout=timeout) if timeout != 0 else self.events.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _probe(self):
+        try:
+            with request.urlopen(self.status_url, timeout=self.timeout) as response:
+                return 'running:1' in response.read().decode('utf-8')
+        except (error.URLError, OSError, ValueError):
+            return False
+
+    def _run(self):
+        interval = self.min_interval
+        while not self._stopped.is_set():
+            running = self._probe()
+            if running != self.running.is_set():
+                if running:
+                    self.running.set()
+                else:
+                    self.running.clear()
+                self.events.put(SimStatusEvent(running, time.time()))
+            if running:
+                interval = self.min_interval
+                wait = self.check_interval
+            else:
+                wait = interval
+                interval = min(interval * 2, self.max_interval)
+            self._stopped.wait(wait)
 
 class IRSDK:
-    def __init__(self, parse_yaml_async=False):
+    def __init__(self, parse_yaml_async=False, read_latest=False):
         self.parse_yaml_async = parse_yaml_async
+        # read from a consistent copy of the most recent var buffer,
+        # instead of the 2nd most recent one straight from shared memory
+        self.read_latest = read_latest
         self.is_initialized = False
         self.last_session_info_update = 0
 
@@ -370,8 +694,14 @@ class IRSDK:
         self.__var_headers = None
         self.__var_headers_dict = None
         self.__var_headers_names = None
+        self.__var_headers_layout = None
+        self.__var_headers_generation = 0
         self.__var_buffer_latest = None
+        self.__var_buffer_snapshot = None
+        self.__var_buffer_dtype = None
         self.__session_info_dict = {}
+        self.__session_info_sections = None
+        self.__session_info_worker = None
         self.__broadcast_msg_id = None
         self.__test_file = None
         self.__workaround_connected_state = 0
@@ -391,6 +721,7 @@ class IRSDK:
     @property
     def is_connected(self):
         if self._header:
+            self._header.refresh()
             if self._header.status == StatusField.status_connected:
                 self.__workaround_connected_state = 0
             if self.__workaround_connected_state == 0 and self._header.status != StatusField.status_connected:
@@ -405,6 +736,7 @@ class IRSDK:
 
     @property
     def session_info_update(self):
+        self._header.refresh()
         return self._header.session_info_update
 
     @property
@@ -413,9 +745,48 @@ class IRSDK:
             self.__var_headers_names = [var_header.name for var_header in self._var_headers]
         return self.__var_headers_names
 
-    def startup(self, test_file=None, dump_to=None):
+    def ticks(self, timeout=1.0):
+        # yields Tick(tick_count, dropped, timestamp) once for every new tick published by sim,
+        # dropped is number of ticks skipped since previous one, timestamp is time.perf_counter() when it was seen,
+        # stops if there is no new tick within timeout seconds
+        last_tick_count = None
+        last_tick_time = time.perf_counter()
+        while self.is_initialized and self._header:
+            self._header.refresh_tick_counts()
+            tick_count = max(var_buf.tick_count for var_buf in self._header.var_buf)
+            now = time.perf_counter()
+            if tick_count != last_tick_count:
+                dropped = 0
+                if last_tick_count is not None and tick_count > last_tick_count:
+                    dropped = tick_count - last_tick_count - 1
+                last_tick_count = tick_count
+                last_tick_time = now
+                yield Tick(tick_count, dropped, now)
+                continue
+            if timeout is not None and now - last_tick_time > timeout:
+                return
+            if self._data_valid_event:
+                self._wait_valid_data_event()
+            else:
+                # sleep until next tick is expected, then poll in small steps
+                period = 1 / (self._header.tick_rate or 60)
+                time.sleep(max(period - (now - last_tick_time), period / 16))
+
+    def reader(self, keys, named=False):
+        return VarReader(self, keys, named)
+
+    def as_array(self):
+        # zero-copy structured record over latest var buffer (shared memory or frozen copy)
+        if not self._header:
+            return None
+        var_buf_latest = self._var_buffer_latest
+        return np.frombuffer(var_buf_latest.get_memory(), self._var_buffer_dtype,
+            count=1, offset=var_buf_latest.buf_offset)[0]
+
+    def startup(self, test_file=None, dump_to=None, check_sim_status=True):
+        # check_sim_status=False skips http request, e.g. when ConnectionManager already knows that sim is running
         if test_file is None:
-            if not self._check_sim_status():
+            if check_sim_status and not self._check_sim_status():
                 return False
             self._data_valid_event = ctypes.windll.kernel32.OpenEventW(0x00100000, False, DATAVALIDEVENTNAME)
         if not self._wait_valid_data_event():
@@ -442,15 +813,23 @@ class IRSDK:
         self.is_initialized = False
         self.last_session_info_update = 0
         if self._shared_mem:
-            self._shared_mem.close()
+            _close_shared_mem(self._shared_mem)
             self._shared_mem = None
         self._header = None
         self._data_valid_event = None
         self.__var_headers = None
         self.__var_headers_dict = None
         self.__var_headers_names = None
+        self.__var_headers_layout = None
+        self.__var_headers_generation += 1
         self.__var_buffer_latest = None
+        self.__var_buffer_snapshot = None
+        self.__var_buffer_dtype = None
         self.__session_info_dict = {}
+        self.__session_info_sections = None
+        if self.__session_info_worker:
+            self.__session_info_worker.stop()
+            self.__session_info_worker = None
         self.__broadcast_msg_id = None
         if self.__test_file:
             self.__test_file.close()
@@ -517,19 +896,50 @@ class IRSDK:
 
     def _check_sim_status(self):
         try:
-            return 'running:1' in request.urlopen(SIM_STATUS_URL).read().decode('utf-8')
+            return 'running:1' in request.urlopen(SIM_STATUS_URL, timeout=SIM_STATUS_TIMEOUT).read().decode('utf-8')
         except error.URLError as e:
             print("Failed to connect to sim: {}".format(e.reason))
             return False
+        except OSError as e:
+            print("Failed to connect to sim: {}".format(e))
+            return False
 
     @property
     def _var_buffer_latest(self):
+        if self.__var_buffer_latest:
+            return self.__var_buffer_latest
+        if self.read_latest:
+            return self._var_buffer_snapshot
         # return 2nd most recent var buffer
         # because it might be a situation (with most recent var buffer)
         # that half of var buffer written with new data
         # and other half still old
+        self._header.refresh_tick_counts()
         return sorted(self._header.var_buf, key=lambda v: v.tick_count, reverse=True)[1]
 
+    @property
+    def _var_buffer_snapshot(self):
+        # copy of most recent var buffer, refreshed only when sim publishes a new tick
+        snapshot = self.__var_buffer_snapshot
+        self._header.refresh_tick_counts()
+        var_buf = max(self._header.var_buf, key=lambda v: v.tick_count)
+        if var_buf is snapshot and snapshot.frozen_tick_count == var_buf.tick_count:
+            return snapshot
+        if snapshot:
+            snapshot.unfreeze()
+        self.__var_buffer_snapshot = self._freeze_var_buffer_most_recent()
+        return self.__var_buffer_snapshot
+
+    def _freeze_var_buffer_most_recent(self):
+        # seqlock style read: copy most recent var buffer,
+        # and try again only if the sim started to overwrite it during the copy
+        while True:
+            self._header.refresh_tick_counts()
+            var_buf = max(self._header.var_buf, key=lambda v: v.tick_count)
+            if var_buf.freeze():
+                return var_buf
+            var_buf.unfreeze()
+
     @property
     def _var_headers(self):
         if self.__var_headers is None:
@@ -547,17 +957,47 @@ class IRSDK:
                 self.__var_headers_dict[var_header.name] = var_header
         return self.__var_headers_dict
 
+    @property
+    def _var_headers_layout(self):
+        # drop cached var headers if sim rewrote them (as of last header refresh),
+        # returns generation of current layout
+        layout = (self._header.num_vars, self._header.var_header_offset)
+        if layout != self.__var_headers_layout:
+            if self.__var_headers_layout is not None:
+                self.__var_headers = None
+                self.__var_headers_dict = None
+                self.__var_headers_names = None
+                self.__var_headers_generation += 1
+            self.__var_headers_layout = layout
+        return self.__var_headers_generation
+
+    @property
+    def _var_buffer_dtype(self):
+        generation = self._var_headers_layout
+        if self.__var_buffer_dtype is None or self.__var_buffer_dtype[0] != generation:
+            self.__var_buffer_dtype = (generation, var_headers_dtype(self._var_headers, self._header.buf_len))
+        return self.__var_buffer_dtype[1]
+
     def freeze_var_buffer_latest(self):
         self.unfreeze_var_buffer_latest()
         self._wait_valid_data_event()
-        self.__var_buffer_latest = sorted(self._header.var_buf, key=lambda v: v.tick_count, reverse=True)[0]
-        self.__var_buffer_latest.freeze()
+        self.__var_buffer_latest = self._freeze_var_buffer_most_recent()
 
     def unfreeze_var_buffer_latest(self):
         if self.__var_buffer_latest:
             self.__var_buffer_latest.unfreeze()
             self.__var_buffer_latest = None
 
+    def get_session_info_future(self, key):
+        # never blocks, future is resolved with parsed section (None if there is no such section),
+        # in async mode it might be resolved later by session info worker
+        data = self._get_session_info(key)
+        future = self.__session_info_dict[key].get('future')
+        if data is not None or not self.parse_yaml_async or future is None:
+            future = Future()
+            future.set_result(data)
+        return future
+
     def get_session_info_update_by_key(self, key):
         if key in self.__session_info_dict:
             return self.__session_info_dict[key]['update']
@@ -570,9 +1010,14 @@ class IRSDK:
             return True
 
     def _get_session_info(self, key):
+        self._header.refresh()
         if self.last_session_info_update < self._header.session_info_update:
             self.last_session_info_update = self._header.session_info_update
-            for session_data in self.__session_info_dict.values():
+            sections = self._session_info_sections()[1]
+            for key_parsed, session_data in self.__session_info_dict.items():
+                # section is the same as last time, keep parsed data as is
+                if key_parsed in sections and session_data.get('data_hash') == sections[key_parsed][2] and session_data['data']:
+                    continue
                 # keep previous parsed data, in case binary data not changed
                 if session_data['data']:
                     session_data['data_last'] = session_data['data']
@@ -590,26 +1035,40 @@ class IRSDK:
         if self.parse_yaml_async:
             if 'async_session_info_update' not in session_data or session_data['async_session_info_update'] < self.last_session_info_update:
                 session_data['async_session_info_update'] = self.last_session_info_update
-                Thread(target=self._parse_yaml, args=(key, session_data)).start()
+                if self.__session_info_worker is None:
+                    self.__session_info_worker = SessionInfoWorker(self)
+                self.__session_info_worker.submit(key, session_data, self.last_session_info_update)
         else:
             self._parse_yaml(key, session_data)
         return session_data['data']
 
+    def _session_info_sections(self):
+        # one scan per session info update: copy of session info and {key: (start, end, hash)} of every top level section
+        session_info_update = self._header.session_info_update
+        if self.__session_info_sections is None or self.__session_info_sections[0] != session_info_update:
+            start = self._header.session_info_offset
+            data = self._shared_mem[start : start + self._header.session_info_len]
+            sections = {}
+            for match_start in SESSION_INFO_SECTION_RE.finditer(data):
+                end = data.find(b'\n\n', match_start.start() + 1)
+                if end < 0:
+                    break
+                section = (match_start.start() + 1, end)
+                sections.setdefault(match_start.group(1).decode(YAML_CODE_PAGE), section + (hash(data[section[0]:end]),))
+            self.__session_info_sections = (session_info_update, sections, data)
+        return self.__session_info_sections
+
     def _get_session_info_binary(self, key):
-        start = self._header.session_info_offset
-        end = start + self._header.session_info_len
-        # search section by key
-        match_start = re.compile(('\n%s:\n' % key).encode(YAML_CODE_PAGE)).search(self._shared_mem, start, end)
-        if not match_start:
-            return None
-        match_end = re.compile(b'\n\n').search(self._shared_mem, match_start.start() + 1, end)
-        if not match_end:
-            return None
-        return self._shared_mem[match_start.start() + 1 : match_end.start()]
+        _, sections, data = self._session_info_sections()
+        if key not in sections:
+            return None, None
+        start, end, data_hash = sections[key]
+        return data[start:end], data_hash
 
-    def _parse_yaml(self, key, session_data):
-        session_info_update = self.last_session_info_update
-        data_binary = self._get_session_info_binary(key)
+    def _parse_yaml(self, key, session_data, session_info_update=None):
+        if session_info_update is None:
+            session_info_update = self.last_session_info_update
+        data_binary, data_hash = self._get_session_info_binary(key)
 
         # section not found
         if not data_binary:
@@ -619,10 +1078,9 @@ class IRSDK:
                 return None
 
         # is binary data the same as last time?
-        if 'data_binary' in session_data and data_binary == session_data['data_binary'] and 'data_last' in session_data:
+        if 'data_hash' in session_data and data_hash == session_data['data_hash'] and 'data_last' in session_data:
             session_data['data'] = session_data['data_last']
             return session_data['data']
-        session_data['data_binary'] = data_binary
 
         # parsing
         yaml_src = re.sub(YamlReader.NON_PRINTABLE, '', data_binary.translate(YAML_TRANSLATER).rstrip(b'\x00').decode(YAML_CODE_PAGE))
@@ -637,6 +1095,7 @@ class IRSDK:
             session_data['data'] = result[key]
             if session_data['data']:
                 session_data['update'] = session_info_update
+                session_data['data_hash'] = data_hash
             elif 'data_last' in session_data:
                 session_data['data'] = session_data['data_last']
 
@@ -672,6 +1131,8 @@ class IBT:
         self.__var_headers = None
         self.__var_headers_dict = None
         self.__var_headers_names = None
+        self.__var_buffer_dtype = None
+        self.__lap_index = None
         self.__session_info_dict = None
 
     def __getitem__(self, key):
@@ -701,7 +1162,7 @@ class IBT:
 
     def close(self):
         if self._shared_mem:
-            self._shared_mem.close()
+            _close_shared_mem(self._shared_mem)
 
         if self._ibt_file:
             self._ibt_file.close()
@@ -714,8 +1175,17 @@ class IBT:
         self.__var_headers = None
         self.__var_headers_dict = None
         self.__var_headers_names = None
+        self.__var_buffer_dtype = None
+        self.__lap_index = None
         self.__session_info_dict = None
 
+    def as_array(self):
+        # zero-copy structured array over all records of the file, one row per record
+        if not self._header:
+            return None
+        return np.frombuffer(self._shared_mem, self._var_buffer_dtype,
+            count=self._disk_header.session_record_count, offset=self._header.var_buf[0].buf_offset)
+
     def get(self, index, key):
         if not self._header:
             return None
@@ -734,6 +1204,9 @@ class IBT:
             return None
         if key in self._var_headers_dict:
             var_header = self._var_headers_dict[key]
+            # numpy strips trailing zero bytes of chars, keep struct path for them
+            if np is not None and VAR_TYPE_MAP[var_header.type] != 'c':
+                return self.as_array()[key].tolist()
             fmt = VAR_TYPE_MAP[var_header.type] * var_header.count
             var_offset = var_header.offset + self._header.var_buf[0].buf_offset
             buf_len = self._header.buf_len
@@ -745,6 +1218,94 @@ class IBT:
             return results
         return None
 
+    def get_columns(self, keys):
+        # zero-copy strided views (one numpy array per var, one row per record), unknown vars are skipped
+        if not self._header:
+            return None
+        records = self.as_array()
+        return {key: records[key] for key in keys if key in self._var_headers_dict}
+
+    def get_dataframe(self, keys):
+        # pandas DataFrame of get_columns(), array vars are split into key_0, key_1, ... columns
+        import pandas as pd
+        columns = self.get_columns(keys)
+        if columns is None:
+            return None
+        data = {}
+        for key, column in columns.items():
+            if column.ndim == 1:
+                data[key] = column
+            else:
+                for i in range(column.shape[1]):
+                    data['%s_%d' % (key, i)] = column[:, i]
+        return pd.DataFrame(data, copy=False)
+
+    def laps(self):
+        # lap index: lap number, start/end (exclusive) record index and interpolated lap time,
+        # persisted next to the ibt file so the file is scanned only once
+        if not self._header:
+            return None
+        if self.__lap_index is None:
+            self.__lap_index = self._load_lap_index()
+        return self.__lap_index
+
+    def lap(self, lap_num):
+        # records of one lap as a zero-copy slice of as_array()
+        for lap in self.laps() or []:
+            if lap['lap'] == lap_num:
+                return self.as_array()[lap['start']:lap['end']]
+        return None
+
+    def _load_lap_index(self):
+        index_file = self._ibt_file.name + IBT_LAP_INDEX_SUFFIX
+        stat = os.stat(self._ibt_file.name)
+        file_info = dict(size=stat.st_size, mtime=stat.st_mtime, record_count=self._disk_header.session_record_count,
+            version=IBT_LAP_INDEX_VERSION)
+        try:
+            with open(index_file, 'r') as f:
+                data = json.load(f)
+            if data.get('file') == file_info:
+                return data['laps']
+        except (OSError, ValueError):
+            pass
+
+        laps = self._build_lap_index()
+        try:
+            with open(index_file, 'w') as f:
+                json.dump(dict(file=file_info, laps=laps), f, indent=4)
+        except OSError:
+            pass
+        return laps
+
+    def _build_lap_index(self):
+        columns = self.get_columns(['Lap', 'LapDistPct', 'SessionTime'])
+        if len(columns) < 3 or self._disk_header.session_record_count == 0:
+            return []
+        lap = columns['Lap']
+        lap_dist_pct = columns['LapDistPct'].astype(np.float64)
+        session_time = columns['SessionTime']
+
+        starts = np.flatnonzero(lap[1:] != lap[:-1]) + 1
+        # session time when start/finish line was crossed between record before and first record of lap
+        crossing_time, wrapped = lap_crossing(session_time[starts - 1], lap_dist_pct[starts - 1],
+            session_time[starts], lap_dist_pct[starts])
+
+        bounds = [0] + starts.tolist() + [len(lap)]
+        # first lap has no start crossing, last one has no end crossing, and a Lap change
+        # without LapDistPct wrapping (reset, tow, pit exit) isn't a crossing either
+        crossing_times = [None] + [time if is_crossing else None
+            for time, is_crossing in zip(crossing_time.tolist(), wrapped.tolist())] + [None]
+        return [
+            dict(
+                lap=int(lap[bounds[i]]),
+                start=bounds[i],
+                end=bounds[i + 1],
+                lap_time=None if crossing_times[i] is None or crossing_times[i + 1] is None
+                    else crossing_times[i + 1] - crossing_times[i],
+            )
+            for i in range(len(bounds) - 1)
+        ]
+
     @property
     def _var_headers(self):
         if not self._header:
@@ -766,6 +1327,128 @@ class IBT:
                 self.__var_headers_dict[var_header.name] = var_header
         return self.__var_headers_dict
 
+    @property
+    def _var_buffer_dtype(self):
+        if self.__var_buffer_dtype is None:
+            self.__var_buffer_dtype = var_headers_dtype(self._var_headers, self._header.buf_len)
+        return self.__var_buffer_dtype
+
+    def get_session_info(self, key):
+        # parsed section of the session info yaml stored in the file, None if missing
+        if not self._header:
+            return None
+        if self.__session_info_dict is None:
+            start = self._header.session_info_offset
+            data_binary = self._shared_mem[start:start + self._header.session_info_len]
+            yaml_src = re.sub(YamlReader.NON_PRINTABLE, '', data_binary.translate(YAML_TRANSLATER).rstrip(b'\x00').decode(YAML_CODE_PAGE))
+            self.__session_info_dict = yaml.load(yaml_src, Loader=CustomYamlSafeLoader) or {}
+        return self.__session_info_dict.get(key)
+
+class IBTWriter:
+    # writes ibt files IBT can read: header, disk sub header, var headers, session info yaml and
+    # one record per write() call, record count and session times are patched in on close()
+    def __init__(self):
+        self._ibt_file = None
+        self._var_defs = None
+        self._arrays = None
+        self._record_struct = None
+        self._header_values = None
+        self._session_start_date = None
+        self._record_count = 0
+        self._lap_count = 0
+        self._session_start_time = None
+        self._session_end_time = None
+
+    def open(self, ibt_file, var_defs, session_info='', tick_rate=60):
+        # var_defs: (name, type, count) tuples, type is index into VAR_TYPE_MAP
+        self._var_defs = list(var_defs)
+        self._arrays = [count > 1 for _, _, count in self._var_defs]
+        self._record_struct = struct.Struct('=' + ''.join(VAR_TYPE_MAP[var_type] * count for _, var_type, count in self._var_defs))
+
+        var_header_offset = 144
+        session_info_binary = session_info.encode(YAML_CODE_PAGE) + b'\x00'
+        session_info_offset = var_header_offset + 144 * len(self._var_defs)
+        buf_offset = session_info_offset + len(session_info_binary)
+
+        data = bytearray(buf_offset)
+        offset = 0
+        for i, (name, var_type, count) in enumerate(self._var_defs):
+            VarHeader.pack_into(data, var_header_offset + i * 144, type=var_type, offset=offset, count=count, name=name)
+            offset += struct.calcsize('=' + VAR_TYPE_MAP[var_type]) * count
+        data[session_info_offset:buf_offset] = session_info_binary
+
+        self._header_values = dict(
+            version=2,
+            status=StatusField.status_connected,
+            tick_rate=tick_rate,
+            session_info_update=1,
+            session_info_len=len(session_info_binary),
+            session_info_offset=session_info_offset,
+            num_vars=len(self._var_defs),
+            var_header_offset=var_header_offset,
+            num_buf=1,
+            buf_len=self._record_struct.size,
+        )
+        self._session_start_date = int(time.time())
+        self._record_count = 0
+        self._lap_count = 0
+        self._session_start_time = None
+        self._session_end_time = None
+
+        self._ibt_file = open(ibt_file, 'wb')
+        self._write_headers(data, buf_offset)
+        self._ibt_file.write(data)
+
+    def write(self, values):
+        # append one record, values is a dict by var name, missing vars (or None) are written as zero
+        args = []
+        for (name, _, count), is_array in zip(self._var_defs, self._arrays):
+            value = values.get(name)
+            if is_array:
+                args.extend(value if value is not None else [0] * count)
+            else:
+                args.append(value if value is not None else 0)
+        self._ibt_file.write(self._record_struct.pack(*args))
+        self._record_count += 1
+
+        session_time = values.get('SessionTime')
+        if session_time is not None:
+            if self._session_start_time is None:
+                self._session_start_time = session_time
+            self._session_end_time = session_time
+        lap = values.get('Lap')
+        if lap is not None and lap > self._lap_count:
+            self._lap_count = lap
+
+    def close(self):
+        if not self._ibt_file:
+            return
+        data = bytearray(144)
+        self._write_headers(data, self._header_values['session_info_offset'] + self._header_values['session_info_len'])
+        self._ibt_file.seek(0)
+        self._ibt_file.write(data)
+        self._ibt_file.close()
+        self._ibt_file = None
+
+    def _write_headers(self, data, buf_offset):
+        Header.pack_into(data, 0, **self._header_values)
+        VarBuffer.pack_into(data, 48, tick_count=self._record_count, _buf_offset=buf_offset)
+        DiskSubHeader.pack_into(data, 112,
+            session_start_date=self._session_start_date,
+            session_start_time=self._session_start_time or 0.0,
+            session_end_time=self._session_end_time or 0.0,
+            session_lap_count=self._lap_count,
+            session_record_count=self._record_count,
+        )
+
+def _close_shared_mem(shared_mem):
+    try:
+        shared_mem.close()
+    except BufferError:
+        # numpy arrays from as_array() still point into it,
+        # mmap will be closed when last of them is released
+        pass
+
 # https://stackoverflow.com/a/37958106/1034242
 class CustomYamlSafeLoader(YamlSafeLoader):
     @classmethod
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Productor sintético de memoria compartida irsdk.
+
+Escribe en un archivo la misma disposición de memoria que publica iRacing (Header, tabla de
+VarHeader, VarBuffers rotatorios con tick_count creciente y bloque YAML de session info), para
+poder probar y medir toda la cadena captura -> LapManager -> GUI en Linux sin el simulador.
+
+Uso:
+    python irsdk_producer.py sim.bin --replay lap_1.json lap_2.json --rate 360 --loop
+    python irsdk_producer.py sim.bin --generate 5 --rate 60
+
+y en otro proceso:
+    ir = irsdk.IRSDK()
+    ir.startup(test_file="sim.bin")
+
+Con --status-port también sirve un sustituto del estado HTTP del simulador
+(http://127.0.0.1:PUERTO/get_sim_status?object=simStatus, "running:1" mientras publica),
+para probar irsdk.ConnectionManager contra él.
+"""
+import argparse
+import json
+import math
+import mmap
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import irsdk
+from lap_store import channel_dtype
+from telemetry_vars import TELEMETRY_VARS
+
+MAX_RATE = 360
+
+NUM_BUF = 3
+VAR_HEADER_OFFSET = 144
+VAR_HEADER_SIZE = 144
+SESSION_INFO_SIZE = 128 * 1024
+
+# Tipos de variable irsdk (índices de irsdk.VAR_TYPE_MAP)
+VAR_BOOL = irsdk.VAR_TYPE_MAP.index('?')
+VAR_INT = irsdk.VAR_TYPE_MAP.index('i')
+VAR_FLOAT = irsdk.VAR_TYPE_MAP.index('f')
+VAR_DOUBLE = irsdk.VAR_TYPE_MAP.index('d')
+
+
+DEFAULT_SESSION_INFO = """---
+WeekendInfo:
+ TrackName: {track_name}
+ TrackDisplayName: {track_name}
+
+DriverInfo:
+ DriverCarIdx: 0
+
+"""
+
+# Variables de las trazas generadas: (nombre, tipo, count)
+GENERATED_VARS = [
+    ("SessionTime", VAR_DOUBLE, 1),
+    ("SessionNum", VAR_INT, 1),
+    ("Lap", VAR_INT, 1),
+    ("LapDistPct", VAR_FLOAT, 1),
+    ("Speed", VAR_FLOAT, 1),
+    ("Gear", VAR_INT, 1),
+    ("Throttle", VAR_FLOAT, 1),
+    ("Brake", VAR_FLOAT, 1),
+    ("LatAccel", VAR_FLOAT, 1),
+    ("LongAccel", VAR_FLOAT, 1),
+    ("SteeringWheelAngle", VAR_FLOAT, 1),
+    ("IsOnTrack", VAR_BOOL, 1),
+]
+
+
+class SharedMemoryProducer:
+    """
+    Archivo con la disposición de memoria de irsdk, actualizado tick a tick.
+    var_defs: lista de (nombre, tipo irsdk, count).
+    """
+    def __init__(self, path, var_defs, session_info=None, tick_rate=60, num_buf=NUM_BUF):
+        self.var_defs = list(var_defs)
+        self.tick_rate = tick_rate
+        self.num_buf = num_buf
+        self.tick_count = 0
+        self.session_info_update = 0
+
+        # Variables una detrás de otra dentro del buffer
+        offsets = []
+        buf_len = 0
+        for name, var_type, count in self.var_defs:
+            offsets.append(buf_len)
+            buf_len += struct.calcsize("=" + irsdk.VAR_TYPE_MAP[var_type]) * count
+        self.buf_len = buf_len
+        self._struct = struct.Struct("=" + "".join(irsdk.VAR_TYPE_MAP[var_type] * count for _, var_type, count in self.var_defs))
+        self._arrays = [count > 1 for _, _, count in self.var_defs]
+
+        self.session_info_offset = VAR_HEADER_OFFSET + VAR_HEADER_SIZE * len(self.var_defs)
+        first_buf_offset = self.session_info_offset + SESSION_INFO_SIZE
+        self._buf_offsets = [first_buf_offset + i * buf_len for i in range(num_buf)]
+        size = first_buf_offset + buf_len * num_buf
+
+        self._file = open(path, "w+b")
+        self._file.truncate(size)
+        self._mem = mmap.mmap(self._file.fileno(), size)
+
+        irsdk.Header.pack_into(
+            self._mem, 0,
+            version=2,
+            status=irsdk.StatusField.status_connected,
+            tick_rate=tick_rate,
+            session_info_len=SESSION_INFO_SIZE,
+            session_info_offset=self.session_info_offset,
+            num_vars=len(self.var_defs),
+            var_header_offset=VAR_HEADER_OFFSET,
+            num_buf=num_buf,
+            buf_len=buf_len,
+        )
+        for i, buf_offset in enumerate(self._buf_offsets):
+            irsdk.VarBuffer.pack_into(self._mem, 48 + i * 16, tick_count=0, _buf_offset=buf_offset)
+        for i, ((name, var_type, count), offset) in enumerate(zip(self.var_defs, offsets)):
+            irsdk.VarHeader.pack_into(
+                self._mem, VAR_HEADER_OFFSET + i * VAR_HEADER_SIZE,
+                type=var_type, offset=offset, count=count, name=name,
+            )
+
+        self.set_session_info(session_info or DEFAULT_SESSION_INFO.format(track_name="synthetic"))
+
+    def set_session_info(self, yaml_src):
+        """Publica un nuevo YAML de session info (incrementa session_info_update)."""
+        data = yaml_src.encode(irsdk.YAML_CODE_PAGE)[:SESSION_INFO_SIZE]
+        self._mem[self.session_info_offset:self.session_info_offset + SESSION_INFO_SIZE] = data.ljust(SESSION_INFO_SIZE, b"\x00")
+        self.session_info_update += 1
+        struct.pack_into("=i", self._mem, 12, self.session_info_update)
+
+    def write_tick(self, values):
+        """
+        Escribe un tick (dict nombre -> valor, lo que falte queda a 0) en el siguiente buffer,
+        y solo después publica su tick_count, igual que el simulador.
+        """
+        args = []
+        for (name, _, count), is_array in zip(self.var_defs, self._arrays):
+            value = values.get(name)
+            if is_array:
+                args.extend(value if value is not None else [0] * count)
+            else:
+                args.append(value if value is not None else 0)
+        self.tick_count += 1
+        buf = self.tick_count % self.num_buf
+        self._struct.pack_into(self._mem, self._buf_offsets[buf], *args)
+        struct.pack_into("=i", self._mem, 48 + buf * 16, self.tick_count)
+
+    def close(self):
+        if self._mem:
+            struct.pack_into("=i", self._mem, 4, 0)  # status: desconectado
+            self._mem.close()
+            self._file.close()
+            self._mem = None
+
+
+# ---------------------------------------------
+# Fuentes de ticks
+# ---------------------------------------------
+def load_capture_samples(files):
+    """
+    Lee nuestras capturas (lap_*.json / best_lap.json) y devuelve (var_defs, samples)
+    con los nombres y unidades de iRacing.
+    """
+    lap_data = []
+    for filename in files:
+        with open(filename, "r") as f:
+            lap_data.extend(json.load(f).get("lap_data", []))
+    return capture_samples(lap_data)
+
+
+def channel_var_type(key):
+    """Tipo irsdk de uno de nuestros canales (clave de TELEMETRY_VARS)."""
+    dtype = channel_dtype(key)
+    if dtype.kind == "i":
+        return VAR_INT
+    return VAR_DOUBLE if dtype.itemsize == 8 else VAR_FLOAT
+
+
+def capture_samples(lap_data):
+    """(var_defs, samples) de una lista lap_data ya cargada, ver load_capture_samples."""
+    if not lap_data:
+        return [], []
+
+    # Solo las variables que tiene el coche capturado (las null no existen en él), con el tipo
+    # del canal (el de iRacing, ver lap_store.channel_dtype): un float que en el JSON vale 2.0
+    # sale como 2 y no se puede deducir del valor
+    var_defs = [("SessionNum", VAR_INT, 1)]
+    for key, var in TELEMETRY_VARS.items():
+        if lap_data[0].get(key) is None:
+            continue
+        var_defs.append((var, channel_var_type(key), 1))
+
+    samples = []
+    for point in lap_data:
+        sample = {var: point.get(key) for key, var in TELEMETRY_VARS.items()}
+        if sample["Speed"] is not None:
+            sample["Speed"] /= 3.6  # km/h -> m/s
+        sample["SessionNum"] = 0
+        samples.append(sample)
+    return var_defs, samples
+
+
+def generate_samples(laps=1, lap_time=60.0, rate=60):
+    """Trazas sintéticas: velocidad, pedales y aceleraciones suaves a lo largo de la vuelta."""
+    ticks_per_lap = int(lap_time * rate)
+    for i in range(laps * ticks_per_lap):
+        lap, tick = divmod(i, ticks_per_lap)
+        pct = tick / ticks_per_lap
+        phase = 2 * math.pi * pct * 6  # 6 curvas por vuelta
+        brake = max(0.0, -math.sin(phase)) ** 2
+        speed = 45 + 20 * math.cos(phase)
+        yield {
+            "SessionTime": i / rate,
+            "SessionNum": 0,
+            "Lap": lap + 1,
+            "LapDistPct": pct,
+            "Speed": speed,
+            "Gear": min(6, 1 + int(speed / 12)),
+            "Throttle": 1.0 - brake if brake < 0.05 else 0.0,
+            "Brake": brake,
+            "LatAccel": 9.81 * math.sin(phase + math.pi / 2) * 1.5,
+            "LongAccel": -9.81 * brake + (1 - brake) * 2.0,
+            "SteeringWheelAngle": 0.3 * math.sin(phase + math.pi / 2),
+            "IsOnTrack": True,
+        }
+
+
+class SimStatusServer:
+    """
+    Sustituto local del endpoint de estado de iRacing (irsdk.SIM_STATUS_URL) en un hilo aparte.
+    running: lo que contesta ("running:1" / "running:0"); delay: segundos que tarda en responder;
+    requests: peticiones recibidas.
+    """
+    def __init__(self, port=0, running=True, delay=0.0):
+        self.running = running
+        self.delay = delay
+        self.requests = 0
+        status = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status.requests += 1
+                time.sleep(status.delay)
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(b"running:%d" % bool(status.running))
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="SimStatusServer", daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/get_sim_status?object=simStatus"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def replay(producer, samples, rate=60, loop=False):
+    """
+    Publica un sample por tick a `rate` Hz (como máximo MAX_RATE).
+    Con loop=True repite las muestras sin fin, desplazando SessionTime y Lap en cada vuelta
+    para que sigan creciendo. Devuelve el número de ticks escritos.
+    """
+    period = 1.0 / min(rate, MAX_RATE)
+    samples = list(samples)
+    if not samples:
+        return 0
+
+    session_time_span = (samples[-1].get("SessionTime") or 0.0) - (samples[0].get("SessionTime") or 0.0) + period
+    lap_span = (samples[-1].get("Lap") or 0) - (samples[0].get("Lap") or 0) + 1
+
+    ticks = 0
+    cycle = 0
+    next_tick = time.perf_counter()
+    while True:
+        for sample in samples:
+            if cycle:
+                sample = dict(sample)
+                if sample.get("SessionTime") is not None:
+                    sample["SessionTime"] += cycle * session_time_span
+                if sample.get("Lap") is not None:
+                    sample["Lap"] += cycle * lap_span
+            producer.write_tick(sample)
+            ticks += 1
+            next_tick += period
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if not loop:
+            return ticks
+        cycle += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Productor sintético de memoria compartida irsdk")
+    parser.add_argument("output", help="archivo a usar como irsdk mmap (IRSDK.startup(test_file=...))")
+    parser.add_argument("--replay", nargs="+", metavar="LAP_JSON", help="capturas lap_*.json a reproducir")
+    parser.add_argument("--generate", type=int, metavar="LAPS", help="generar LAPS vueltas sintéticas")
+    parser.add_argument("--lap-time", type=float, default=60.0, help="duración de las vueltas generadas (s)")
+    parser.add_argument("--rate", type=int, default=60, help=f"ticks por segundo (máx. {MAX_RATE})")
+    parser.add_argument("--loop", action="store_true", help="repetir sin fin")
+    parser.add_argument("--track", default="synthetic", help="TrackName del session info")
+    parser.add_argument("--status-port", type=int, metavar="PORT",
+                        help="servir también el estado HTTP del simulador en este puerto")
+    args = parser.parse_args()
+
+    rate = min(args.rate, MAX_RATE)
+    if args.replay:
+        var_defs, samples = load_capture_samples(args.replay)
+    else:
+        var_defs, samples = GENERATED_VARS, generate_samples(args.generate or 1, args.lap_time, rate)
+
+    producer = SharedMemoryProducer(
+        args.output, var_defs,
+        session_info=DEFAULT_SESSION_INFO.format(track_name=args.track),
+        tick_rate=rate,
+    )
+    status = SimStatusServer(args.status_port).start() if args.status_port is not None else None
+    if status:
+        print(f"Estado del simulador en {status.url}")
+    print(f"Publicando en {args.output} a {rate} Hz...")
+    try:
+        ticks = replay(producer, samples, rate=rate, loop=args.loop)
+        print(f"{ticks} ticks publicados.")
+    except KeyboardInterrupt:
+        print(f"\nDetenido en el tick {producer.tick_count}.")
+    finally:
+        producer.close()
+        if status:
+            status.stop()
+
+
+if __name__ == "__main__":
+    main()
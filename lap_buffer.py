@@ -0,0 +1,106 @@
+"""
+LapBuffer: muestras de una vuelta guardadas por columnas (un array numpy por canal)
+en lugar de una lista de dicts de 35 claves por tick.
+
+- append() / append_dict() / extend() añaden muestras; la memoria crece duplicándose.
+- column(key) / buffer[key] devuelven una vista sin copia del canal (válida hasta el
+  siguiente append que tenga que crecer).
+- to_dicts() convierte a la lista de dicts de siempre solo cuando lo necesita código antiguo
+  (JSON, comparaciones por punto...).
+"""
+import numpy as np
+
+from telemetry_vars import TELEMETRY_KEYS, INT_KEYS
+
+# Algo más de una vuelta de 2 minutos a 60 Hz
+DEFAULT_CAPACITY = 8192
+
+
+def rows_as_dicts(keys, columns):
+    """Recorre columns[canal, muestra] como dicts {clave: valor}, NaN -> None, enteros como int."""
+    int_columns = [key in INT_KEYS for key in keys]
+    for sample in np.asarray(columns).T.tolist():
+        yield {
+            key: None if value != value else int(value) if is_int else value
+            for key, value, is_int in zip(keys, sample, int_columns)
+        }
+
+
+class LapBuffer:
+    def __init__(self, keys=TELEMETRY_KEYS, capacity=DEFAULT_CAPACITY):
+        self.keys = tuple(keys)
+        self._channels = {key: i for i, key in enumerate(self.keys)}
+        self._data = np.full((len(self.keys), capacity), np.nan)
+        self.size = 0
+
+    @classmethod
+    def from_dicts(cls, lap_data, keys=TELEMETRY_KEYS):
+        """LapBuffer a partir de una lista de dicts (p. ej. el lap_data de un JSON)."""
+        buffer = cls(keys, capacity=max(len(lap_data), 1))
+        for data in lap_data:
+            buffer.append_dict(data)
+        return buffer
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        return self.column(key)
+
+    def __contains__(self, key):
+        return key in self._channels
+
+    def append(self, values):
+        """Añade una muestra con los valores en el orden de keys (None -> NaN)."""
+        if self.size == self._data.shape[1]:
+            self._grow(self.size + 1)
+        self._data[:, self.size] = values
+        self.size += 1
+
+    def append_dict(self, data):
+        """Añade una muestra dada como dict (las claves que falten quedan NaN)."""
+        self.append([data.get(key) for key in self.keys])
+
+    def extend(self, columns):
+        """Añade un bloque columns[canal, muestra] (p. ej. de TelemetryRingBuffer.read_since)."""
+        n = columns.shape[1]
+        if self.size + n > self._data.shape[1]:
+            self._grow(self.size + n)
+        self._data[:, self.size:self.size + n] = columns
+        self.size += n
+
+    def clear(self):
+        """Vacía el buffer conservando la memoria reservada."""
+        self.size = 0
+
+    def column(self, key):
+        """Vista (sin copia) del canal key."""
+        return self._data[self._channels[key], :self.size]
+
+    def columns(self):
+        """Vista (sin copia) de todos los canales: array [canal, muestra]."""
+        return self._data[:, :self.size]
+
+    def copy(self):
+        """Copia independiente, con la memoria justa (p. ej. para guardar la vuelta de referencia)."""
+        buffer = LapBuffer(self.keys, capacity=max(self.size, 1))
+        buffer.extend(self.columns())
+        return buffer
+
+    def row(self, index):
+        """Muestra index como dict (admite índices negativos)."""
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        return next(rows_as_dicts(self.keys, self._data[:, index:index + 1]))
+
+    def to_dicts(self):
+        """La vuelta como lista de dicts, el formato de los lap_*.json."""
+        return list(rows_as_dicts(self.keys, self.columns()))
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * self._data.shape[1])
+        data = np.full((len(self.keys), capacity), np.nan)
+        data[:, :self.size] = self._data[:, :self.size]
+        self._data = data
@@ -0,0 +1,234 @@
+"""
+Agregados por vuelta calculados durante la captura.
+
+LapAggregator va actualizando en cada tick (O(1), método de Welford) media, varianza, mínimo
+y máximo de cada canal, para la vuelta entera y para cada sector. Al terminar la vuelta, row()
+devuelve la fila de features con los mismos nombres de columna que generaban
+prepare_train_model.py ({canal}_{func}) y divide_data.py ({sector}_{canal}_{func},
+fuel_level_init), más lap_time_est y filename. Las filas se añaden a FEATURES_FILE (JSON Lines)
+y los scripts de entrenamiento las leen directamente, sin volver a abrir cada lap_*.json.
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+from sector_tracker import SECTORS
+from telemetry_vars import TELEMETRY_KEYS
+
+# Qué variables agregar por vuelta y cómo (media, máx, mín, var, std)
+AGGREGATION_FUNCTIONS = {
+    # Variables típicas de conducción
+    "speed": ["mean", "max"],
+    "throttle": ["mean"],
+    "brake": ["mean"],
+    "lat_accel": ["mean", "max"],
+    "long_accel": ["mean", "min"],
+    # Si tienes SteeringWheelAngle, lo agregas
+    "steering_angle": ["mean"],
+
+    # Variables de setup (si existen)
+    "dcBrakeBias": ["mean"],
+    "dcWingFront": ["mean"],
+    "dcWingRear": ["mean"],
+
+    # Variables ambientales (si existen por tick)
+    "track_temp": ["mean"],
+    "air_temp": ["mean"],
+
+    # Ejemplo: temperatura delantera izq (si en un tick venía como LFtempCL)
+    "LFtempCL": ["mean"],
+    # etc. para otras
+}
+
+# Qué variables agregar en cada sector (columnas {sector}_{canal}_{func})
+SECTOR_AGGREGATIONS = {
+    "speed": ["min", "max"],
+    "brake": ["max"],
+}
+
+# Canal con el que se calcula fuel_level_init (primer tick de la vuelta)
+FUEL_KEY = "fuel_level"
+
+FEATURES_FILE = "lap_features.jsonl"
+
+
+class RunningStats:
+    """Media, varianza (Welford), mínimo y máximo de varios canales a la vez; NaN se ignora."""
+    def __init__(self, size):
+        self.size = size
+        self.reset()
+
+    def reset(self, part=slice(None)):
+        if part == slice(None):
+            self.count = np.zeros(self.size)
+            self.mean = np.zeros(self.size)
+            self._m2 = np.zeros(self.size)
+            self.min = np.full(self.size, np.inf)
+            self.max = np.full(self.size, -np.inf)
+        else:
+            self.count[part] = self.mean[part] = self._m2[part] = 0.0
+            self.min[part] = np.inf
+            self.max[part] = -np.inf
+
+    def update(self, values):
+        valid = values == values
+        self.count += valid
+        delta = np.where(valid, values - self.mean, 0.0)
+        self.mean += delta / np.maximum(self.count, 1)
+        self._m2 += delta * np.where(valid, values - self.mean, 0.0)
+        np.fmin(self.min, values, out=self.min)
+        np.fmax(self.max, values, out=self.max)
+
+    def save(self, part):
+        """Copia del estado de los canales part (para guardarlo y seguir con otros)."""
+        return tuple(array[part].copy() for array in (self.count, self.mean, self._m2, self.min, self.max))
+
+    def load(self, part, state):
+        """Restaura en part un estado de save() (None: empieza de cero)."""
+        if state is None:
+            self.reset(part)
+            return
+        for array, saved in zip((self.count, self.mean, self._m2, self.min, self.max), state):
+            array[part] = saved
+
+    def result(self, func):
+        """Array con func (mean, min, max, var, std) por canal; NaN en canales sin muestras."""
+        empty = self.count == 0
+        if func == "mean":
+            values = self.mean
+        elif func == "min":
+            values = self.min
+        elif func == "max":
+            values = self.max
+        elif func in ("var", "std"):
+            # Varianza muestral, como pandas (ddof=1)
+            values = self._m2 / np.maximum(self.count - 1, 1)
+            empty = self.count < 2
+            if func == "std":
+                values = np.sqrt(values)
+        else:
+            return np.full(self.size, np.nan)
+        return np.where(empty, np.nan, values)
+
+
+class LapAggregator:
+    def __init__(self, keys=TELEMETRY_KEYS, aggregations=AGGREGATION_FUNCTIONS,
+                 sectors=SECTORS, sector_aggregations=SECTOR_AGGREGATIONS):
+        """keys: orden de los valores que se pasan a update() (el de la captura)."""
+        self.keys = tuple(keys)
+        self.aggregations = aggregations
+        self.sectors = sectors
+        self.sector_aggregations = sector_aggregations
+        self._bounds = list(sectors.values())
+
+        # Un solo RunningStats por tick: [canales de la vuelta | canales del sector actual].
+        # Al cambiar de sector se guarda la parte del sector y se carga la del nuevo.
+        lap_size = len(aggregations)
+        self._sector_part = slice(lap_size, lap_size + len(sector_aggregations))
+        self._stats = RunningStats(lap_size + len(sector_aggregations))
+        self._sector_states = [None] * len(sectors)
+        self._sector = None
+
+        # Canales que no se capturan (y los del sector fuera de todo sector) leen una columna NaN
+        nan_index = len(self.keys)
+        lap_index = [self.keys.index(key) if key in self.keys else nan_index for key in aggregations]
+        sector_index = [self.keys.index(key) if key in self.keys else nan_index for key in sector_aggregations]
+        self._index = np.array(lap_index + sector_index)
+        self._index_no_sector = np.array(lap_index + [nan_index] * len(sector_index))
+        self._values = np.full(len(self.keys) + 1, np.nan)
+        self._pct_index = self.keys.index("LapDistPct")
+        self._fuel_index = self.keys.index(FUEL_KEY) if FUEL_KEY in self.keys else None
+
+        self.samples = 0
+        self.fuel_level_init = None
+
+    def reset(self):
+        """Empieza una vuelta nueva."""
+        self._stats.reset()
+        self._sector_states = [None] * len(self.sectors)
+        self._sector = None
+        self.samples = 0
+        self.fuel_level_init = None
+
+    def update(self, values):
+        """Añade una muestra (valores en el orden de keys, None -> NaN)."""
+        self._values[:-1] = values
+        pct = self._values[self._pct_index]
+
+        sector = self._sector
+        if sector is None or not self._bounds[sector][0] <= pct < self._bounds[sector][1]:
+            sector = next((i for i, (start, end) in enumerate(self._bounds) if start <= pct < end), None)
+            self._switch_sector(sector)
+        self._stats.update(self._values[self._index if sector is not None else self._index_no_sector])
+
+        if self.samples == 0 and self._fuel_index is not None:
+            self.fuel_level_init = _json_value(self._values[self._fuel_index])
+        self.samples += 1
+
+    def _switch_sector(self, sector):
+        if self._sector is not None:
+            self._sector_states[self._sector] = self._stats.save(self._sector_part)
+        if sector is not None:
+            self._stats.load(self._sector_part, self._sector_states[sector])
+        self._sector = sector
+
+    def row(self, lap_time_est, filename):
+        """Fila de features de la vuelta actual (dict listo para JSON, NaN -> None)."""
+        row = {}
+        results = {}
+        for i, (key, funcs) in enumerate(self.aggregations.items()):
+            for func in funcs:
+                if func not in results:
+                    results[func] = self._stats.result(func)
+                row[f"{key}_{func}"] = _json_value(results[func][i])
+
+        # Estado de cada sector (el actual está en _stats)
+        if self._sector is not None:
+            self._sector_states[self._sector] = self._stats.save(self._sector_part)
+        sector_stats = RunningStats(len(self.sector_aggregations))
+        for sector_name, state in zip(self.sectors, self._sector_states):
+            sector_stats.load(slice(None), state)
+            for i, (key, funcs) in enumerate(self.sector_aggregations.items()):
+                for func in funcs:
+                    row[f"{sector_name}_{key}_{func}"] = _json_value(sector_stats.result(func)[i])
+
+        row["fuel_level_init"] = self.fuel_level_init
+        row["lap_time_est"] = lap_time_est
+        row["filename"] = filename
+        return row
+
+    def lap_columns(self):
+        """Columnas de prepare_train_model.py."""
+        return [f"{key}_{func}" for key, funcs in self.aggregations.items() for func in funcs]
+
+    def sector_columns(self):
+        """Columnas de divide_data.py."""
+        return [f"{sector_name}_{key}_{func}" for sector_name in self.sectors
+                for key, funcs in self.sector_aggregations.items() for func in funcs] + ["fuel_level_init"]
+
+
+def _json_value(value):
+    value = float(value)
+    return None if math.isnan(value) or math.isinf(value) else value
+
+
+def append_lap_features(row, path=FEATURES_FILE):
+    """Añade la fila de una vuelta al final de path (una línea JSON por vuelta)."""
+    with open(path, "a") as f:
+        f.write(json.dumps(row) + "\n")
+
+
+def read_lap_features(path=FEATURES_FILE):
+    """Filas guardadas en path (lista vacía si no existe); una última línea a medias se descarta."""
+    if not os.path.exists(path):
+        return []
+    rows = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                break
+    return rows
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Vueltas en formato IBT (el binario de telemetría de iRacing) en lugar de JSON.
+
+- write_lap_ibt / read_lap_ibt: guardan y leen una vuelta con la misma forma que nuestros JSON
+  ({"lap_time_est" / "lap_time", "lap_data": [...]}), así el resto de scripts no cambia.
+- main(): conversor masivo del archivo histórico lap_*.json / best_lap.json a .ibt.
+
+Los .ibt generados se abren con irsdk.IBT como cualquier archivo del simulador
+(get_columns, get_dataframe, laps()...). Los tiempos de vuelta van en el session info,
+sección LapInfo.
+
+Uso:
+    python lap_ibt.py                      # convierte lap_*.json y best_lap.json del directorio
+    python lap_ibt.py lap_1.json lap_2.json --remove-json
+"""
+import argparse
+import glob
+import json
+import os
+
+import irsdk
+from irsdk_producer import capture_samples
+from telemetry_vars import TELEMETRY_VARS
+
+# Campos de metadatos de nuestros JSON -> clave en la sección LapInfo del session info
+LAP_INFO_KEYS = {
+    "lap_time_est": "LapTimeEst",
+    "lap_time": "LapTime",
+}
+
+LAP_SESSION_INFO = """---
+LapInfo:
+{lap_info}
+
+"""
+
+
+def write_lap_ibt(ibt_file, lap_json):
+    """Escribe una vuelta (dict con "lap_data" y metadatos, como nuestros JSON) en un .ibt."""
+    var_defs, samples = capture_samples(lap_json.get("lap_data", []))
+
+    lap_info = [f" {LAP_INFO_KEYS[key]}: {float(value)!r}" for key, value in lap_json.items()
+                if key in LAP_INFO_KEYS and value is not None]
+    session_info = LAP_SESSION_INFO.format(lap_info="\n".join(lap_info) or " {}")
+
+    writer = irsdk.IBTWriter()
+    writer.open(ibt_file, var_defs, session_info=session_info)
+    try:
+        for sample in samples:
+            writer.write(sample)
+    finally:
+        writer.close()
+
+
+def read_lap_ibt(ibt_file):
+    """Lee un .ibt y devuelve el mismo dict que nuestros JSON de vuelta."""
+    ibt = irsdk.IBT()
+    ibt.open(ibt_file)
+    try:
+        columns = ibt.get_columns(TELEMETRY_VARS.values())
+        # Columnas como listas (los JSON tienen null en las variables que el coche no tiene)
+        data = {key: columns[var].tolist() if var in columns else None
+                for key, var in TELEMETRY_VARS.items()}
+        record_count = ibt._disk_header.session_record_count
+        lap_info = ibt.get_session_info("LapInfo") or {}
+    finally:
+        ibt.close()
+
+    if data["speed"] is not None:
+        data["speed"] = [speed * 3.6 for speed in data["speed"]]  # m/s -> km/h
+    lap_data = [
+        {key: column[i] if column is not None else None for key, column in data.items()}
+        for i in range(record_count)
+    ]
+
+    lap_json = {key: lap_info[info_key] for key, info_key in LAP_INFO_KEYS.items() if info_key in lap_info}
+    lap_json["lap_data"] = lap_data
+    return lap_json
+
+
+def convert_file(json_file, remove_json=False):
+    """Convierte un JSON de vuelta a .ibt al lado. Devuelve (ruta ibt, bytes json, bytes ibt)."""
+    ibt_file = os.path.splitext(json_file)[0] + ".ibt"
+    with open(json_file, "r") as f:
+        lap_json = json.load(f)
+    write_lap_ibt(ibt_file, lap_json)
+
+    json_size = os.path.getsize(json_file)
+    ibt_size = os.path.getsize(ibt_file)
+    if remove_json:
+        os.remove(json_file)
+    return ibt_file, json_size, ibt_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convierte vueltas JSON (lap_*.json, best_lap.json) a IBT")
+    parser.add_argument("files", nargs="*", help="JSON a convertir (por defecto lap_*.json y best_lap.json)")
+    parser.add_argument("--remove-json", action="store_true", help="borrar el JSON tras convertirlo")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob("lap_*.json")) + glob.glob("best_lap.json")
+    total_json = total_ibt = 0
+    for json_file in files:
+        try:
+            ibt_file, json_size, ibt_size = convert_file(json_file, args.remove_json)
+        except (OSError, ValueError) as e:
+            print(f"Error convirtiendo {json_file}: {e}")
+            continue
+        total_json += json_size
+        total_ibt += ibt_size
+        print(f"{json_file} -> {ibt_file} ({json_size / 1024:.0f} KB -> {ibt_size / 1024:.0f} KB)")
+
+    if total_ibt:
+        print(f"Total: {total_json / 1024:.0f} KB -> {total_ibt / 1024:.0f} KB ({total_json / total_ibt:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
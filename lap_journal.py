@@ -0,0 +1,70 @@
+"""
+Diario (journal) de la vuelta en curso: JSON Lines, solo se añade al final.
+
+Cada muestra es una línea JSON; escribirla cuesta lo mismo sea cual sea la longitud de la
+vuelta (antes se reescribía la vuelta entera en cada tick). Se hace fsync periódicamente,
+así que tras un cuelgue se pierde como mucho fsync_interval segundos de muestras.
+Al arrancar, recover() devuelve las muestras de la vuelta que estaba en curso
+(una última línea a medio escribir se descarta).
+"""
+import json
+import os
+import time
+
+DEFAULT_FSYNC_INTERVAL = 1.0
+
+
+class LapJournal:
+    def __init__(self, path, fsync_interval=DEFAULT_FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._last_sync = 0.0
+
+    def recover(self):
+        """Muestras de la vuelta en curso que quedaron en el diario (lista vacía si no hay)."""
+        if not os.path.exists(self.path):
+            return []
+        samples = []
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    samples.append(json.loads(line))
+                except ValueError:
+                    # Línea a medio escribir cuando se cortó el programa
+                    break
+        return samples
+
+    def open(self, samples=()):
+        """
+        Abre el diario para añadir. Se reescribe con samples (p. ej. lo recuperado con
+        recover()) para descartar una posible última línea incompleta.
+        """
+        self._file = open(self.path, "w")
+        for sample in samples:
+            self._file.write(json.dumps(sample) + "\n")
+        self.sync()
+
+    def append(self, sample):
+        """Añade una muestra (coste constante) y hace fsync si toca."""
+        self._file.write(json.dumps(sample) + "\n")
+        if time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def reset(self):
+        """Empieza una vuelta nueva: vacía el diario."""
+        self._file.seek(0)
+        self._file.truncate()
+        self.sync()
+
+    def sync(self):
+        """Lleva a disco todo lo escrito."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
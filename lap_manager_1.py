@@ -1,11 +1,25 @@
+import argparse
 import tkinter as tk
 from tkinter import ttk
 import irsdk
-import time
-import threading
-import json
 import os
+import threading
+import time
 
+from telemetry_vars import TELEMETRY_VARS, TELEMETRY_KEYS
+from telemetry_recorder import TelemetryRingBuffer, TelemetryRecorder
+from telemetry_metrics import CaptureMetrics
+from lap_store import LapStoreWriter, session_store_path
+from persistence import PersistenceWriter, json_serializer
+from lap_buffer import LapBuffer
+from reference_lap import ReferenceLap, ReferenceSet, INTERP_KEYS
+from sector_tracker import SectorTracker, SECTORS
+from lap_features import LapAggregator, append_lap_features
+from corner_segmenter import CornerTable, SEGMENT_KEYS, CORNERS_FILE
+from track_map import TrackMap, TrackPosition, TRACK_MAP_FILE
+
+# Fases de corner_segmenter.PHASES tal como se muestran en el dashboard
+PHASE_LABELS = {"braking": "frenada", "entry": "entrada", "exit": "salida", "straight": "recta"}
 
 # ---------------------------------------------
 # CLASE TelemetryGUI (Interfaz gráfica con Tkinter)
@@ -27,6 +41,21 @@ class TelemetryGUI:
         self.gear_dashboard_label = ttk.Label(self.dashboard_frame, text="Marcha: N", font=("Helvetica", 30))
         self.gear_dashboard_label.grid(row=0, column=1, padx=20)
 
+        # Delta con la vuelta de referencia y tiempo de vuelta previsto
+        self.delta_dashboard_label = ttk.Label(self.dashboard_frame, text="Delta: --", font=("Helvetica", 30))
+        self.delta_dashboard_label.grid(row=1, column=0, padx=20)
+
+        self.projected_dashboard_label = ttk.Label(self.dashboard_frame, text="Previsto: --", font=("Helvetica", 30))
+        self.projected_dashboard_label.grid(row=1, column=1, padx=20)
+
+        # Vuelta teórica (suma de los mejores parciales de la sesión)
+        self.theoretical_dashboard_label = ttk.Label(self.dashboard_frame, text="Teórica: --", font=("Helvetica", 30))
+        self.theoretical_dashboard_label.grid(row=1, column=2, padx=20)
+
+        # Curva actual y fase (ver corner_segmenter.py)
+        self.corner_dashboard_label = ttk.Label(self.dashboard_frame, text="Curva: --", font=("Helvetica", 30))
+        self.corner_dashboard_label.grid(row=0, column=2, padx=20)
+
         # Velocidad
         self.speed_label = ttk.Label(master, text="Velocidad Actual: 0 km/h", font=("Helvetica", 14))
         self.speed_label.pack(pady=5)
@@ -41,8 +70,8 @@ class TelemetryGUI:
         self.steering_label = ttk.Label(master, text="Ángulo del Volante: 0.00 rad", font=("Helvetica", 12))
         self.steering_label.pack()
 
-        # Desviación en pista (puedes cambiarlo a algo más específico si quieres)
-        self.position_label = ttk.Label(master, text="Desviación en Pista (ejemplo): 0.00 m", font=("Helvetica", 12))
+        # Desviación lateral respecto a la trazada de la mejor vuelta (ver track_map.py)
+        self.position_label = ttk.Label(master, text="Desviación en Pista: --", font=("Helvetica", 12))
         self.position_label.pack(pady=10)
 
         # Barra de progreso en la vuelta
@@ -58,7 +87,8 @@ class TelemetryGUI:
         self.history_box = tk.Text(master, height=15, width=100, state="disabled", font=("Helvetica", 10))
         self.history_box.pack()
 
-    def update_data(self, speed, gear, lat_accel, long_accel, steering_angle, position_diff, lap_progress):
+    def update_data(self, speed, gear, lat_accel, long_accel, steering_angle, position_diff, lap_progress,
+                    track_deviation=None):
         """
         Actualiza las etiquetas principales de la GUI.
         """
@@ -71,7 +101,11 @@ class TelemetryGUI:
         self.lat_accel_label.config(text=f"Aceleración Lateral: {lat_accel:.2f} m/s²")
         self.long_accel_label.config(text=f"Aceleración Longitudinal: {long_accel:.2f} m/s²")
         self.steering_label.config(text=f"Ángulo del Volante: {steering_angle:.2f} rad")
-        self.position_label.config(text=f"Desviación en Pista (ejemplo): {position_diff:.2f} m")
+        # + a la izquierda de la trazada de referencia, - a la derecha
+        if track_deviation is not None:
+            self.position_label.config(text=f"Desviación en Pista: {track_deviation:+.2f} m")
+        else:
+            self.position_label.config(text="Desviación en Pista: --")
 
         # Barra de progreso
         self.progress["value"] = lap_progress
@@ -97,6 +131,29 @@ class TelemetryGUI:
         message += self._colored_diff("ΔSteering", comp_info["steering_diff"], unidad="rad")
         message += self._colored_diff("ΔPos", comp_info["position_diff"], unidad="%")
 
+        time_delta = comp_info.get("time_delta")
+        projected = comp_info.get("projected_lap_time")
+        if time_delta is not None:
+            message += self._colored_diff("ΔTiempo", time_delta, unidad="s")
+            self.delta_dashboard_label.config(text=f"Delta: {time_delta:+.2f}s")
+        if projected is not None:
+            message += f"Previsto: {projected:.2f}s\n"
+            self.projected_dashboard_label.config(text=f"Previsto: {projected:.2f}s")
+        names = comp_info.get("reference_names")
+        if names:
+            # Delta de tiempo con cada referencia (NaN si no se cronometra)
+            deltas = comp_info["references"][:, comp_info["reference_fields"].index("time_delta")]
+            deltas = [f"{name} {delta:+.2f}s" for name, delta in zip(names, deltas.tolist()) if delta == delta]
+            if deltas:
+                message += "Deltas: " + " | ".join(deltas) + "\n"
+        corner = comp_info.get("corner")
+        if corner is not None:
+            phase = PHASE_LABELS.get(comp_info["corner_phase"], comp_info["corner_phase"])
+            self.corner_dashboard_label.config(text=f"Curva: {corner} ({phase})")
+        theoretical = comp_info.get("theoretical_best")
+        if theoretical is not None:
+            self.theoretical_dashboard_label.config(text=f"Teórica: {theoretical:.2f}s")
+
         self._add_history_line(message + "\n")
 
     # --------------------------------------------------------------------------------
@@ -171,99 +228,214 @@ class TelemetryGUI:
 # CLASE TelemetryApp (Conexión con iRacing)
 # ---------------------------------------------
 class TelemetryApp:
-    def __init__(self):
-        self.ir = irsdk.IRSDK()
+    def __init__(self, test_file=None):
+        """
+        test_file: archivo con la memoria de irsdk que escribe irsdk_producer.py, en lugar de la
+        memoria compartida de iRacing (sin comprobar el estado HTTP del simulador), para probar
+        toda la cadena en Linux.
+        """
+        # read_latest: leemos una copia consistente del último tick (sin el tick de retraso por defecto)
+        self.ir = irsdk.IRSDK(read_latest=True)
         self.connected = False
-
-    def connect(self):
-        if not self.connected and not self.ir.is_connected:
-            self.ir.startup()
+        # Lector precompilado; se recompila solo si cambia la disposición de variables (cambio de coche)
+        self.telemetry_reader = self.ir.reader(TELEMETRY_VARS.values())
+        # Ticks de iRacing que no llegamos a procesar (p. ej. por un frame lento de la GUI)
+        self.dropped_ticks = 0
+        self.test_file = test_file
+        # Comprueba en segundo plano si el simulador está en marcha (HTTP con timeout y backoff)
+        self.connection = irsdk.ConnectionManager() if test_file is None else None
+
+    def connect(self, timeout=0.0):
+        """
+        Atiende los cambios de estado del simulador que publica ConnectionManager (su cola
+        events), así este hilo nunca se queda bloqueado en la petición HTTP de estado:
+        si iRacing se cierra desconecta, y mientras esté en marcha intenta conectar.
+        Sin conexión espera hasta timeout s al siguiente cambio.
+        Con test_file se abre el archivo en cuanto existe (si no, se espera timeout s).
+        """
+        if self.test_file is not None:
+            self._connect_test_file(timeout)
+            return
+
+        self.connection.start()
+        event = self.connection.next_event(0 if self.connected else timeout)
+        while event is not None:
+            if not event.running:
+                self.disconnect()
+            event = self.connection.next_event(0)
+        if not self.connected and self.connection.running.is_set():
+            self.ir.startup(check_sim_status=False)
             self.connected = self.ir.is_connected
             if self.connected:
                 print("Conectado a iRacing.")
             else:
                 print("No se pudo conectar a iRacing.")
 
+    def _connect_test_file(self, timeout):
+        if self.connected:
+            return
+        if not os.path.exists(self.test_file):
+            time.sleep(timeout)
+            return
+        self.ir.startup(test_file=self.test_file)
+        self.connected = self.ir.is_connected
+        if self.connected:
+            print(f"Conectado a {self.test_file}.")
+        else:
+            self.ir.shutdown()
+            time.sleep(timeout)
+
     def disconnect(self):
         if self.connected:
             self.ir.shutdown()
             self.connected = False
-            print("Desconectado de iRacing.")
+            print(f"Desconectado de iRacing. Ticks perdidos: {self.dropped_ticks}")
 
-    def get_telemetry_data(self):
+    def close(self):
+        """Desconecta y para la comprobación del estado del simulador."""
+        self.disconnect()
+        if self.connection is not None:
+            self.connection.stop()
+
+    def ticks(self):
+        """
+        Recorre cada tick nuevo de iRacing una sola vez (espera al evento del simulador,
+        no hace sleep fijo). Termina si no llegan ticks durante 1 s.
+        """
+        for tick in self.ir.ticks(timeout=1.0):
+            self.dropped_ticks += tick.dropped
+            yield tick
+
+    def read_telemetry_values(self):
         """
-        Ajusta aquí las variables que devuelves para que coincidan con tus necesidades.
-        Usamos corchetes en lugar de .get(...) porque IRSDK usa la sintaxis self.ir['Speed'], etc.
+        Valores crudos (unidades de iRacing) de TELEMETRY_VARS en el orden de TELEMETRY_KEYS.
+        Todas se leen de una vez con un único lector precompilado (self.ir.reader) en lugar de
+        hacer self.ir['Speed'], self.ir['Gear'], ... variable por variable.
         """
         if self.connected:
-            return {
-                "speed": self.ir['Speed'] * 3.6,           # m/s a km/h
-                "gear": self.ir['Gear'],
-                "lat_accel": self.ir['LatAccel'],
-                "long_accel": self.ir['LongAccel'],
-                "steering_angle": self.ir['SteeringWheelAngle'],
-                "LapDistPct": self.ir['LapDistPct'],    # Progreso en la vuelta (%)
-                "lap": self.ir['Lap'],                    # Número de vuelta actual
-                "throttle": self.ir['Throttle'],
-                "brake": self.ir['Brake'],
-                "session_time": self.ir['SessionTime'],
-                "air_temp": self.ir['AirTemp'],           # Temperatura ambiente
-                "track_temp": self.ir['TrackTemp'],       # Temperatura de la pista
-                "fuel_level": self.ir['FuelLevel'],       # Nivel de combustible
-                "fuel_level_pct": self.ir['FuelLevelPct'],# Porcentaje de combustible
-                "dcBrakeBias": self.ir['dcBrakeBias'],    # Sesgo del freno
-                "dcWingFront": self.ir['dcWingFront'],    # Ángulo del ala delantera
-                "dcWingRear": self.ir['dcWingRear'],      # Ángulo del ala trasera
-                "dcAntiRollFront": self.ir['dcAntiRollFront'], # Configuración del estabilizador delantero
-                "dcAntiRollRear": self.ir['dcAntiRollRear'],   # Configuración del estabilizador trasero
-                "LFtempL": self.ir['LFtempL'],           # Temperatura del neumático delantero izquierdo (Exterior)
-                "LFtempM": self.ir['LFtempM'],           # Temperatura del neumático delantero izquierdo (Centro)
-                "LFtempR": self.ir['LFtempR'],           # Temperatura del neumático delantero izquierdo (Interior)
-                "RFtempL": self.ir['RFtempL'],           # Temperatura del neumático delantero derecho (Exterior)
-                "RFtempM": self.ir['RFtempM'],           # Temperatura del neumático delantero derecho (Centro)
-                "RFtempR": self.ir['RFtempR'],           # Temperatura del neumático delantero derecho (Interior)
-                "LRtempL": self.ir['LRtempL'],           # Temperatura del neumático trasero izquierdo (Exterior)
-                "LRtempM": self.ir['LRtempM'],           # Temperatura del neumático trasero izquierdo (Centro)
-                "LRtempR": self.ir['LRtempR'],           # Temperatura del neumático trasero izquierdo (Interior)
-                "RRtempL": self.ir['RRtempL'],           # Temperatura del neumático trasero derecho (Exterior)
-                "RRtempM": self.ir['RRtempM'],           # Temperatura del neumático trasero derecho (Centro)
-                "RRtempR": self.ir['RRtempR'],           # Temperatura del neumático trasero derecho (Interior)
-                "LFpressure": self.ir['LFpressure'],     # Presión del neumático delantero izquierdo
-                "RFpressure": self.ir['RFpressure'],     # Presión del neumático delantero derecho
-                "LRpressure": self.ir['LRpressure'],     # Presión del neumático trasero izquierdo
-                "RRpressure": self.ir['RRpressure']      # Presión del neumático trasero derecho
-            }
+            return self.telemetry_reader.read()
+        return None
+
+    def read_telemetry_tick(self):
+        """
+        (tick_count, valores) leídos del mismo buffer: el tick_count es el del buffer del que salen
+        los valores, que puede ser más nuevo que el tick que despertó al bucle si el simulador
+        publicó otro entretanto. (None, None) sin conexión.
+        """
+        values = self.read_telemetry_values()
+        if values is None:
+            return None, None
+        return self.telemetry_reader.tick_count, values
+
+    def get_telemetry_data(self):
+        """
+        Ajusta aquí las variables que devuelves en TELEMETRY_VARS para que coincidan con tus necesidades.
+        """
+        values = self.read_telemetry_values()
+        if values is not None:
+            data = dict(zip(TELEMETRY_KEYS, values))
+            data["speed"] *= 3.6  # m/s a km/h
+            return data
 
         return None
 
+    def telemetry_samples(self, ring, columns):
+        """
+        Convierte un bloque leído del ring buffer (TelemetryRingBuffer.read_since) en dicts
+        como los de get_telemetry_data.
+        """
+        for data in ring.rows(columns):
+            if data["speed"] is not None:
+                data["speed"] *= 3.6  # m/s a km/h
+            yield data
+
 
 # ---------------------------------------------
 # CLASE LapManager (Gestión de vueltas, referencia e interpolación)
 # ---------------------------------------------
 class LapManager:
-    def __init__(self, reference_file="best_lap.json"):
+    def __init__(self, reference_file="best_lap.json", extra_references=None, corners_file=CORNERS_FILE,
+                 track_map_file=TRACK_MAP_FILE):
+        """
+        reference_file: JSON de la mejor vuelta (se reescribe al mejorarla).
+        extra_references: dict nombre -> JSON de otras vueltas con las que comparar a la vez
+        (p. ej. {"teammate": "teammate_lap.json"}); se comparan además con la mejor ("best")
+        y con la última vuelta completa ("last").
+        corners_file: tabla de curvas del circuito hecha con corner_segmenter.py; si existe se usa
+        tal cual y da los sectores (uno por curva). Si no, se calcula con cada mejor vuelta y no
+        se guarda (LapManager nunca escribe corners_file).
+        track_map_file: trazada de referencia para la desviación lateral (ver track_map.py); se
+        reescribe con cada mejor vuelta.
+        """
         self.reference_file = reference_file
         self.reference_lap = self.load_reference_lap(reference_file)
 
-        # current_lap_data => datos de la vuelta actual
-        self.current_lap_data = []
+        # Todas las referencias apiladas para compararlas en una sola consulta (ver compare_references)
+        self.references = ReferenceSet()
+        self.references.set("best", self.reference_lap)
+        for name, filename in (extra_references or {}).items():
+            self.add_reference(name, filename)
+
+        # current_lap_data => datos de la vuelta actual, por columnas (ver lap_buffer.py)
+        self.current_lap_data = LapBuffer()
         self.last_lap_number = -1
         self.current_lap_start_time = 0.0
+        # La primera vuelta se empieza a medias: solo se cronometran las que empiezan en la línea
+        self.current_lap_timed = False
+        self.last_lap_dist_pct = None
+        self.last_session_time = None
         self.best_lap_time = float('inf')
 
-        if self.reference_lap:
-            # Si el archivo tiene lap_time guardado, lo leemos
-            self.best_lap_time = self._load_best_lap_time()
+        # Curvas del circuito para etiquetar cada tick (curva y fase). La tabla de corners_file
+        # (la de corner_segmenter.py con varias vueltas) no se toca; sin ella se calcula con la
+        # mejor vuelta y se recalcula con cada mejor vuelta nueva, solo en memoria: si se guardara
+        # en corners_file, la sesión siguiente la tomaría por una tabla hecha a propósito
+        self.corners_file = corners_file
+        self.corners = CornerTable.load(corners_file)
+        self.corners_from_file = self.corners is not None
+        if self.corners is None and self.reference_lap:
+            # Sin los puntos de relleno de la ReferenceLap (cruce de meta)
+            channels = dict(zip(self.reference_lap.keys, self.reference_lap.values[:, 1:-1]))
+            self.corners = CornerTable.from_lap(self.reference_lap.lap_dist_pct[1:-1],
+                                                *(channels[key] for key in SEGMENT_KEYS[1:]))
+
+        # Sectores: uno por curva si la tabla viene de archivo; la calculada en la sesión cambia
+        # con cada mejor vuelta (se perderían los mejores parciales), así que entonces SECTORS
+        sectors = self.corners.as_sectors() if self.corners_from_file and self.corners else SECTORS
+
+        # Parciales por sector en vivo y vuelta teórica de la sesión (ver sector_tracker.py)
+        self.sectors = SectorTracker(sectors)
+
+        # Features de entrenamiento por vuelta, calculadas tick a tick (ver lap_features.py)
+        self.features = LapAggregator(sectors=sectors)
+
+        # Trazada de referencia y posición x/y estimada tick a tick (desviación lateral)
+        self.track_map_file = track_map_file
+        self.track_map = TrackMap.load(track_map_file)
+        self.track_position = TrackPosition(self.track_map) if self.track_map else None
+        # Último mapa construido por PersistenceWriter; entra en el hilo de análisis cuando cambia
+        self._next_track_map = self.track_map
+
+        if self.reference_lap and self.reference_lap.lap_time is not None:
+            # Si el archivo tiene lap_time guardado, lo usamos
+            self.best_lap_time = self.reference_lap.lap_time
 
         # Contador para guardar vueltas individualmente
         self.lap_counter = 0
 
+        # Todas las muestras de la sesión van a un único archivo columnar (ver lap_store.py),
+        # se crea con la primera muestra
+        self.store = None
+
+        # Escrituras grandes (vuelta de referencia) en un hilo aparte, fuera del tick
+        self.persistence = PersistenceWriter()
+
     # ---------------------------------------------
     # Carga y guarda de la vuelta de referencia
     # ---------------------------------------------
     def load_reference_lap(self, filename):
         """
-        Carga el JSON de la mejor vuelta (si existe).
+        Carga el JSON de la mejor vuelta (si existe) como ReferenceLap precompilada.
         Formato esperado:
         {
           "lap_time": 123.45,
@@ -273,60 +445,61 @@ class LapManager:
           ]
         }
         """
-        if not os.path.exists(filename):
-            print(f"No se encontró {filename}. Iniciando sin referencia.")
-            return []
-
-        try:
-            with open(filename, 'r') as file:
-                data = json.load(file)
-                return data.get("lap_data", [])
-        except Exception as e:
-            print(f"Error cargando {filename}: {e}")
-            return []
-
-    def _load_best_lap_time(self):
-        """Devuelve el tiempo de la mejor vuelta guardado en reference_file."""
-        try:
-            with open(self.reference_file, 'r') as file:
-                data = json.load(file)
-                return data.get("lap_time", float('inf'))
-        except:
-            return float('inf')
+        return ReferenceLap.load(filename)
 
     def save_reference_lap(self, lap_time, lap_data):
         """
-        Guarda la mejor vuelta en un JSON (reemplazando la anterior).
+        Guarda la mejor vuelta (un LapBuffer) en un JSON (reemplazando la anterior).
+        La conversión a dicts y el json.dump los hace PersistenceWriter en segundo plano
+        (escritura atómica), lap_data no debe modificarse después.
         """
         data = {
             "lap_time": lap_time,
             "lap_data": lap_data
         }
-        with open(self.reference_file, 'w') as file:
-            json.dump(data, file, indent=4)
+        self.persistence.submit(self.reference_file, data, serializer=self._serialize_reference_lap)
         print(f"¡Nueva mejor vuelta guardada! Tiempo: {lap_time:.2f}s")
 
+    def add_reference(self, name, filename):
+        """Carga filename (formato de best_lap.json) como referencia adicional name."""
+        reference = ReferenceLap.load(filename)
+        if reference is not None:
+            self.references.set(name, reference)
+        return reference is not None
+
+    @staticmethod
+    def _serialize_reference_lap(data):
+        return json_serializer(dict(data, lap_data=data["lap_data"].to_dicts()))
+
+    def _build_track_map(self, lap_data):
+        # Corre en el hilo de PersistenceWriter: lap_data es una copia que nadie más toca
+        track_map = TrackMap.from_lap(lap_data)
+        self._next_track_map = track_map
+        return json_serializer(track_map.to_dict())
+
     # ---------------------------------------------
     # Guardar vuelta actual completa en un archivo
     # ---------------------------------------------
     def save_current_lap_file(self, lap_data, lap_number):
         """
-        Guarda la vuelta actual en un archivo JSON individual, por ejemplo "lap_3.json".
+        Las muestras ya están en el store de la sesión (se añaden en cada tick); aquí solo se
+        escribe a disco lo pendiente para que la vuelta terminada no se pierda.
+        Para obtenerla en el formato de los lap_*.json: LapStoreReader(path).lap_json(índice).
         """
-        filename = f"lap_{lap_number}.json"
-        # Estimación de tiempo: la primera muestra vs la última
-        if lap_data:
-            lap_time_est = lap_data[-1]["session_time"] - lap_data[0]["session_time"]
-        else:
-            lap_time_est = 0.0
+        if self.store is None:
+            return
+        self.store.flush()
+        print(f"Vuelta {lap_number} guardada en {self.store.path} (índice {len(self.store.laps) - 1}).")
 
-        data = {
-            "lap_time_est": lap_time_est,
-            "lap_data": lap_data
-        }
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=4)
-        print(f"Vuelta {lap_number} guardada en {filename}.")
+    def close(self):
+        """
+        Cierra el store de la sesión (escribe su índice de vueltas) y espera a que
+        terminen las escrituras en segundo plano.
+        """
+        if self.store is not None:
+            self.store.close()
+        self.persistence.close()
+        print(self.persistence.metrics.report())
 
     # ---------------------------------------------
     # Lógica principal: procesar datos en cada tick
@@ -339,84 +512,148 @@ class LapManager:
          - Comparar con la vuelta de referencia (interpolada)
          - Devuelve un dict con las diferencias
         """
-        self.current_lap_data.append(data)
+        values = [data.get(key) for key in TELEMETRY_KEYS]
+        self.current_lap_data.append(values)
+        if self.store is None:
+            self.store = LapStoreWriter(session_store_path())
+        self.store.append(values)
+        # La muestra que cambia de vuelta cierra la anterior, igual en current_lap_data, en el
+        # store (y los lap_*.json) y en las features: se añade antes de detectar el cambio
+        self.features.update(values)
 
         current_lap_number = data["lap"]
 
         # Detectar cambio de vuelta
         if current_lap_number != self.last_lap_number and self.last_lap_number != -1:
-            # Ha terminado la vuelta anterior
-            lap_time = data["session_time"] - self.current_lap_start_time
+            # Ha terminado la vuelta anterior: momento exacto del cruce de meta entre las dos muestras.
+            # Si LapDistPct no ha dado la vuelta (reset, grúa, salida de boxes) no es un cruce:
+            # ni la vuelta que acaba ni la que empieza se cronometran
+            crossing_time, crossed = self._line_crossing(data)
+            lap_timed = self.current_lap_timed and crossed
+            lap_time = crossing_time - self.current_lap_start_time
             self.lap_counter += 1  # Sube el contador de vueltas
 
-            print(f"Vuelta completada (lap #{current_lap_number-1}) en {lap_time:.2f}s")
-            # Guardar la vuelta completa en un JSON
+            if crossed:
+                self._report_sector(self.sectors.finish_lap(crossing_time))
+            self.sectors.start_lap(crossing_time, timed=crossed)
+            if lap_timed:
+                print(f"Vuelta completada (lap #{self.last_lap_number}) en {lap_time:.2f}s")
+            elif crossed:
+                print(f"Vuelta completada (lap #{self.last_lap_number}), empezada a medias: sin tiempo")
+            else:
+                print(f"Cambio a la vuelta {current_lap_number} sin cruzar la meta: no se cronometra")
+            # Guardar la vuelta completa en el store de la sesión
             self.save_current_lap_file(self.current_lap_data, self.lap_counter)
 
-            # ¿Es mejor que la de referencia?
-            if lap_time < self.best_lap_time:
+            # ¿Es mejor que la de referencia? (solo vueltas de línea a línea)
+            if lap_timed and lap_time < self.best_lap_time:
                 print("¡Nueva mejor vuelta!")
                 self.best_lap_time = lap_time
-                self.save_reference_lap(lap_time, self.current_lap_data.copy())
-
-            # Reseteamos para la nueva vuelta
-            self.current_lap_data = []
-            self.current_lap_start_time = data["session_time"]
+                best_lap = self.current_lap_data.copy()
+                self.save_reference_lap(lap_time, best_lap)
+                # Comparamos desde ya contra la nueva mejor vuelta
+                self.reference_lap = ReferenceLap.from_buffer(best_lap, lap_time)
+                self.references.set("best", self.reference_lap)
+                # Sin tabla de archivo, las curvas se recalculan con la vuelta más limpia
+                if not self.corners_from_file:
+                    self.corners = CornerTable.from_lap(*(best_lap[key] for key in SEGMENT_KEYS))
+                # Y la trazada de referencia (la posición en vivo se estima sobre ella). Construirla
+                # cuesta decenas de ms: la hace PersistenceWriter al guardarla y entra en
+                # _track_deviation cuando está lista (hasta entonces se sigue con el mapa anterior)
+                self.persistence.submit(self.track_map_file, best_lap, serializer=self._build_track_map)
+
+            if lap_timed:
+                # La vuelta recién terminada pasa a ser la referencia "last"
+                self.references.set("last", ReferenceLap.from_buffer(self.current_lap_data, lap_time))
+                # Fila de features para los scripts de entrenamiento (sin releer la vuelta)
+                lap_name = f"{os.path.basename(self.store.path)}:{len(self.store.laps) - 1}"
+                append_lap_features(self.features.row(lap_time, lap_name))
+            self.features.reset()
+
+            # Reseteamos para la nueva vuelta (la referencia se guardó con una copia)
+            self.current_lap_data.clear()
+            self.current_lap_start_time = crossing_time
+            self.current_lap_timed = crossed
+
+        elif self.last_lap_number != -1:
+            for split in self.sectors.update(self.last_session_time, self.last_lap_dist_pct,
+                                             data["session_time"], data["LapDistPct"]):
+                self._report_sector(split)
 
         # Primera iteración
         if self.last_lap_number == -1:
             self.current_lap_start_time = data["session_time"]
 
         self.last_lap_number = current_lap_number
+        self.last_lap_dist_pct = data["LapDistPct"]
+        self.last_session_time = data["session_time"]
 
         # Comparar con referencia (interp)
         comp_info = self.compare_with_reference(data)
+        comp_info["sector_splits"] = tuple(self.sectors.splits)
+        comp_info["theoretical_best"] = self.sectors.theoretical_best
+        # Curva y fase (braking, entry, exit, straight) en este punto, O(1)
+        comp_info["corner"], comp_info["corner_phase"] = (
+            self.corners.lookup(data["LapDistPct"]) if self.corners else (None, None))
+        comp_info["track_deviation"] = self._track_deviation(data)
+        # Comparación con todas las referencias: array [referencia, campo] (ver ReferenceSet)
+        comp_info["reference_names"] = self.references.names
+        comp_info["reference_fields"] = self.references.fields
+        comp_info["references"] = self.compare_references(data)
 
         return comp_info
 
+    def _track_deviation(self, data):
+        """
+        Distancia (m, + izquierda) a la trazada de referencia, o None si no hay mapa, no hay
+        YawNorth o se sale de él.
+        """
+        track_map = self._next_track_map
+        if track_map is not self.track_map:
+            # Mapa de una mejor vuelta nueva ya construido en segundo plano
+            self.track_map = track_map
+            self.track_position = TrackPosition(track_map)
+        if self.track_position is None:
+            return None
+        position = self.track_position.update(
+            data["LapDistPct"], data.get("speed"), data["session_time"], data.get("yaw_north"))
+        if position is None:
+            return None
+        return self.track_map.deviation(*position, data["LapDistPct"])
+
+    def _report_sector(self, split):
+        if split is None:
+            return
+        mark = " (mejor parcial)" if split.is_best else f" (mejor {split.best_time:.3f}s)"
+        print(f"{split.name}: {split.time:.3f}s{mark}")
+
+    def _line_crossing(self, data):
+        """
+        (session_time del cruce de meta, True) interpolando LapDistPct entre la muestra anterior
+        (cerca de 1.0) y la actual (cerca de 0.0), igual que los índices de vueltas del lap store
+        y de los .ibt (irsdk.lap_crossing). Si LapDistPct no ha dado la vuelta no es un cruce
+        (p. ej. salida de boxes): (session_time de la muestra actual, False).
+        """
+        if None in (self.last_session_time, self.last_lap_dist_pct, data["LapDistPct"]):
+            return data["session_time"], False
+        crossing_time, crossed = irsdk.lap_crossing(self.last_session_time, self.last_lap_dist_pct,
+                                                    data["session_time"], data["LapDistPct"])
+        if not crossed:
+            return data["session_time"], False
+        return float(crossing_time), True
+
     # ---------------------------------------------
     # Interpolación simple
     # ---------------------------------------------
     def interpolate_reference_point(self, current_position):
         """
-        Retorna los valores de la vuelta de referencia INTERPOLADOS a LapDistPct = current_position.
+        Retorna los valores de la vuelta de referencia INTERPOLADOS a LapDistPct = current_position
+        (búsqueda binaria en la ReferenceLap, cruzando la línea de meta 1.0 -> 0.0).
         Si la referencia está vacía, None.
         """
         if not self.reference_lap:
             return None
-
-        # Ordena la referencia por LapDistPct
-        ref_data = sorted(self.reference_lap, key=lambda x: x["LapDistPct"])
-
-        # Si current_position <= primer punto
-        if current_position <= ref_data[0]["LapDistPct"]:
-            return ref_data[0]
-
-        # Si current_position >= último punto
-        if current_position >= ref_data[-1]["LapDistPct"]:
-            return ref_data[-1]
-
-        # Busca dos puntos consecutivos que encierren current_position
-        for i in range(len(ref_data) - 1):
-            p1 = ref_data[i]
-            p2 = ref_data[i+1]
-            if p1["LapDistPct"] <= current_position < p2["LapDistPct"]:
-                # Hacemos interpolación lineal
-                ratio = ((current_position - p1["LapDistPct"]) /
-                         (p2["LapDistPct"] - p1["LapDistPct"]))
-
-                interp = {}
-                for key in ["speed", "brake", "throttle", "lat_accel", "long_accel", "steering_angle"]:
-                    v1 = p1.get(key, 0.0)
-                    v2 = p2.get(key, 0.0)
-                    interp[key] = v1 + (v2 - v1) * ratio
-
-                # Mantén el LapDistPct interpolado
-                interp["LapDistPct"] = current_position
-                return interp
-
-        # Si por algún motivo no se encontró, retorna el último
-        return ref_data[-1]
+        return self.reference_lap.interpolate(current_position)
 
     # ---------------------------------------------
     # Comparación con la vuelta de referencia
@@ -425,6 +662,11 @@ class LapManager:
         """
         Busca (con interpolación) el punto correspondiente en la vuelta de referencia
         y devuelve las diferencias de speed, brake, throttle, lat_accel, etc.
+        Además, si la vuelta actual se cronometra desde la línea de meta:
+         - time_delta: segundos perdidos (+) o ganados (-) respecto a la referencia en este punto
+         - projected_lap_time: tiempo de vuelta previsto (referencia + delta)
+         - position_diff: % de vuelta por delante (+) o por detrás (-) de donde estaba la
+           referencia con el mismo tiempo de vuelta
         """
         if not self.reference_lap:
             return {
@@ -434,7 +676,9 @@ class LapManager:
                 "lat_accel_diff": 0.0,
                 "long_accel_diff": 0.0,
                 "steering_diff": 0.0,
-                "position_diff": 0.0
+                "position_diff": 0.0,
+                "time_delta": None,
+                "projected_lap_time": None
             }
 
         current_position = data_point["LapDistPct"]
@@ -448,7 +692,9 @@ class LapManager:
                 "lat_accel_diff": 0.0,
                 "long_accel_diff": 0.0,
                 "steering_diff": 0.0,
-                "position_diff": 0.0
+                "position_diff": 0.0,
+                "time_delta": None,
+                "projected_lap_time": None
             }
 
         # Calculamos diffs
@@ -458,8 +704,14 @@ class LapManager:
         lat_accel_diff = data_point["lat_accel"] - ref_point["lat_accel"]
         long_accel_diff = data_point["long_accel"] - ref_point["long_accel"]
         steering_diff = data_point["steering_angle"] - ref_point["steering_angle"]
-        # Por ejemplo, en % de diferencia de posición en el circuito
-        position_diff = (current_position - ref_point["LapDistPct"]) * 100
+        # Delta de tiempo y diferencia de posición (rejillas precalculadas, O(1))
+        time_delta = projected_lap_time = None
+        position_diff = 0.0
+        if self.current_lap_timed and self.reference_lap.duration is not None:
+            elapsed = data_point["session_time"] - self.current_lap_start_time
+            time_delta = elapsed - self.reference_lap.elapsed_at(current_position)
+            projected_lap_time = self.reference_lap.duration + time_delta
+            position_diff = (current_position - self.reference_lap.pct_at(elapsed)) * 100
 
         return {
             "speed_diff": speed_diff,
@@ -468,67 +720,113 @@ class LapManager:
             "lat_accel_diff": lat_accel_diff,
             "long_accel_diff": long_accel_diff,
             "steering_diff": steering_diff,
-            "position_diff": position_diff
+            "position_diff": position_diff,
+            "time_delta": time_delta,
+            "projected_lap_time": projected_lap_time
         }
 
+    def compare_references(self, data_point):
+        """
+        Compara la muestra con todas las referencias (best, last, extra_references) en una
+        sola consulta vectorizada. Devuelve un array [referencia, campo] con las filas en el
+        orden de self.references.names y las columnas de self.references.fields
+        (columnas de tiempo en NaN si la vuelta actual no se cronometra).
+        """
+        values = [data_point[key] for key in INTERP_KEYS]
+        elapsed = None
+        if self.current_lap_timed:
+            elapsed = data_point["session_time"] - self.current_lap_start_time
+        return self.references.compare(data_point["LapDistPct"], values, elapsed)
+
 
 # ---------------------------------------------
 # FUNCIÓN que corre en un hilo para actualizar la GUI y la lógica de vueltas
 # ---------------------------------------------
-def update_gui(gui, app, lap_manager):
+def update_gui(gui, app, lap_manager, ring, metrics, stopped=None):
     """
     Hilo que corre en paralelo al mainloop de Tkinter.
-    Cada ~50 ms:
-      1) Conectar a iRacing si no está conectado
-      2) Obtener datos telemetría
-      3) Pasarlo a LapManager para procesar
-      4) Actualizar GUI con data y comparación
+    La captura la hace TelemetryRecorder en su propio hilo; aquí se lee del ring buffer:
+      1) Esperar muestras nuevas (desde nuestro cursor)
+      2) Pasarlas TODAS a LapManager para procesar (almacena, detecta vuelta, compara)
+      3) Actualizar GUI una vez por bloque, con la última muestra y su comparación
+    Si la GUI va lenta solo se actualiza menos a menudo; no se pierden muestras.
+    En metrics se anota, por muestra, la latencia desde que apareció el tick y el tiempo
+    dentro de process_telemetry_data.
+    Con gui=None solo se procesan las muestras (sin ventana); termina cuando se activa stopped.
     """
-    while True:
-        app.connect()
-        if app.connected:
-            data = app.get_telemetry_data()
-            if data:
-                # Procesar en LapManager (almacena, detecta vuelta, compara)
-                comparison_info = lap_manager.process_telemetry_data(data)
-
-                # Actualizar GUI principal
-                gui.update_data(
-                    speed=data["speed"],
-                    gear=data["gear"],
-                    lat_accel=data["lat_accel"],
-                    long_accel=data["long_accel"],
-                    steering_angle=data["steering_angle"],
-                    position_diff=comparison_info["position_diff"],
-                    lap_progress=data["LapDistPct"] * 100
-                )
-
-                # Mostrar deltas
-                gui.update_comparison(comparison_info)
-
-        time.sleep(0.05)  # ~ 20 Hz
+    cursor = ring.count
+    lost_samples = 0
+    while stopped is None or not stopped.is_set():
+        if not ring.wait(cursor, timeout=0.5):
+            continue
+
+        cursor, lost, _, timestamps, columns = ring.read_since(cursor)
+        if lost:
+            lost_samples += lost
+            print(f"Análisis demasiado lento: {lost} muestras sobrescritas ({lost_samples} en total)")
+
+        data = comparison_info = None
+        for timestamp, data in zip(timestamps.tolist(), app.telemetry_samples(ring, columns)):
+            start = time.perf_counter()
+            comparison_info = lap_manager.process_telemetry_data(data)
+            end = time.perf_counter()
+            metrics.tick_latency.observe(end - timestamp)
+            metrics.process_time.observe(end - start)
+
+        if data and gui is not None:
+            # Actualizar GUI principal
+            gui.update_data(
+                speed=data["speed"],
+                gear=data["gear"],
+                lat_accel=data["lat_accel"],
+                long_accel=data["long_accel"],
+                steering_angle=data["steering_angle"],
+                position_diff=comparison_info["position_diff"],
+                lap_progress=data["LapDistPct"] * 100,
+                track_deviation=comparison_info["track_deviation"]
+            )
+
+            # Mostrar deltas
+            gui.update_comparison(comparison_info)
 
 
 # ---------------------------------------------
 # MAIN
 # ---------------------------------------------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Asistente de telemetría en tiempo real")
+    parser.add_argument("--test-file", help="leer la memoria de irsdk de este archivo (irsdk_producer.py) en lugar de iRacing")
+    args = parser.parse_args()
+
     # 1) Iniciar ventana
     root = tk.Tk()
     gui = TelemetryGUI(root)
 
-    # 2) Iniciar clase que se conecta a iRacing
-    app = TelemetryApp()
+    # 2) Iniciar clase que se conecta a iRacing (o al archivo del productor sintético)
+    app = TelemetryApp(test_file=args.test_file)
 
     # 3) LapManager para gestionar vueltas y referencia
-    lap_manager = LapManager("best_lap.json")
+    # (además de la mejor y la última vuelta, se compara con estas si existen)
+    lap_manager = LapManager("best_lap.json", {"teammate": "teammate_lap.json", "imported": "imported_lap.json"})
 
-    # 4) Hilo de actualización
+    # 4) Hilo de captura: copia cada tick al ring buffer
+    # Histogramas de ticks perdidos, latencia y tiempo de proceso (se imprimen al desconectar)
+    ring = TelemetryRingBuffer()
+    metrics = CaptureMetrics()
+    recorder = TelemetryRecorder(app, ring, metrics)
+    recorder.start()
+
+    # 5) Hilo de actualización (análisis + GUI), lee del ring buffer
     threading.Thread(
         target=update_gui,
-        args=(gui, app, lap_manager),
+        args=(gui, app, lap_manager, ring, metrics),
         daemon=True
     ).start()
 
-    # 5) Arrancar el bucle principal de Tkinter
+    # 6) Arrancar el bucle principal de Tkinter
     root.mainloop()
+
+    # 7) Al cerrar la ventana: dejar la sesión con su índice de vueltas
+    recorder.stop()
+    app.close()
+    lap_manager.close()
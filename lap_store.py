@@ -0,0 +1,319 @@
+"""
+Almacén columnar de vueltas: un archivo por sesión, solo se añade al final.
+
+Formato (little endian):
+    cabecera   MAGIC, versión, chunk_size, nº de canales y por canal (nombre 32s, dtype 8s)
+    chunks     "CHNK", n muestras, muestra inicial; después cada canal seguido
+               (n * itemsize bytes por canal, float32 / int32 / float64 para session_time)
+    pie        JSON {"chunks": [[offset, inicio, n], ...], "laps": [...], "sample_count": N},
+               su longitud (uint64) y FOOTER_MAGIC
+
+Las muestras se acumulan en un chunk preasignado (copiar una muestra cuesta unos µs) y se
+escriben a disco en bloques al llenarse el chunk, al terminar cada vuelta (flush) y al cerrar.
+Leer un canal de una vuelta solo toca los bytes de ese canal en los chunks de esa vuelta.
+Si el programa muere antes de escribir el pie, LapStoreReader recorre los chunks y
+reconstruye el índice de vueltas.
+"""
+import json
+import mmap
+import struct
+import time
+
+import numpy as np
+
+import irsdk
+from telemetry_vars import TELEMETRY_KEYS, INT_KEYS
+
+MAGIC = b"LAPSTORE"
+FOOTER_MAGIC = b"LAPINDEX"
+VERSION = 1
+STORE_SUFFIX = ".laps"
+
+HEADER_STRUCT = struct.Struct("<8sIII")
+CHANNEL_STRUCT = struct.Struct("<32s8s")
+CHUNK_STRUCT = struct.Struct("<4sIQ")
+FOOTER_STRUCT = struct.Struct("<Q8s")
+CHUNK_MAGIC = b"CHNK"
+
+# 10 s a 60 Hz
+DEFAULT_CHUNK_SIZE = 600
+
+# Canales que necesitan más precisión que float32 (SessionTime es double en iRacing)
+FLOAT64_KEYS = ("session_time",)
+
+
+def channel_dtype(key):
+    if key in INT_KEYS:
+        return np.dtype("<i4")
+    if key in FLOAT64_KEYS:
+        return np.dtype("<f8")
+    return np.dtype("<f4")
+
+
+def session_store_path(prefix="session"):
+    """Nombre de archivo para una sesión nueva, p. ej. session_20240131_183000.laps"""
+    return time.strftime(f"{prefix}_%Y%m%d_%H%M%S{STORE_SUFFIX}")
+
+
+def build_lap_index(laps, lap_dist_pct, session_times, start=0):
+    """
+    Índice de vueltas a partir de las columnas lap, LapDistPct y session_time (vectorizado):
+    [{"lap", "start", "end", "lap_time"}], end exclusivo. lap_time va de cruce de meta a cruce
+    de meta, interpolado igual que en el índice de los .ibt (irsdk.lap_crossing). La primera
+    vuelta está empezada, la última sin terminar, y un cambio de lap sin que LapDistPct dé la
+    vuelta (reset, grúa, salida de boxes) no es un cruce: esas vueltas no tienen lap_time.
+    """
+    if not len(laps):
+        return []
+    starts = np.flatnonzero(laps[1:] != laps[:-1]) + 1
+    crossing_time, wrapped = irsdk.lap_crossing(session_times[starts - 1], lap_dist_pct[starts - 1],
+                                                session_times[starts], lap_dist_pct[starts])
+    crossing_times = [None] + [float(time) if is_crossing else None
+                               for time, is_crossing in zip(crossing_time.tolist(), wrapped.tolist())] + [None]
+    bounds = [0] + starts.tolist() + [len(laps)]
+    index = []
+    for i in range(len(bounds) - 1):
+        timed = crossing_times[i] is not None and crossing_times[i + 1] is not None
+        index.append(dict(
+            lap=int(laps[bounds[i]]),
+            start=start + bounds[i],
+            end=start + bounds[i + 1],
+            lap_time=crossing_times[i + 1] - crossing_times[i] if timed else None,
+        ))
+    return index
+
+
+class LapStoreWriter:
+    """
+    Escribe una sesión. append() / append_block() reciben valores en el orden de keys
+    (None -> NaN; en canales enteros, 0). laps tiene las vueltas ya terminadas.
+    """
+    def __init__(self, path, keys=TELEMETRY_KEYS, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.path = path
+        self.keys = tuple(keys)
+        self.chunk_size = chunk_size
+        self.dtypes = [channel_dtype(key) for key in self.keys]
+        self.sample_count = 0
+        self.chunks = []
+        self.laps = []
+
+        # Chunk en curso: preasignado, se convierte a los dtypes de cada canal al escribirlo
+        self._pending = np.full((len(self.keys), chunk_size), np.nan)
+        self._pending_count = 0
+
+        # Vuelta en curso (se detecta por cambio del canal lap; el cruce de meta se interpola con
+        # session_time y LapDistPct de la última muestra y la actual)
+        self._lap_channel = self.keys.index("lap") if "lap" in self.keys else None
+        self._time_channel = self.keys.index("session_time") if "session_time" in self.keys else None
+        self._pct_channel = self.keys.index("LapDistPct") if "LapDistPct" in self.keys else None
+        self._lap = None
+        self._lap_start = 0
+        self._lap_start_time = None  # cruce de meta con el que empezó (None si no empezó en la línea)
+        self._last = (None, None)    # (session_time, LapDistPct) de la última muestra
+
+        self._file = open(path, "wb")
+        self._file.write(HEADER_STRUCT.pack(MAGIC, VERSION, chunk_size, len(self.keys)))
+        for key, dtype in zip(self.keys, self.dtypes):
+            self._file.write(CHANNEL_STRUCT.pack(key.encode(), dtype.str.encode()))
+
+    def append(self, values):
+        """Añade una muestra."""
+        self._pending[:, self._pending_count] = values
+        self._pending_count += 1
+        if self._lap_channel is not None:
+            lap = values[self._lap_channel]
+            current = self._time_pct(values)
+            if lap is not None and lap != self._lap:
+                self._lap_changed(self.sample_count, lap, self._last, current)
+            self._last = current
+        self.sample_count += 1
+        if self._pending_count == self.chunk_size:
+            self.flush()
+
+    def append_block(self, columns):
+        """Añade un bloque columns[canal, muestra] (p. ej. el de TelemetryRingBuffer.read_since)."""
+        columns = np.asarray(columns, dtype=np.float64)
+        total = columns.shape[1]
+        if self._lap_channel is not None and total:
+            laps = columns[self._lap_channel]
+            changes = np.flatnonzero(laps[1:] != laps[:-1]) + 1
+            if laps[0] != self._lap:
+                changes = np.concatenate(([0], changes))
+            for i in changes.tolist():
+                before = self._time_pct(columns[:, i - 1]) if i else self._last
+                self._lap_changed(self.sample_count + i, int(laps[i]), before, self._time_pct(columns[:, i]))
+            self._last = self._time_pct(columns[:, -1])
+
+        done = 0
+        while done < total:
+            n = min(total - done, self.chunk_size - self._pending_count)
+            self._pending[:, self._pending_count:self._pending_count + n] = columns[:, done:done + n]
+            self._pending_count += n
+            self.sample_count += n
+            done += n
+            if self._pending_count == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        """Escribe a disco las muestras pendientes como un chunk."""
+        n = self._pending_count
+        if not n or self._file is None:
+            return
+        offset = self._file.tell()
+        start = self.sample_count - n
+        data = [CHUNK_STRUCT.pack(CHUNK_MAGIC, n, start)]
+        for column, dtype in zip(self._pending[:, :n], self.dtypes):
+            if dtype.kind == "i":
+                column = np.nan_to_num(column)
+            data.append(column.astype(dtype).tobytes())
+        self._file.write(b"".join(data))
+        self._file.flush()
+        self.chunks.append([offset, start, n])
+        self._pending_count = 0
+
+    def close(self):
+        """Escribe lo pendiente y el pie con el índice de chunks y vueltas."""
+        if self._file is None:
+            return
+        self.flush()
+        laps = list(self.laps)
+        if self._lap is not None and self.sample_count > self._lap_start:
+            laps.append(dict(lap=self._lap, start=self._lap_start, end=self.sample_count, lap_time=None))
+        footer = json.dumps(dict(chunks=self.chunks, laps=laps, sample_count=self.sample_count)).encode()
+        self._file.write(footer + FOOTER_STRUCT.pack(len(footer), FOOTER_MAGIC))
+        self._file.close()
+        self._file = None
+
+    def _time_pct(self, values):
+        return (values[self._time_channel] if self._time_channel is not None else None,
+                values[self._pct_channel] if self._pct_channel is not None else None)
+
+    def _lap_changed(self, sample, lap, before, after):
+        """before / after: (session_time, LapDistPct) de la última muestra de la vuelta y de la primera de la nueva."""
+        # Cruce de meta, o None si LapDistPct no dio la vuelta (o es la primera muestra grabada)
+        crossing = None
+        if None not in before and None not in after:
+            crossing_time, wrapped = irsdk.lap_crossing(before[0], before[1], after[0], after[1])
+            crossing = float(crossing_time) if wrapped else None
+        if self._lap is not None:
+            lap_time = None
+            if crossing is not None and self._lap_start_time is not None:
+                lap_time = crossing - self._lap_start_time
+            self.laps.append(dict(lap=self._lap, start=self._lap_start, end=sample, lap_time=lap_time))
+        self._lap = int(lap)
+        self._lap_start = sample
+        self._lap_start_time = crossing
+
+
+class LapStoreReader:
+    """Lee una sesión escrita por LapStoreWriter (mapeada en memoria, sin cargarla entera)."""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mem = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.chunk_size, num_channels = HEADER_STRUCT.unpack_from(self._mem, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} no es un lap store (versión {VERSION})")
+        self.keys = []
+        self.dtypes = []
+        for i in range(num_channels):
+            name, dtype = CHANNEL_STRUCT.unpack_from(self._mem, HEADER_STRUCT.size + i * CHANNEL_STRUCT.size)
+            self.keys.append(name.rstrip(b"\x00").decode())
+            self.dtypes.append(np.dtype(dtype.rstrip(b"\x00").decode()))
+        self._channels = {key: i for i, key in enumerate(self.keys)}
+        # Bytes de los canales anteriores a cada canal, por muestra
+        self._prefix_sizes = np.cumsum([0] + [dtype.itemsize for dtype in self.dtypes]).tolist()
+
+        footer = self._read_footer()
+        if footer:
+            self.chunks = footer["chunks"]
+            self.laps = footer["laps"]
+            self.sample_count = footer["sample_count"]
+        else:
+            # Sesión sin cerrar: recorremos los chunks y reconstruimos el índice
+            self.chunks = self._scan_chunks()
+            self.sample_count = sum(n for _, _, n in self.chunks)
+            self.laps = []
+            if "lap" in self._channels and "session_time" in self._channels:
+                lap_dist_pct = self.read("LapDistPct") if "LapDistPct" in self._channels else np.full(self.sample_count, np.nan)
+                self.laps = build_lap_index(self.read("lap"), lap_dist_pct, self.read("session_time"))
+
+    def close(self):
+        if self._mem is not None:
+            try:
+                self._mem.close()
+            except BufferError:
+                # Quedan arrays de read() apuntando al mmap; se cierra cuando se liberen
+                pass
+            self._file.close()
+            self._mem = None
+
+    def read(self, key, lap=None, start=0, end=None):
+        """
+        Canal key de las muestras [start, end) o de la vuelta número lap del índice (laps[lap]).
+        Un solo chunk -> vista sin copia sobre el archivo; si no, concatena los trozos.
+        """
+        if lap is not None:
+            start, end = self.laps[lap]["start"], self.laps[lap]["end"]
+        if end is None:
+            end = self.sample_count
+        channel = self._channels[key]
+        dtype = self.dtypes[channel]
+        parts = []
+        for offset, chunk_start, n in self.chunks:
+            lo, hi = max(start, chunk_start), min(end, chunk_start + n)
+            if lo >= hi:
+                continue
+            column_offset = offset + CHUNK_STRUCT.size + n * self._prefix_sizes[channel]
+            parts.append(np.frombuffer(self._mem, dtype, count=hi - lo,
+                                       offset=column_offset + (lo - chunk_start) * dtype.itemsize))
+        if not parts:
+            return np.empty(0, dtype)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def read_lap(self, lap, keys=None):
+        """Dict clave -> array con los canales (todos por defecto) de la vuelta laps[lap]."""
+        return {key: self.read(key, lap=lap) for key in (keys or self.keys)}
+
+    def lap_json(self, lap):
+        """La vuelta laps[lap] con la forma de nuestros lap_*.json, para las herramientas antiguas."""
+        columns = self.read_lap(lap)
+        values = []
+        for key, column in columns.items():
+            if column.dtype.kind == "f":
+                values.append([None if value != value else value for value in column.tolist()])
+            else:
+                values.append(column.tolist())
+        lap_data = [dict(zip(columns, sample)) for sample in zip(*values)]
+        session_time = columns.get("session_time")
+        lap_time_est = float(session_time[-1] - session_time[0]) if session_time is not None and len(session_time) else 0.0
+        return {"lap_time_est": lap_time_est, "lap_data": lap_data}
+
+    def _read_footer(self):
+        size = len(self._mem)
+        if size < FOOTER_STRUCT.size:
+            return None
+        footer_len, magic = FOOTER_STRUCT.unpack_from(self._mem, size - FOOTER_STRUCT.size)
+        if magic != FOOTER_MAGIC:
+            return None
+        start = size - FOOTER_STRUCT.size - footer_len
+        try:
+            return json.loads(self._mem[start:size - FOOTER_STRUCT.size])
+        except ValueError:
+            return None
+
+    def _scan_chunks(self):
+        chunks = []
+        offset = HEADER_STRUCT.size + len(self.keys) * CHANNEL_STRUCT.size
+        size = len(self._mem)
+        sample_size = self._prefix_sizes[-1]
+        while offset + CHUNK_STRUCT.size <= size:
+            magic, n, start = CHUNK_STRUCT.unpack_from(self._mem, offset)
+            end = offset + CHUNK_STRUCT.size + n * sample_size
+            # Último chunk a medio escribir: se descarta
+            if magic != CHUNK_MAGIC or end > size:
+                break
+            chunks.append([offset, start, n])
+            offset = end
+        return chunks
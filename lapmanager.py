@@ -2,6 +2,9 @@ import irsdk
 import json
 import time
 
+from telemetry_metrics import CaptureMetrics
+from lap_journal import LapJournal
+
 
 class LapManager:
     def __init__(self, reference_file="best_lap.json"):
@@ -14,12 +17,29 @@ class LapManager:
         self.best_lap_time = float('inf')  # Tiempo de la mejor vuelta (inicialmente infinito)
         self.last_lap_number = -1  # Número de la última vuelta
         self.reference_file = reference_file
-        self.current_lap_file = "current_lap.json"  # Archivo para la vuelta actual
-
-    def connect(self):
-        """Conecta a iRacing."""
-        if not self.connected and not self.ir.is_connected:
-            self.ir.startup()
+        # Diario de la vuelta actual (JSON Lines, una línea por tick, fsync periódico)
+        self.current_lap_file = "current_lap.jsonl"
+        self.journal = LapJournal(self.current_lap_file)
+        self.recover_current_lap()
+        # Comprueba en segundo plano si el simulador está en marcha (HTTP con timeout y backoff)
+        self.connection = irsdk.ConnectionManager()
+        # Ticks perdidos, latencia y tiempo de análisis por tick
+        self.metrics = CaptureMetrics()
+
+    def connect(self, timeout=0.0):
+        """
+        Atiende los cambios de estado del simulador de ConnectionManager (sin bloquear en HTTP):
+        desconecta si iRacing se cierra y conecta en cuanto está en marcha. Sin conexión espera
+        hasta timeout s al siguiente cambio.
+        """
+        self.connection.start()
+        event = self.connection.next_event(0 if self.connected else timeout)
+        while event is not None:
+            if not event.running:
+                self.disconnect()
+            event = self.connection.next_event(0)
+        if not self.connected and self.connection.running.is_set():
+            self.ir.startup(check_sim_status=False)
             self.connected = self.ir.is_connected
             if self.connected:
                 print("Conectado a iRacing.")
@@ -32,6 +52,7 @@ class LapManager:
             self.ir.shutdown()
             self.connected = False
             print("Desconectado de iRacing.")
+            print(self.metrics.report())
 
     def load_reference_lap(self, filename):
         """Carga los datos de la mejor vuelta desde un archivo JSON."""
@@ -45,11 +66,22 @@ class LapManager:
             print(f"No se encontró el archivo de referencia {filename}. Creando uno nuevo.")
             return []
 
+    def recover_current_lap(self):
+        """
+        Si el programa se cortó a mitad de vuelta, recupera del diario los datos de esa vuelta
+        y sigue añadiendo a partir de ahí.
+        """
+        self.current_lap_data = self.journal.recover()
+        if self.current_lap_data:
+            self.last_lap_number = self.current_lap_data[-1]["Lap"]
+            self.current_lap_start_time = self.current_lap_data[0]["SessionTime"]
+            print(f"Recuperados {len(self.current_lap_data)} datos de la vuelta {self.last_lap_number} desde {self.current_lap_file}.")
+        self.journal.open(self.current_lap_data)
+
     def save_current_lap(self):
-        """Guarda los datos de la vuelta actual en un archivo JSON."""
+        """Lleva a disco el diario de la vuelta actual (cada tick ya se añade en analyze_telemetry)."""
         if self.current_lap_data:
-            with open(self.current_lap_file, 'w') as file:
-                json.dump(self.current_lap_data, file, indent=4)
+            self.journal.sync()
             print(f"Datos de la vuelta actual guardados en {self.current_lap_file}.")
         else:
             print("No hay datos de vuelta actual para guardar.")
@@ -119,18 +151,19 @@ class LapManager:
             }
 
             self.current_lap_data.append(data_point)
-            self.save_current_lap()  # Guardar continuamente la vuelta actual
+            self.journal.append(data_point)  # Guardar continuamente la vuelta actual (una línea)
 
             # Detectar cambio de vuelta usando `Lap`
             if data_point["Lap"] != self.last_lap_number:
                 lap_time = data_point["SessionTime"] - self.current_lap_start_time
                 print(f"Vuelta completada: Tiempo {lap_time:.2f}s")
 
-                # Guardar datos de la vuelta actual en `current_lap.json`
+                # Guardar datos de la vuelta actual en `current_lap.jsonl`
                 self.save_current_lap()
 
                 # Reiniciar para la nueva vuelta
                 self.current_lap_data = []
+                self.journal.reset()
                 self.current_lap_start_time = data_point["SessionTime"]
 
             # Comparar con la vuelta de referencia
@@ -144,17 +177,28 @@ class LapManager:
         print("Iniciando el asistente en tiempo real...")
         try:
             while True:
+                self.connect(timeout=0.5)
                 if not self.connected:
-                    self.connect()
-                if self.connected:
+                    continue
+                # Un análisis por cada tick nuevo de iRacing (sin sleep fijo)
+                # tick_latency se mide desde que ticks() vio el tick; process_time, solo el análisis
+                for tick in self.ir.ticks(timeout=1.0):
+                    self.metrics.tick_gap.observe(tick.dropped)
+                    start = time.perf_counter()
                     self.analyze_telemetry()
-                time.sleep(1 / 60)  # Frecuencia de actualización
+                    end = time.perf_counter()
+                    self.metrics.tick_latency.observe(end - tick.timestamp)
+                    self.metrics.process_time.observe(end - start)
+                if not self.ir.is_connected:
+                    self.disconnect()
         except KeyboardInterrupt:
             print("\nAsistente detenido.")
             print("Guardando la vuelta actual antes de salir...")
             self.save_current_lap()  # Guardar los datos al detener el programa
         finally:
             self.disconnect()
+            self.connection.stop()
+            self.journal.close()
 
 
 if __name__ == "__main__":
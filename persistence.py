@@ -0,0 +1,119 @@
+"""
+Escritura de archivos en segundo plano.
+
+PersistenceWriter recibe (ruta, objeto) desde el hilo de telemetría y en su propio hilo
+serializa y escribe de forma atómica (archivo temporal + fsync + os.replace), así un
+json.dump de varios MB nunca para la captura y un corte a mitad no deja el archivo roto.
+
+- Memoria acotada: como mucho max_pending archivos pendientes. Si se llena, submit()
+  espera (back-pressure) y ese tiempo se anota en metrics.
+- Una escritura nueva a una ruta que aún está pendiente sustituye a la anterior.
+- flush() espera a que todo esté en disco; close() hace flush y para el hilo.
+"""
+import json
+import os
+import threading
+import time
+
+from telemetry_metrics import Histogram, SECONDS_BUCKETS
+
+DEFAULT_MAX_PENDING = 4
+
+
+def json_serializer(obj):
+    return json.dumps(obj, indent=4).encode()
+
+
+def atomic_write(path, data):
+    """Escribe data (bytes) en path sin dejarlo nunca a medias."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class PersistenceMetrics:
+    """Contadores del escritor: cola, back-pressure y tiempo de escritura."""
+    def __init__(self):
+        self.submitted = 0
+        self.written = 0
+        self.replaced = 0   # escrituras pendientes sustituidas por una más nueva a la misma ruta
+        self.errors = 0
+        self.max_pending = 0
+        self.blocked = Histogram("persistence_blocked", SECONDS_BUCKETS, unit="s")
+        self.write_time = Histogram("persistence_write", SECONDS_BUCKETS, unit="s")
+
+    def report(self):
+        return (f"persistencia: {self.written}/{self.submitted} escritos, {self.replaced} sustituidos, "
+                f"{self.errors} errores, cola máx. {self.max_pending}\n"
+                f"{self.blocked.summary()}\n{self.write_time.summary()}")
+
+
+class PersistenceWriter:
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING):
+        self.max_pending = max_pending
+        self.metrics = PersistenceMetrics()
+        # ruta -> (objeto, serializador), en orden de llegada
+        self._pending = {}
+        self._writing = False
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="PersistenceWriter", daemon=True)
+        self._thread.start()
+
+    def submit(self, path, obj, serializer=json_serializer):
+        """
+        Encola la escritura de obj en path. El objeto no debe modificarse después
+        (se serializa más tarde en el hilo escritor).
+        """
+        with self._condition:
+            self.metrics.submitted += 1
+            if path in self._pending:
+                # Solo importa la versión más reciente
+                del self._pending[path]
+                self.metrics.replaced += 1
+            elif len(self._pending) >= self.max_pending:
+                start = time.perf_counter()
+                self._condition.wait_for(lambda: len(self._pending) < self.max_pending or self._stopped)
+                self.metrics.blocked.observe(time.perf_counter() - start)
+            self._pending[path] = (obj, serializer)
+            self.metrics.max_pending = max(self.metrics.max_pending, len(self._pending))
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Espera a que todo lo encolado esté escrito. Devuelve False si vence el timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def close(self, timeout=None):
+        self.flush(timeout)
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._stopped)
+                if not self._pending:
+                    return
+                path = next(iter(self._pending))
+                obj, serializer = self._pending.pop(path)
+                self._writing = True
+                self._condition.notify_all()
+
+            start = time.perf_counter()
+            try:
+                atomic_write(path, serializer(obj))
+                self.metrics.written += 1
+            except Exception as e:
+                self.metrics.errors += 1
+                print(f"Error guardando {path}: {e}")
+            self.metrics.write_time.observe(time.perf_counter() - start)
+
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
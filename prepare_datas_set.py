@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import glob
 import json
 import pandas as pd
 
+import irsdk
+from lap_store import LapStoreReader, STORE_SUFFIX
+
 # Variables esenciales (conducción + condiciones) que esperamos encontrar en cada muestra
 ESSENTIAL_VARS = [
     "session_time",
@@ -41,6 +45,23 @@ SETUP_VARS = [
 # Unimos ambas listas para procesarlas juntas
 ALL_VARS = ESSENTIAL_VARS + SETUP_VARS
 
+# Nombre de la variable de iRacing (en los .ibt) para cada una de nuestras columnas
+IBT_VARS = {
+    "session_time": "SessionTime",
+    "lap": "Lap",
+    "lap_dist_pct": "LapDistPct",
+    "speed": "Speed",
+    "throttle": "Throttle",
+    "brake": "Brake",
+    "lat_accel": "LatAccel",
+    "long_accel": "LongAccel",
+    "steering_angle": "SteeringWheelAngle",
+    "air_temp": "AirTemp",
+    "track_temp": "TrackTemp",
+    "fuel_level": "FuelLevel",
+    "fuel_level_pct": "FuelLevelPct",
+}
+
 def prepare_dataset(laps_dir="."):
     """
     Recorre los archivos 'lap_*.json' en 'laps_dir' para generar un DataFrame
@@ -93,10 +114,68 @@ def prepare_dataset(laps_dir="."):
 
     return df
 
+def prepare_dataset_ibt(ibt_file):
+    """
+    Igual que prepare_dataset, pero leyendo directamente un archivo .ibt de iRacing.
+    Las columnas se extraen vectorizadas (IBT.get_dataframe) sin recorrer los registros en Python.
+    """
+    ibt = irsdk.IBT()
+    ibt.open(ibt_file)
+    try:
+        # Las variables de setup (dc*, temperaturas...) tienen el mismo nombre en iRacing
+        ibt_vars = dict(IBT_VARS, **{var: var for var in SETUP_VARS})
+        df = ibt.get_dataframe(ibt_vars.values())
+        df = df.rename(columns={ir_var: var for var, ir_var in ibt_vars.items()})
+    finally:
+        ibt.close()
+
+    # Mismas unidades que en los lap_*.json
+    df["speed"] = df["speed"] * 3.6
+
+    # lap_time_est: tiempo entre la primera y la última muestra de cada vuelta
+    session_time_by_lap = df.groupby("lap")["session_time"]
+    df["lap_time_est"] = session_time_by_lap.transform("last") - session_time_by_lap.transform("first")
+
+    for var in ALL_VARS:
+        if var not in df.columns:
+            df[var] = None
+
+    cols_order = ["lap_time_est"] + ALL_VARS
+    return df[cols_order]
+
+
+def prepare_dataset_store(store_file):
+    """
+    Igual que prepare_dataset, pero leyendo una sesión del lap store (session_*.laps).
+    Cada canal se lee de una vez como columna, sin pasar por dicts.
+    """
+    reader = LapStoreReader(store_file)
+    try:
+        df = pd.DataFrame({key: reader.read(key) for key in reader.keys})
+    finally:
+        reader.close()
+    df = df.rename(columns={"LapDistPct": "lap_dist_pct"})
+
+    # lap_time_est: tiempo entre la primera y la última muestra de cada vuelta
+    session_time_by_lap = df.groupby("lap")["session_time"]
+    df["lap_time_est"] = session_time_by_lap.transform("last") - session_time_by_lap.transform("first")
+
+    for var in ALL_VARS:
+        if var not in df.columns:
+            df[var] = None
+
+    cols_order = ["lap_time_est"] + ALL_VARS
+    return df[cols_order]
+
 
 if __name__ == "__main__":
-    # 1) Cargar datos
-    df = prepare_dataset(".")
+    # 1) Cargar datos (de un .ibt o un .laps si se pasa como argumento, si no de los lap_*.json)
+    if len(sys.argv) > 1 and sys.argv[1].endswith(".ibt"):
+        df = prepare_dataset_ibt(sys.argv[1])
+    elif len(sys.argv) > 1 and sys.argv[1].endswith(STORE_SUFFIX):
+        df = prepare_dataset_store(sys.argv[1])
+    else:
+        df = prepare_dataset(".")
     # 2) Echar un vistazo
     print("Primera filas del DataFrame:")
     print(df.head())
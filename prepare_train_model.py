@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import glob
 import json
 import numpy as np
@@ -12,31 +13,14 @@ from sklearn.metrics import mean_absolute_error, r2_score
 
 
 # -------------------------------------------------------------------------------------
-# 1) Definir qué variables queremos agregar y cómo (media, máx, mín, etc.)
+# 1) Qué variables agregamos y cómo (media, máx, mín, etc.): definido en lap_features.py,
+#    que calcula los mismos agregados durante la captura
 # -------------------------------------------------------------------------------------
-AGGREGATION_FUNCTIONS = {
-    # Variables típicas de conducción
-    "speed": ["mean", "max"],
-    "throttle": ["mean"],
-    "brake": ["mean"],
-    "lat_accel": ["mean", "max"],
-    "long_accel": ["mean", "min"],
-    # Si tienes SteeringWheelAngle, lo agregas
-    "steering_angle": ["mean"],
-
-    # Variables de setup (si existen)
-    "dcBrakeBias": ["mean"],   
-    "dcWingFront": ["mean"],
-    "dcWingRear": ["mean"],
-
-    # Variables ambientales (si existen por tick)
-    "track_temp": ["mean"],
-    "air_temp": ["mean"],
-
-    # Ejemplo: temperatura delantera izq (si en un tick venía como LFtempCL)
-    "LFtempCL": ["mean"],
-    # etc. para otras
-}
+from lap_features import AGGREGATION_FUNCTIONS, LapAggregator, FEATURES_FILE, read_lap_features
+
+import irsdk
+from prepare_datas_set import IBT_VARS
+
 
 # -------------------------------------------------------------------------------------
 # 2) Función para procesar UNA vuelta y obtener stats agregados
@@ -119,12 +103,73 @@ def build_laps_dataset(folder="."):
     return df
 
 
+def build_laps_dataset_ibt(ibt_file):
+    """
+    Igual que build_laps_dataset, pero leyendo directamente un archivo .ibt de iRacing.
+    Los canales se extraen vectorizados (IBT.get_dataframe) y las vueltas salen del índice de
+    vueltas del archivo (IBT.laps); solo entran las cronometradas (de línea a línea).
+    """
+    # Nombre en iRacing de cada canal a agregar (los de setup se llaman igual)
+    ibt_vars = {key: IBT_VARS.get(key, key) for key in AGGREGATION_FUNCTIONS}
+    ibt = irsdk.IBT()
+    ibt.open(ibt_file)
+    try:
+        df = ibt.get_dataframe(ibt_vars.values())
+        df = df.rename(columns={ir_var: key for key, ir_var in ibt_vars.items()})
+        laps = ibt.laps()
+    finally:
+        ibt.close()
+
+    # Mismas unidades que en los lap_*.json
+    if "speed" in df.columns:
+        df["speed"] = df["speed"] * 3.6
+    for col in AGGREGATION_FUNCTIONS.keys():
+        if col not in df.columns:
+            df[col] = np.nan
+
+    records = []
+    for lap in laps:
+        if lap["lap_time"] is None:
+            continue
+        df_lap = df.iloc[lap["start"]:lap["end"]]
+        row_dict = {}
+        for col, funcs in AGGREGATION_FUNCTIONS.items():
+            for func in funcs:
+                if func in ("mean", "max", "min"):
+                    row_dict[f"{col}_{func}"] = getattr(df_lap[col], func)(skipna=True)
+                else:
+                    row_dict[f"{col}_{func}"] = None
+        row_dict["lap_time_est"] = lap["lap_time"]
+        row_dict["filename"] = f"{os.path.basename(ibt_file)}:{lap['lap']}"
+        records.append(row_dict)
+
+    return pd.DataFrame(records)
+
+
+def build_features_dataset(folder="."):
+    """
+    DataFrame de vueltas a partir de las filas que LapManager calcula durante la captura
+    (FEATURES_FILE), sin releer cada lap_*.json. Vacío si no hay archivo.
+    """
+    rows = read_lap_features(os.path.join(folder, FEATURES_FILE))
+    if not rows:
+        return pd.DataFrame()
+    columns = LapAggregator().lap_columns() + ["lap_time_est", "filename"]
+    return pd.DataFrame(rows).reindex(columns=columns)
+
+
 # -------------------------------------------------------------------------------------
 # 4) Script principal: construye dataset, limpia missing, entrena y evalúa
 # -------------------------------------------------------------------------------------
 def main():
-    # 1) Construir dataset a nivel de vuelta
-    df = build_laps_dataset(".")
+    # 1) Construir dataset a nivel de vuelta: de un .ibt si se pasa como argumento, si no de
+    #    los agregados de la captura si los hay, y si tampoco, de los lap_*.json
+    if len(sys.argv) > 1 and sys.argv[1].endswith(".ibt"):
+        df = build_laps_dataset_ibt(sys.argv[1])
+    else:
+        df = build_features_dataset(".")
+        if df.empty:
+            df = build_laps_dataset(".")
     if df.empty:
         print("No se encontraron vueltas válidas en esta carpeta.")
         return
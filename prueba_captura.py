@@ -0,0 +1,102 @@
+"""
+Prueba de toda la cadena de captura sin iRacing (funciona en Linux):
+irsdk_producer.py reproduce capturas lap_*.json en un archivo con la memoria de irsdk,
+TelemetryApp(test_file=...) lo lee, TelemetryRecorder copia cada tick al ring buffer y
+update_gui (sin ventana) se lo pasa a LapManager.
+
+Uso:
+    python prueba_captura.py                          # lap_10.json lap_11.json lap_12.json
+    python prueba_captura.py lap_*.json --rate 360
+
+Los archivos que genera LapManager (session_*.laps, best_lap.json...) van a un directorio
+temporal, no al de trabajo.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from irsdk_producer import SharedMemoryProducer, load_capture_samples, replay, DEFAULT_SESSION_INFO, MAX_RATE
+from lap_manager_1 import TelemetryApp, LapManager, update_gui
+from lap_store import LapStoreReader
+from telemetry_metrics import CaptureMetrics
+from telemetry_recorder import TelemetryRingBuffer, TelemetryRecorder
+
+DEFAULT_FILES = ["lap_10.json", "lap_11.json", "lap_12.json"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce capturas por productor -> captura -> LapManager")
+    parser.add_argument("files", nargs="*", default=DEFAULT_FILES, help="capturas lap_*.json, en orden")
+    parser.add_argument("--rate", type=int, default=120, help=f"ticks por segundo (máx. {MAX_RATE})")
+    args = parser.parse_args()
+
+    files = [os.path.abspath(filename) for filename in args.files]
+    var_defs, samples = load_capture_samples(files)
+    if not samples:
+        print("No hay muestras que reproducir.")
+        return 1
+
+    workdir = tempfile.mkdtemp(prefix="prueba_captura_")
+    os.chdir(workdir)
+    test_file = os.path.join(workdir, "sim.bin")
+    producer = SharedMemoryProducer(test_file, var_defs, session_info=DEFAULT_SESSION_INFO.format(track_name="prueba"),
+                                    tick_rate=min(args.rate, MAX_RATE))
+    # Primer tick ya publicado al conectar (si no, se grabaría el buffer inicial, todo a 0)
+    producer.write_tick(samples[0])
+
+    app = TelemetryApp(test_file=test_file)
+    lap_manager = LapManager(os.path.join(workdir, "best_lap.json"))
+    ring = TelemetryRingBuffer()
+    metrics = CaptureMetrics()
+    recorder = TelemetryRecorder(app, ring, metrics)
+    stopped = threading.Event()
+    analysis = threading.Thread(target=update_gui, args=(None, app, lap_manager, ring, metrics, stopped), daemon=True)
+
+    # El análisis empieza a leer en el cursor actual del ring buffer: antes que el grabador
+    analysis.start()
+    recorder.start()
+    # Hasta que el grabador tenga el primer tick (con solo estar conectado, el replay podría
+    # sobrescribirlo antes de leerlo y no contaría ni como grabado ni como perdido)
+    while not ring.count:
+        time.sleep(0.01)
+
+    start = time.perf_counter()
+    ticks = 1 + replay(producer, samples[1:], rate=args.rate)
+    elapsed = time.perf_counter() - start
+
+    # Que el grabador y el análisis terminen con los últimos ticks antes de parar
+    deadline = time.perf_counter() + 5.0
+    while time.perf_counter() < deadline and (recorder.recorded_ticks + recorder.dropped_ticks < ticks
+                                               or metrics.process_time.count < ring.count):
+        time.sleep(0.05)
+    stopped.set()
+    analysis.join()
+    recorder.stop()
+    app.close()
+    producer.close()
+    lap_manager.close()
+
+    reader = LapStoreReader(lap_manager.store.path)
+    laps = reader.laps
+    reader.close()
+
+    print(f"\n{ticks} ticks publicados en {elapsed:.1f} s, {recorder.recorded_ticks} grabados "
+          f"({recorder.dropped_ticks} perdidos), {metrics.process_time.count} procesados por LapManager")
+    for lap in laps:
+        lap_time = f"{lap['lap_time']:.3f} s" if lap["lap_time"] is not None else "sin cronometrar"
+        print(f"  vuelta {lap['lap']}: {lap['end'] - lap['start']} muestras, {lap_time}")
+    print(metrics.report())
+    print(f"Archivos de la sesión en {workdir}")
+
+    # Los ticks perdidos dependen del ritmo y de la máquina (productor y captura comparten
+    # proceso aquí); lo que no puede faltar es ninguno de los grabados
+    ok = recorder.recorded_ticks + recorder.dropped_ticks == ticks and metrics.process_time.count == recorder.recorded_ticks
+    print("Todo correcto." if ok else "FALLO: ticks grabados sin procesar o cuenta de ticks incorrecta.")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
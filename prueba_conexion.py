@@ -0,0 +1,78 @@
+"""
+Comprobación de irsdk.ConnectionManager contra un sustituto local del estado HTTP del
+simulador (irsdk_producer.SimStatusServer), sin iRacing:
+  - simulador parado, luego en marcha, respuesta lenta (timeout) y servidor caído
+  - cada cambio de estado llega una vez por la cola events (next_event)
+  - con el simulador parado las comprobaciones se espacian (backoff exponencial)
+"""
+import sys
+import time
+
+import irsdk
+from irsdk_producer import SimStatusServer
+
+TIMEOUT = 0.2
+MIN_INTERVAL = 0.05
+MAX_INTERVAL = 0.4
+CHECK_INTERVAL = 0.05
+
+failures = 0
+
+
+def check(name, ok):
+    global failures
+    print(f"{'OK   ' if ok else 'FALLO'} {name}")
+    if not ok:
+        failures += 1
+
+
+def main():
+    status = SimStatusServer(running=False).start()
+    connection = irsdk.ConnectionManager(status.url, timeout=TIMEOUT, min_interval=MIN_INTERVAL,
+                                         max_interval=MAX_INTERVAL, check_interval=CHECK_INTERVAL)
+    connection.start()
+    try:
+        # Parado: no hay cambio de estado y las peticiones se espacian
+        check("simulador parado: sin eventos", connection.next_event(1.0) is None)
+        check("simulador parado: running sin activar", not connection.running.is_set())
+        requests = status.requests
+        time.sleep(1.0)
+        # Sin backoff serían ~1.0 / MIN_INTERVAL = 20 peticiones
+        check(f"backoff: {status.requests - requests} peticiones en 1 s", status.requests - requests <= 1.0 / MAX_INTERVAL + 1)
+
+        # En marcha: un evento running=True (puede tardar hasta MAX_INTERVAL en verse)
+        status.running = True
+        event = connection.next_event(MAX_INTERVAL + 1.0)
+        check("simulador en marcha: evento running=True", event is not None and event.running)
+        check("simulador en marcha: running activado", connection.running.is_set())
+        check("sin eventos repetidos mientras sigue en marcha", connection.next_event(0.3) is None)
+
+        # Respuesta más lenta que el timeout: cuenta como parado
+        status.delay = TIMEOUT * 2
+        event = connection.next_event(2.0)
+        check("respuesta lenta: evento running=False", event is not None and not event.running)
+        status.delay = 0.0
+        event = connection.next_event(MAX_INTERVAL + 1.0)
+        check("respuesta normal otra vez: evento running=True", event is not None and event.running)
+
+        # Servidor caído (iRacing cerrado)
+        status.stop()
+        status = None
+        event = connection.next_event(2.0)
+        check("servidor caído: evento running=False", event is not None and not event.running)
+
+        # stop() no se queda esperando al hilo
+        start = time.perf_counter()
+        connection.stop()
+        check("stop() inmediato", time.perf_counter() - start < TIMEOUT + MAX_INTERVAL)
+    finally:
+        connection.stop()
+        if status:
+            status.stop()
+
+    print("Todo correcto." if not failures else f"{failures} comprobaciones fallidas.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
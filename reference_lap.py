@@ -0,0 +1,269 @@
+"""
+ReferenceLap: vuelta de referencia precompilada para comparar en cada tick.
+
+Se construye una sola vez (al cargar best_lap.json o al hacer una vuelta mejor):
+arrays numpy por canal ordenados por LapDistPct, con un punto extra a cada lado para
+cruzar la línea de meta (1.0 -> 0.0). Interpolar un punto es una búsqueda binaria
+(searchsorted) y una operación sobre un vector, en lugar de ordenar y recorrer la lista
+de dicts en cada tick.
+
+Además se precalcula todo sobre una rejilla fija de LapDistPct (GRID_SIZE celdas) y el
+tiempo transcurrido en la vuelta, para consultas O(1) (un solo cálculo de índice):
+- lookup(pct): canales de la referencia en esa celda
+- elapsed_at(pct): tiempo que llevaba la referencia en ese punto -> delta de tiempo en vivo
+- pct_at(elapsed): dónde estaba la referencia a ese tiempo -> diferencia de posición
+
+ReferenceSet apila las rejillas de varias referencias (mejor vuelta, última vuelta, la de un
+compañero, una importada...) en un solo array, así comparar con todas es una única consulta
+vectorizada por tick y añadir referencias apenas cuesta nada.
+"""
+import json
+import os
+
+import numpy as np
+
+# Canales que se interpolan para comparar con la vuelta actual
+INTERP_KEYS = ("speed", "brake", "throttle", "lat_accel", "long_accel", "steering_angle")
+
+# Celdas de la rejilla de distancia y paso de la rejilla de tiempo (s)
+GRID_SIZE = 10000
+TIME_STEP = 0.01
+
+
+class ReferenceLap:
+    def __init__(self, lap_dist_pct, channels, lap_time=None, session_time=None, lap=None):
+        """
+        lap_dist_pct: array con LapDistPct de cada muestra.
+        channels: dict clave -> array (mismo orden que lap_dist_pct); NaN se trata como 0.0.
+        session_time / lap: arrays opcionales para la curva de tiempo transcurrido (delta).
+        """
+        self.lap_time = lap_time
+        self.keys = tuple(channels)
+
+        pct = np.asarray(lap_dist_pct, dtype=np.float64)
+        elapsed_curve = None
+        if session_time is not None:
+            elapsed_curve = _elapsed_curve(pct, np.asarray(session_time, dtype=np.float64),
+                                           None if lap is None else np.asarray(lap, dtype=np.float64))
+        values = np.array([np.asarray(channels[key], dtype=np.float64) for key in self.keys]).reshape(len(self.keys), len(pct))
+        valid = ~np.isnan(pct)
+        pct, values = pct[valid], np.nan_to_num(values[:, valid])
+
+        order = np.argsort(pct, kind="stable")
+        pct, values = pct[order], values[:, order]
+        self.size = len(pct)
+
+        if self.size:
+            # Vuelta cerrada: el último punto antes de 0.0 y el primero después de 1.0
+            pct = np.concatenate(([pct[-1] - 1.0], pct, [pct[0] + 1.0]))
+            values = np.concatenate((values[:, -1:], values, values[:, :1]), axis=1)
+        self.lap_dist_pct = pct
+        self.values = values
+
+        # Rejilla de distancia: canales en el centro de cada celda
+        self.grid = self.interpolate_many((np.arange(GRID_SIZE) + 0.5) / GRID_SIZE) if self.size else None
+
+        # Curva de tiempo: tiempo transcurrido por celda y posición por paso de tiempo
+        self.elapsed_grid = None
+        self.pct_grid = None
+        self.duration = None
+        if elapsed_curve is not None:
+            curve_pct, curve_elapsed = elapsed_curve
+            self.duration = float(curve_elapsed[-1])
+            self.elapsed_grid = np.interp((np.arange(GRID_SIZE) + 0.5) / GRID_SIZE, curve_pct, curve_elapsed)
+            self.pct_grid = np.interp(np.arange(0.0, self.duration + TIME_STEP, TIME_STEP), curve_elapsed, curve_pct)
+
+    @classmethod
+    def from_dicts(cls, lap_data, lap_time=None, keys=INTERP_KEYS):
+        """A partir de una lista de dicts (el lap_data de nuestros JSON)."""
+        def column(key):
+            return np.array([data.get(key) for data in lap_data], dtype=np.float64)
+        return cls(column("LapDistPct"), {key: column(key) for key in keys}, lap_time,
+                   session_time=column("session_time"), lap=column("lap"))
+
+    @classmethod
+    def from_buffer(cls, buffer, lap_time=None, keys=INTERP_KEYS):
+        """A partir de un LapBuffer (sin pasar por dicts)."""
+        return cls(buffer["LapDistPct"], {key: buffer[key] for key in keys if key in buffer}, lap_time,
+                   session_time=buffer["session_time"] if "session_time" in buffer else None,
+                   lap=buffer["lap"] if "lap" in buffer else None)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Carga un JSON con el formato de best_lap.json ({"lap_time", "lap_data"}).
+        Devuelve None si no existe o no se puede leer.
+        """
+        if not os.path.exists(filename):
+            print(f"No se encontró {filename}. Iniciando sin referencia.")
+            return None
+
+        try:
+            with open(filename, 'r') as file:
+                data = json.load(file)
+            return cls.from_dicts(data.get("lap_data", []), data.get("lap_time"))
+        except Exception as e:
+            print(f"Error cargando {filename}: {e}")
+            return None
+
+    def __len__(self):
+        return self.size
+
+    def interpolate(self, position):
+        """Valores de la referencia interpolados en LapDistPct = position (dict, o None si está vacía)."""
+        if not self.size:
+            return None
+        position = position % 1.0
+        pct = self.lap_dist_pct
+        i = int(np.searchsorted(pct, position, side="right"))
+        i = min(max(i, 1), len(pct) - 1)
+        lo, hi = pct[i - 1], pct[i]
+        ratio = (position - lo) / (hi - lo) if hi > lo else 0.0
+        values = self.values[:, i - 1] + (self.values[:, i] - self.values[:, i - 1]) * ratio
+
+        interp = dict(zip(self.keys, values.tolist()))
+        interp["LapDistPct"] = position
+        return interp
+
+    def interpolate_many(self, positions):
+        """Canales interpolados en varias posiciones a la vez: array [canal, posición]."""
+        positions = np.asarray(positions, dtype=np.float64) % 1.0
+        return np.array([np.interp(positions, self.lap_dist_pct, column) for column in self.values])
+
+    def lookup(self, position):
+        """Canales de la referencia en la celda de la rejilla de position (dict, O(1))."""
+        if self.grid is None:
+            return None
+        values = self.grid[:, int(position % 1.0 * GRID_SIZE)]
+        return dict(zip(self.keys, values.tolist()))
+
+    def elapsed_at(self, position):
+        """Tiempo transcurrido de la referencia al pasar por position (None si no hay curva de tiempo)."""
+        if self.elapsed_grid is None:
+            return None
+        return float(self.elapsed_grid[int(position % 1.0 * GRID_SIZE)])
+
+    def pct_at(self, elapsed):
+        """LapDistPct de la referencia a los elapsed segundos de vuelta (None si no hay curva de tiempo)."""
+        if self.pct_grid is None:
+            return None
+        i = min(max(int(elapsed / TIME_STEP), 0), len(self.pct_grid) - 1)
+        return float(self.pct_grid[i])
+
+
+def _elapsed_curve(pct, session_time, lap=None):
+    """
+    Tiempo transcurrido desde la línea de meta en función de LapDistPct, de 0.0 a 1.0.
+    Solo usa las muestras de la vuelta principal (las sueltas de la vuelta anterior/siguiente
+    se descartan) y extrapola los cruces de la línea con las dos muestras más cercanas.
+    Devuelve (pct, elapsed) crecientes, o None si no hay datos suficientes.
+    """
+    valid = ~np.isnan(pct) & ~np.isnan(session_time)
+    if lap is not None:
+        laps, counts = np.unique(lap[valid & ~np.isnan(lap)], return_counts=True)
+        if len(laps):
+            valid &= lap == laps[np.argmax(counts)]
+    order = np.argsort(session_time[valid], kind="stable")
+    pct, session_time = pct[valid][order], session_time[valid][order]
+    if len(pct) < 2:
+        return None
+
+    def crossing(p0, p1, t0, t1, target):
+        return t0 + (target - p0) * (t1 - t0) / (p1 - p0) if p1 > p0 else t0
+
+    start = crossing(pct[0], pct[1], session_time[0], session_time[1], 0.0)
+    end = crossing(pct[-2], pct[-1], session_time[-2], session_time[-1], 1.0)
+    curve_pct = np.concatenate(([0.0], pct, [1.0]))
+    curve_elapsed = np.concatenate(([start], session_time, [end])) - start
+    # LapDistPct puede repetirse (coche parado): ambos ejes tienen que ser no decrecientes
+    return np.maximum.accumulate(curve_pct), np.maximum.accumulate(curve_elapsed)
+
+
+class ReferenceSet:
+    def __init__(self, keys=INTERP_KEYS):
+        """
+        keys: canales a comparar, en el orden de los valores que se pasan a compare().
+        Las columnas del resultado (fields) son {key}_diff de cada canal, time_delta,
+        projected_lap_time y position_diff.
+        """
+        self.keys = tuple(keys)
+        self.fields = tuple(f"{key}_diff" for key in self.keys) + ("time_delta", "projected_lap_time", "position_diff")
+        self._references = {}
+        self._stack()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._references
+
+    def get(self, name):
+        return self._references.get(name)
+
+    def set(self, name, reference):
+        """Añade o sustituye la referencia name (una ReferenceLap; None la quita)."""
+        if reference is None:
+            self._references.pop(name, None)
+        else:
+            self._references[name] = reference
+        self._stack()
+
+    def remove(self, name):
+        self.set(name, None)
+
+    def index(self, name):
+        """Fila de name en el resultado de compare()."""
+        return self.names.index(name)
+
+    def _stack(self):
+        """
+        Rejillas de todas las referencias en arrays contiguos por celda:
+          _grid[celda, referencia, canal] (el último canal es el tiempo transcurrido)
+          _pct_grid[paso de tiempo, referencia]
+        Las referencias sin canal o sin curva de tiempo quedan NaN en esas columnas.
+        """
+        references = [reference for reference in self._references.values() if reference.grid is not None]
+        self.names = tuple(name for name, reference in self._references.items() if reference.grid is not None)
+        count = len(references)
+        channels = len(self.keys)
+
+        self._grid = np.full((GRID_SIZE, count, channels + 1), np.nan)
+        self._duration = np.full(count, np.nan)
+        time_steps = max([len(reference.pct_grid) for reference in references if reference.pct_grid is not None] or [1])
+        self._pct_grid = np.full((time_steps, count), np.nan)
+
+        for i, reference in enumerate(references):
+            for j, key in enumerate(self.keys):
+                if key in reference.keys:
+                    self._grid[:, i, j] = reference.grid[reference.keys.index(key)]
+            if reference.elapsed_grid is not None:
+                self._grid[:, i, channels] = reference.elapsed_grid
+                self._duration[i] = reference.duration
+                # Pasado el final de la vuelta, la referencia se queda en la línea de meta
+                self._pct_grid[:, i] = reference.pct_grid[-1]
+                self._pct_grid[:len(reference.pct_grid), i] = reference.pct_grid
+
+    def compare(self, position, values, elapsed=None, out=None):
+        """
+        Compara una muestra con todas las referencias a la vez.
+        position: LapDistPct actual; values: valores actuales de keys (en ese orden);
+        elapsed: tiempo de la vuelta actual (None si no se cronometra: columnas de tiempo NaN).
+        Devuelve un array [referencia, campo] con filas en el orden de names.
+        """
+        channels = len(self.keys)
+        if out is None:
+            out = np.empty((len(self.names), len(self.fields)))
+        cell = self._grid[int(position % 1.0 * GRID_SIZE)]
+
+        np.subtract(values, cell[:, :channels], out=out[:, :channels])
+        if elapsed is None:
+            out[:, channels:] = np.nan
+            return out
+
+        time_delta = out[:, channels]
+        np.subtract(elapsed, cell[:, channels], out=time_delta)
+        np.add(self._duration, time_delta, out=out[:, channels + 1])
+        step = min(max(int(elapsed / TIME_STEP), 0), len(self._pct_grid) - 1)
+        np.subtract(position, self._pct_grid[step], out=out[:, channels + 2])
+        out[:, channels + 2] *= 100
+        return out
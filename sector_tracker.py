@@ -0,0 +1,128 @@
+"""
+SectorTracker: tiempos por sector en vivo, mientras se rueda.
+
+En cada tick solo se mira si se ha pasado el siguiente límite de sector (O(1)); el momento
+del paso se interpola entre las dos muestras, igual que el cruce de meta. Se guardan los
+mejores parciales de la sesión por sector y la vuelta teórica (suma de los mejores) se
+actualiza sumando la mejora, sin recorrer nada.
+
+Un sector solo cuenta si se ha visto entero: el primero en el que se entra a mitad
+(al arrancar o al salir del garaje) o en el que LapDistPct salta hacia atrás se descarta.
+"""
+from collections import namedtuple
+
+# Sectores de Tsukuba, ejemplo ficticio (ajusta porcentajes reales)
+SECTORS = {
+    "sector1": (0.00, 0.33),  # LapDistPct de 0% a 33%
+    "sector2": (0.33, 0.66),  # 33% a 66%
+    "sector3": (0.66, 1.00)   # 66% a 100%
+}
+
+# Retroceso de LapDistPct que se tolera (ruido) antes de dar el sector por perdido
+BACKWARD_TOLERANCE = 0.01
+
+SectorSplit = namedtuple("SectorSplit", "sector name time best_time is_best")
+
+
+def crossing_time(time_before, pct_before, time_after, pct_after, target):
+    """Momento en que LapDistPct pasó por target entre dos muestras (interpolación lineal)."""
+    if pct_after <= pct_before:
+        return time_after
+    ratio = (target - pct_before) / (pct_after - pct_before)
+    return time_before + (time_after - time_before) * min(max(ratio, 0.0), 1.0)
+
+
+class SectorTracker:
+    def __init__(self, sectors=SECTORS):
+        self.names = tuple(sectors)
+        # Límites de fin de cada sector salvo el último (que termina en la línea de meta)
+        self.boundaries = tuple(end for _, end in list(sectors.values())[:-1])
+
+        self.sector = None              # índice del sector actual (None hasta saberlo)
+        self.sector_start_time = None   # None si el sector actual no se ha visto desde el inicio
+        self.splits = [None] * len(self.names)       # parciales de la vuelta en curso
+        self.best_splits = [None] * len(self.names)  # mejores parciales de la sesión
+
+        # Vuelta teórica: suma de best_splits, válida cuando todos los sectores tienen tiempo
+        self._best_sum = 0.0
+        self._best_count = 0
+
+    @property
+    def theoretical_best(self):
+        """Suma de los mejores parciales de la sesión (None si falta algún sector)."""
+        if self._best_count < len(self.names):
+            return None
+        return self._best_sum
+
+    def sector_at(self, pct):
+        """Índice del sector que contiene LapDistPct = pct."""
+        for i, boundary in enumerate(self.boundaries):
+            if pct < boundary:
+                return i
+        return len(self.boundaries)
+
+    def start_lap(self, time, timed=True):
+        """
+        Nueva vuelta: empieza el primer sector en time, desde la línea. Con timed=False (cambio
+        de vuelta sin cruzar la meta: reset, grúa, salida de boxes) se sigue como un arranque a
+        mitad de vuelta y el sector en el que se aparece no cuenta.
+        """
+        self.sector = 0 if timed else None
+        self.sector_start_time = time if timed else None
+        self.splits = [None] * len(self.names)
+
+    def update(self, time_before, pct_before, time, pct):
+        """
+        Avanza con una muestra nueva (sin cambio de vuelta). Devuelve la lista de SectorSplit
+        de los sectores completados en este tick (normalmente vacía).
+        """
+        if self.sector is None:
+            # Arranque a mitad de vuelta: el sector actual no cuenta
+            self.sector = self.sector_at(pct)
+            return []
+
+        if pct < pct_before - BACKWARD_TOLERANCE:
+            # Salto atrás (reset, garaje...): este sector ya no es comparable
+            self.sector = self.sector_at(pct)
+            self.sector_start_time = None
+            return []
+
+        completed = []
+        while self.sector < len(self.boundaries) and pct >= self.boundaries[self.sector]:
+            end_time = crossing_time(time_before, pct_before, time, pct, self.boundaries[self.sector])
+            split = self._finish_sector(end_time)
+            if split is not None:
+                completed.append(split)
+        return completed
+
+    def finish_lap(self, time):
+        """
+        Cruce de meta: cierra el último sector en time. Devuelve su SectorSplit (o None si no
+        se pudo cronometrar); luego hay que llamar a start_lap().
+        """
+        if self.sector != len(self.boundaries):
+            # Se han saltado sectores (p. ej. por boxes): no cerramos nada
+            self.sector = None
+            return None
+        return self._finish_sector(time)
+
+    def _finish_sector(self, end_time):
+        sector = self.sector
+        start_time = self.sector_start_time
+        self.sector += 1
+        self.sector_start_time = end_time
+        if start_time is None:
+            return None
+
+        split_time = end_time - start_time
+        self.splits[sector] = split_time
+        best = self.best_splits[sector]
+        is_best = best is None or split_time < best
+        if is_best:
+            if best is None:
+                self._best_count += 1
+                self._best_sum += split_time
+            else:
+                self._best_sum += split_time - best
+            self.best_splits[sector] = split_time
+        return SectorSplit(sector, self.names[sector], split_time, self.best_splits[sector], is_best)
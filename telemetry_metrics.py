@@ -0,0 +1,139 @@
+"""
+Contadores del bucle de captura: histogramas baratos en proceso.
+
+- tick_gap:      ticks de iRacing perdidos entre dos ticks procesados (0 = ninguno)
+- tick_latency:  segundos desde que el tick aparece hasta que LapManager lo procesa
+- process_time:  segundos dentro de process_telemetry_data por tick
+
+Se pueden imprimir (CaptureMetrics.report) o leer desde fuera: as_dict() para volcarlos
+a JSON y prometheus_text() / start_metrics_server() para que los recoja un scraper.
+"""
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Límites superiores de los buckets (el último bucket es "+Inf")
+SECONDS_BUCKETS = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+TICKS_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 60, 120, 600)
+
+METRICS_PORT = 9108
+
+
+class Histogram:
+    """
+    Histograma de buckets fijos. observe() es O(log buckets) y no reserva memoria;
+    pensado para un único hilo escritor y lectores que solo consultan.
+    """
+    def __init__(self, name, bounds, unit=""):
+        self.name = name
+        self.bounds = tuple(bounds)
+        self.unit = unit
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """Estimación del percentil q (0-1): límite superior del bucket donde cae."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds, self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.mean,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "buckets": dict(zip([str(bound) for bound in self.bounds] + ["+Inf"], self.counts)),
+        }
+
+    def summary(self):
+        scale, unit = (1000, " ms") if self.unit == "s" else (1, " " + self.unit if self.unit else "")
+        values = [("media", self.mean), ("p50", self.percentile(0.5)), ("p99", self.percentile(0.99)), ("max", self.max)]
+        return f"{self.name}: n={self.count} " + " ".join(f"{label}={value * scale:.2f}{unit}" for label, value in values)
+
+    def prometheus_text(self, prefix="telemetry_"):
+        name = prefix + self.name + ("_seconds" if self.unit == "s" else "")
+        lines = [f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds, self.counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+        return "\n".join(lines)
+
+
+class CaptureMetrics:
+    """Los tres histogramas del bucle de captura, compartidos por el grabador y el análisis."""
+    def __init__(self):
+        self.tick_gap = Histogram("tick_gap", TICKS_BUCKETS, unit="ticks")
+        self.tick_latency = Histogram("tick_latency", SECONDS_BUCKETS, unit="s")
+        self.process_time = Histogram("process_time", SECONDS_BUCKETS, unit="s")
+
+    @property
+    def histograms(self):
+        return (self.tick_gap, self.tick_latency, self.process_time)
+
+    @property
+    def missed_ticks(self):
+        return int(self.tick_gap.sum)
+
+    def reset(self):
+        for histogram in self.histograms:
+            histogram.reset()
+
+    def as_dict(self):
+        return {histogram.name: histogram.as_dict() for histogram in self.histograms}
+
+    def report(self):
+        return "\n".join(histogram.summary() for histogram in self.histograms)
+
+    def prometheus_text(self):
+        return "\n".join(histogram.prometheus_text() for histogram in self.histograms) + "\n"
+
+
+def start_metrics_server(metrics, port=METRICS_PORT, host="127.0.0.1"):
+    """Sirve metrics.prometheus_text() en http://host:port/metrics desde un hilo daemon."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+    return server
@@ -0,0 +1,163 @@
+"""
+Captura de telemetría a ritmo completo, separada de la GUI.
+
+TelemetryRecorder corre en su propio hilo y copia cada tick nuevo de iRacing en un
+TelemetryRingBuffer: un buffer circular columnar preasignado (un array numpy por canal,
+sin dicts por tick), indexado por tick_count. El análisis de vueltas y la GUI leen de él
+cada uno a su ritmo con su propio cursor, así un frame lento de Tkinter ya no pierde muestras.
+"""
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from telemetry_vars import TELEMETRY_KEYS
+from lap_buffer import rows_as_dicts
+
+# 5 minutos a 60 Hz
+DEFAULT_CAPACITY = 60 * 60 * 5
+
+# Bloque de muestras devuelto por TelemetryRingBuffer.read_since
+RingBlock = namedtuple("RingBlock", "cursor lost tick_counts timestamps columns")
+
+
+class TelemetryRingBuffer:
+    """
+    Buffer circular de muestras: columns[canal, slot] (float64, None se guarda como NaN),
+    tick_counts[slot] y timestamps[slot] (time.perf_counter() cuando apareció el tick).
+    Un único escritor (append) y cualquier número de lectores (read_since), cada uno con
+    su cursor = número total de muestras que ya ha leído.
+    """
+    def __init__(self, keys=TELEMETRY_KEYS, capacity=DEFAULT_CAPACITY):
+        self.keys = tuple(keys)
+        self.capacity = capacity
+        self.columns = np.full((len(self.keys), capacity), np.nan)
+        self.tick_counts = np.zeros(capacity, dtype=np.int64)
+        self.timestamps = np.zeros(capacity)
+        # Muestras escritas desde el principio (cursor del escritor)
+        self.count = 0
+        self._condition = threading.Condition()
+
+    def append(self, tick_count, values, timestamp):
+        """Copia una muestra (valores en el orden de keys) en el siguiente slot."""
+        slot = self.count % self.capacity
+        self.columns[:, slot] = values
+        self.tick_counts[slot] = tick_count
+        self.timestamps[slot] = timestamp
+        # Se publica después de escribir: los lectores nunca ven un slot a medias
+        with self._condition:
+            self.count += 1
+            self._condition.notify_all()
+
+    def wait(self, cursor, timeout=None):
+        """Espera a que haya muestras posteriores a cursor. Devuelve True si las hay."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.count > cursor, timeout)
+
+    def read_since(self, cursor):
+        """
+        Copia las muestras escritas desde cursor.
+        Devuelve un RingBlock(nuevo cursor, muestras perdidas, tick_counts, timestamps,
+        columns[canal, muestra]).
+        Si el lector se ha quedado atrás más que la capacidad, las más antiguas se pierden.
+        La copia se hace sin bloquear al escritor: al terminar se vuelve a mirar count y se
+        descartan (como perdidas) las muestras cuyo slot pudo sobrescribirse mientras tanto.
+        """
+        end = self.count
+        start = max(cursor, end - self.capacity + 1)
+        slots = np.arange(start, end) % self.capacity
+        tick_counts, timestamps, columns = self.tick_counts[slots], self.timestamps[slots], self.columns[:, slots]
+        # Con count = c el escritor puede estar escribiendo la muestra c, que pisa la c - capacity
+        valid_start = max(start, self.count - self.capacity + 1)
+        if valid_start > start:
+            skip = min(valid_start, end) - start
+            tick_counts, timestamps, columns = tick_counts[skip:], timestamps[skip:], columns[:, skip:]
+            start += skip
+        return RingBlock(end, start - cursor, tick_counts, timestamps, columns)
+
+    def latest(self):
+        """Última muestra como dict (o None si aún no hay ninguna)."""
+        end = self.count
+        if not end:
+            return None
+        return next(self.rows(self.read_since(end - 1).columns), None)
+
+    def rows(self, columns):
+        """Recorre un bloque de read_since como dicts {clave: valor}, NaN -> None."""
+        return rows_as_dicts(self.keys, columns)
+
+
+class TelemetryRecorder:
+    """
+    Hilo de captura: conecta con iRacing (vía TelemetryApp) y en cada tick lee las variables
+    con el lector precompilado y las añade al ring buffer. No hace nada más, para no perder ticks.
+    Si recibe metrics (CaptureMetrics) anota en tick_gap los ticks perdidos antes de cada tick.
+    """
+    def __init__(self, app, ring, metrics=None):
+        self.app = app
+        self.ring = ring
+        self.metrics = metrics
+        # Ticks grabados y ticks del simulador que nunca llegaron al ring buffer (huecos entre
+        # tick_counts grabados)
+        self.recorded_ticks = 0
+        self.dropped_ticks = 0
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def loss_rate(self):
+        """Fracción de ticks del simulador que el grabador no llegó a copiar."""
+        total = self.recorded_ticks + self.dropped_ticks
+        return self.dropped_ticks / total if total else 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="TelemetryRecorder", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        app = self.app
+        ring = self.ring
+        tick_gap = self.metrics.tick_gap if self.metrics else None
+        last_tick_count = None
+        while not self._stopped.is_set():
+            # Sin conexión, connect() espera al siguiente cambio de estado del simulador
+            # (sin HTTP en este hilo)
+            app.connect(timeout=0.5)
+            if not app.connected:
+                continue
+
+            # El tick solo despierta al bucle: la muestra se guarda con el tick_count del buffer
+            # del que se leyó, que puede ser ya el siguiente si el simulador publicó entretanto
+            # (entonces el siguiente tick ya está grabado y se salta)
+            for _ in app.ticks():
+                timestamp = time.perf_counter()
+                tick_count, values = app.read_telemetry_tick()
+                if values is not None and tick_count != last_tick_count:
+                    dropped = 0
+                    if last_tick_count is not None and tick_count > last_tick_count:
+                        dropped = tick_count - last_tick_count - 1
+                    self.dropped_ticks += dropped
+                    if tick_gap is not None:
+                        tick_gap.observe(dropped)
+                    ring.append(tick_count, values, timestamp)
+                    self.recorded_ticks += 1
+                    last_tick_count = tick_count
+                if self._stopped.is_set():
+                    break
+
+            # Sin ticks nuevos durante un rato: ¿se ha cerrado iRacing?
+            if not app.ir.is_connected:
+                last_tick_count = None
+                app.disconnect()
+                print(f"Ticks grabados: {self.recorded_ticks}, pérdida: {self.loss_rate:.2%}")
+                if self.metrics:
+                    print(self.metrics.report())
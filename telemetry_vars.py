@@ -0,0 +1,47 @@
+# Variables de telemetría que capturamos en cada tick.
+# Compartido por la captura en vivo (lap_manager_1.py) y las herramientas que leen/escriben
+# nuestras vueltas (lap_*.json) en formato irsdk.
+
+# Variables leídas en cada tick: clave en nuestro dict -> variable de iRacing
+TELEMETRY_VARS = {
+    "speed": 'Speed',                    # m/s (se convierte a km/h)
+    "gear": 'Gear',
+    "lat_accel": 'LatAccel',
+    "long_accel": 'LongAccel',
+    "steering_angle": 'SteeringWheelAngle',
+    "LapDistPct": 'LapDistPct',          # Progreso en la vuelta (%)
+    "lap": 'Lap',                        # Número de vuelta actual
+    "throttle": 'Throttle',
+    "brake": 'Brake',
+    "session_time": 'SessionTime',
+    "air_temp": 'AirTemp',               # Temperatura ambiente
+    "track_temp": 'TrackTemp',           # Temperatura de la pista
+    "fuel_level": 'FuelLevel',           # Nivel de combustible
+    "fuel_level_pct": 'FuelLevelPct',    # Porcentaje de combustible
+    "dcBrakeBias": 'dcBrakeBias',        # Sesgo del freno
+    "dcWingFront": 'dcWingFront',        # Ángulo del ala delantera
+    "dcWingRear": 'dcWingRear',          # Ángulo del ala trasera
+    "dcAntiRollFront": 'dcAntiRollFront', # Configuración del estabilizador delantero
+    "dcAntiRollRear": 'dcAntiRollRear',  # Configuración del estabilizador trasero
+    "LFtempL": 'LFtempL',                # Temperatura del neumático delantero izquierdo (Exterior)
+    "LFtempM": 'LFtempM',                # Temperatura del neumático delantero izquierdo (Centro)
+    "LFtempR": 'LFtempR',                # Temperatura del neumático delantero izquierdo (Interior)
+    "RFtempL": 'RFtempL',                # Temperatura del neumático delantero derecho (Exterior)
+    "RFtempM": 'RFtempM',                # Temperatura del neumático delantero derecho (Centro)
+    "RFtempR": 'RFtempR',                # Temperatura del neumático delantero derecho (Interior)
+    "LRtempL": 'LRtempL',                # Temperatura del neumático trasero izquierdo (Exterior)
+    "LRtempM": 'LRtempM',                # Temperatura del neumático trasero izquierdo (Centro)
+    "LRtempR": 'LRtempR',                # Temperatura del neumático trasero izquierdo (Interior)
+    "RRtempL": 'RRtempL',                # Temperatura del neumático trasero derecho (Exterior)
+    "RRtempM": 'RRtempM',                # Temperatura del neumático trasero derecho (Centro)
+    "RRtempR": 'RRtempR',                # Temperatura del neumático trasero derecho (Interior)
+    "LFpressure": 'LFpressure',          # Presión del neumático delantero izquierdo
+    "RFpressure": 'RFpressure',          # Presión del neumático delantero derecho
+    "LRpressure": 'LRpressure',          # Presión del neumático trasero izquierdo
+    "RRpressure": 'RRpressure',          # Presión del neumático trasero derecho
+    "yaw_north": 'YawNorth',             # Rumbo respecto al norte (rad), para el mapa del circuito
+}
+TELEMETRY_KEYS = tuple(TELEMETRY_VARS)
+
+# Variables enteras (el resto son float; en los buffers numéricos todo se guarda como float)
+INT_KEYS = ("gear", "lap")
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Mapa del circuito: trazada x/y (metros) y desviación lateral respecto a la de referencia.
+
+- racing_line() reconstruye la trazada de una vuelta: con Lat/Lon si están (proyección local),
+  si no integrando speed con el rumbo (YawNorth, o a falta de él, integrando lat_accel / v).
+  Al integrar, el error de cierre de la vuelta se reparte a lo largo de ella. Lat/Lon solo
+  existen en los .ibt (en vivo no): no se capturan, se leen al cargar un .ibt (_load_laps).
+- TrackMap guarda la trazada de referencia con un índice espacial: rejilla de celdas de
+  CELL_SIZE m con los segmentos a menos de MAX_DEVIATION de cada celda (formato CSR). La
+  desviación de un punto es la distancia con signo (+ izquierda) al segmento más cercano de su
+  celda: unos µs por tick con deviation(), o todas las muestras de golpe con deviation_many().
+- Sin GPS, la posición de una vuelta se estima sobre la referencia con YawNorth: el punto con
+  el mismo LapDistPct más el desplazamiento lateral integrado (ds · sin(rumbo - rumbo de la
+  referencia)), desde 0 en la línea de meta. El mapa guarda el rumbo de la referencia tal como
+  se midió (no la tangente de la trazada), así el deslizamiento común de los dos se cancela;
+  una vuelta comparada consigo misma no da 0 exacto, queda el error de la rejilla de LapDistPct.
+  Sin GPS ni YawNorth no hay desviación (None / NaN): el rumbo integrado de lat_accel deriva
+  10-15 m en una vuelta, más que lo que se quiere medir. TrackPosition lo hace tick a tick y
+  lap_positions() para una vuelta entera con las mismas cuentas, así el canal en vivo y el
+  offline coinciden.
+
+Uso offline:
+  python track_map.py best_lap.json -o track_map.json          (construir el mapa)
+  python track_map.py --deviation session_*.laps lap_*.json     (desviación de todas las vueltas)
+"""
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+
+from persistence import atomic_write, json_serializer
+
+EARTH_RADIUS = 6371000.0
+
+CELL_SIZE = 10.0       # m
+MAX_DEVIATION = 25.0   # m; más lejos de la trazada la desviación es None/NaN
+PCT_WINDOW = 0.05      # solo segmentos a menos de esto en LapDistPct (tramos del circuito que pasan cerca)
+MIN_SPEED = 1.0        # m/s; por debajo no se integra el giro con lat_accel / v
+MIN_SEGMENT = 2.0      # m; la trazada se guarda con puntos al menos a esta distancia (menos candidatos por celda)
+GRID_SIZE = 10000      # celdas de la rejilla por LapDistPct (punto y tangente de la referencia)
+
+TRACK_MAP_FILE = "track_map.json"
+
+# Canales que usan racing_line() y lap_positions()
+TRACK_MAP_KEYS = ("LapDistPct", "speed", "session_time", "yaw_north", "latitude", "longitude", "lat_accel")
+
+# GPS: variables de iRacing que solo están en los .ibt (no en TELEMETRY_VARS)
+IBT_GPS_VARS = {"latitude": "Lat", "longitude": "Lon"}
+
+
+def _has_values(column):
+    return column is not None and len(column) > 0 and not np.isnan(column).all()
+
+
+def project(latitude, longitude, origin):
+    """Lat/Lon (grados) a x/y (m, este/norte) alrededor de origin = (lat, lon)."""
+    lat0, lon0 = origin
+    x = np.radians(np.asarray(longitude) - lon0) * EARTH_RADIUS * math.cos(math.radians(lat0))
+    y = np.radians(np.asarray(latitude) - lat0) * EARTH_RADIUS
+    return x, y
+
+
+def _lap_columns(columns):
+    """Columnas de TRACK_MAP_KEYS como float64 (las que falten, None), muestras válidas en orden de tiempo."""
+    columns = {key: np.asarray(columns[key], dtype=np.float64) if key in columns and columns[key] is not None else None
+               for key in TRACK_MAP_KEYS}
+    valid = ~np.isnan(columns["LapDistPct"]) & ~np.isnan(columns["session_time"])
+    order = np.argsort(columns["session_time"][valid], kind="stable")
+    return {key: column[valid][order] if column is not None else None for key, column in columns.items()}
+
+
+def _unwrap_pct(pct):
+    """LapDistPct sin los saltos de 1.0 a 0.0 de la línea de meta (creciente a lo largo de varias vueltas)."""
+    return pct + np.concatenate(([0], np.cumsum(np.diff(pct) < -0.5)))
+
+
+def _steps(speed, session_time):
+    """Distancia (m) recorrida desde la muestra anterior (speed en km/h, trapecios)."""
+    speed = np.nan_to_num(speed) / 3.6
+    dt = np.diff(session_time, prepend=session_time[:1])
+    return (speed + np.concatenate((speed[:1], speed[:-1]))) / 2 * dt
+
+
+def _headings(columns, initial=0.0):
+    """
+    Rumbo de cada muestra (rad, 0 = este, antihorario). Con YawNorth es absoluto; si no, se
+    integra lat_accel / v partiendo de initial (la deriva crece a lo largo de la vuelta).
+    """
+    if _has_values(columns["yaw_north"]):
+        return math.pi / 2 - np.nan_to_num(columns["yaw_north"])
+    speed = np.nan_to_num(columns["speed"]) / 3.6
+    lat_accel = np.nan_to_num(columns["lat_accel"]) if columns["lat_accel"] is not None else np.zeros_like(speed)
+    dt = np.diff(columns["session_time"], prepend=columns["session_time"][:1])
+    rate = np.where(speed > MIN_SPEED, lat_accel / np.maximum(speed, MIN_SPEED), 0.0)
+    return initial + np.cumsum(rate * dt)
+
+
+def racing_line(columns, origin=None):
+    """
+    Trazada de una vuelta (dict canal -> array, claves de TRACK_MAP_KEYS; las que falten se
+    ignoran). Devuelve (pct, x, y, origin, heading): origin = (lat, lon) de la proyección si
+    hay GPS; heading, el rumbo de cada muestra (None con GPS sin YawNorth).
+    """
+    columns = _lap_columns(columns)
+    pct = columns["LapDistPct"]
+    if _has_values(columns["latitude"]) and _has_values(columns["longitude"]):
+        gps = ~np.isnan(columns["latitude"]) & ~np.isnan(columns["longitude"])
+        if origin is None:
+            origin = (float(np.mean(columns["latitude"][gps])), float(np.mean(columns["longitude"][gps])))
+        x, y = project(columns["latitude"][gps], columns["longitude"][gps], origin)
+        heading = _headings(columns)[gps] if _has_values(columns["yaw_north"]) else None
+        return pct[gps], x, y, origin, heading
+
+    theta = _headings(columns)
+    ds = _steps(columns["speed"], columns["session_time"])
+    # Cada paso con el rumbo medio entre sus dos muestras (si no, la trazada gira medio paso
+    # respecto a LapDistPct y la desviación en vivo deriva ~1 m por vuelta)
+    theta = np.unwrap(theta)
+    middle = (theta + np.concatenate((theta[:1], theta[:-1]))) / 2
+    x = np.cumsum(ds * np.cos(middle))
+    y = np.cumsum(ds * np.sin(middle))
+
+    # Las vueltas guardadas pueden llevar alguna muestra de la vuelta anterior o siguiente
+    unwrapped = _unwrap_pct(pct)
+    span = unwrapped[-1] - unwrapped[0] if len(pct) > 1 else 0.0
+    if span > 0.96:
+        # Vuelta completa: el final tiene que volver al principio. Lo que falta hasta la línea
+        # se extrapola con el último rumbo y el error se reparte según la distancia recorrida.
+        distance = np.cumsum(ds)
+        if distance[-1] > 0:
+            gap = (1.0 - span) * distance[-1] / span
+            error_x = x[-1] + gap * math.cos(theta[-1]) - x[0]
+            error_y = y[-1] + gap * math.sin(theta[-1]) - y[0]
+            fraction = distance / (distance[-1] + gap)
+            x -= error_x * fraction
+            y -= error_y * fraction
+    return pct, x, y, None, theta
+
+
+class TrackMap:
+    def __init__(self, lap_dist_pct, x, y, origin=None, heading=None):
+        """
+        Trazada de referencia (muestras en orden de recorrido, vuelta cerrada). heading: rumbo
+        medido en cada muestra (rad); sin él se usa la tangente de la trazada.
+        """
+        pct, x, y = (np.asarray(column, dtype=np.float64) for column in (lap_dist_pct, x, y))
+        keep = _thin(x, y, MIN_SEGMENT)
+        self.pct, self.x, self.y = pct[keep], x[keep], y[keep]
+        self.heading = np.asarray(heading, dtype=np.float64)[keep] if heading is not None else None
+        self.origin = tuple(origin) if origin is not None else None
+
+        # Segmentos i -> i+1 (el último cierra la vuelta). Como números complejos (x + iy) las
+        # cuentas de distancia son la mitad de operaciones numpy; una fila por dato para leer
+        # todos los de una celda de una vez: inicio, vector, su conjugado, 1/longitud², LapDistPct
+        self._dx = np.roll(self.x, -1) - self.x
+        self._dy = np.roll(self.y, -1) - self.y
+        start = self.x + 1j * self.y
+        vector = self._dx + 1j * self._dy
+        inverse_length2 = 1.0 / np.maximum(self._dx ** 2 + self._dy ** 2, 1e-9)
+        self._segments = np.array([start, vector, np.conj(vector), inverse_length2, self.pct])
+        self._build_index()
+        self._build_pct_grid()
+
+    def _build_index(self):
+        """Rejilla CSR: _cell_segments[_cell_start[c]:_cell_start[c + 1]] = segmentos de la celda c."""
+        margin = MAX_DEVIATION + CELL_SIZE
+        self._x0 = float(min(self.x.min(), (self.x + self._dx).min())) - margin
+        self._y0 = float(min(self.y.min(), (self.y + self._dy).min())) - margin
+        self._nx = int((max(self.x.max(), (self.x + self._dx).max()) + margin - self._x0) // CELL_SIZE) + 1
+        self._ny = int((max(self.y.max(), (self.y + self._dy).max()) + margin - self._y0) // CELL_SIZE) + 1
+
+        # Celdas que toca la caja de cada segmento ampliada en MAX_DEVIATION
+        lo_x = ((np.minimum(self.x, self.x + self._dx) - MAX_DEVIATION - self._x0) // CELL_SIZE).astype(np.int64)
+        hi_x = ((np.maximum(self.x, self.x + self._dx) + MAX_DEVIATION - self._x0) // CELL_SIZE).astype(np.int64)
+        lo_y = ((np.minimum(self.y, self.y + self._dy) - MAX_DEVIATION - self._y0) // CELL_SIZE).astype(np.int64)
+        hi_y = ((np.maximum(self.y, self.y + self._dy) + MAX_DEVIATION - self._y0) // CELL_SIZE).astype(np.int64)
+        cells, segments = [], []
+        for segment, (x0, x1, y0, y1) in enumerate(zip(lo_x.tolist(), hi_x.tolist(), lo_y.tolist(), hi_y.tolist())):
+            xs, ys = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+            cells.append((xs * self._ny + ys).ravel())
+            segments.append(np.full(xs.size, segment))
+        cells = np.concatenate(cells) if cells else np.empty(0, dtype=np.int64)
+        segments = np.concatenate(segments) if segments else np.empty(0, dtype=np.int64)
+
+        order = np.argsort(cells, kind="stable")
+        self._cell_segments = segments[order]
+        self._cell_start = np.searchsorted(cells[order], np.arange(self._nx * self._ny + 1))
+
+    def _build_pct_grid(self):
+        """Punto, tangente unitaria y rumbo de la referencia por celda de LapDistPct (O(1) en vivo)."""
+        cells = (np.arange(GRID_SIZE) + 0.5) / GRID_SIZE
+        order = np.argsort(self.pct, kind="stable")
+        pct = self.pct[order]
+        # Vuelta cerrada: un punto a cada lado de la línea de meta
+        pct = np.concatenate(([pct[-1] - 1.0], pct, [pct[0] + 1.0]))
+        x = np.concatenate((self.x[order][-1:], self.x[order], self.x[order][:1]))
+        y = np.concatenate((self.y[order][-1:], self.y[order], self.y[order][:1]))
+        self.grid_x = np.interp(cells, pct, x)
+        self.grid_y = np.interp(cells, pct, y)
+        tangent_x = np.roll(self.grid_x, -1) - np.roll(self.grid_x, 1)
+        tangent_y = np.roll(self.grid_y, -1) - np.roll(self.grid_y, 1)
+        norm = np.maximum(np.hypot(tangent_x, tangent_y), 1e-9)
+        self.grid_tx, self.grid_ty = tangent_x / norm, tangent_y / norm
+        if self.heading is None:
+            self.grid_heading = np.arctan2(self.grid_ty, self.grid_tx)
+        else:
+            # Por seno y coseno para no interpolar a través del salto de ±pi
+            heading = np.concatenate((self.heading[order][-1:], self.heading[order], self.heading[order][:1]))
+            self.grid_heading = np.arctan2(np.interp(cells, pct, np.sin(heading)), np.interp(cells, pct, np.cos(heading)))
+
+    @classmethod
+    def from_lap(cls, columns, origin=None):
+        """Mapa a partir de una vuelta (dict canal -> array, p. ej. un LapBuffer o read_lap)."""
+        return cls(*racing_line(columns, origin))
+
+    @classmethod
+    def load(cls, filename=TRACK_MAP_FILE):
+        """Carga un mapa guardado con save(); None si no existe o no se puede leer."""
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(filename, "r") as f:
+                data = json.load(f)
+            return cls(data["LapDistPct"], data["x"], data["y"], data.get("origin"), data.get("heading"))
+        except Exception as e:
+            print(f"Error cargando {filename}: {e}")
+            return None
+
+    def to_dict(self):
+        return {"origin": self.origin, "LapDistPct": self.pct.tolist(), "x": self.x.tolist(), "y": self.y.tolist(),
+                "heading": self.heading.tolist() if self.heading is not None else None}
+
+    def save(self, filename=TRACK_MAP_FILE):
+        atomic_write(filename, json_serializer(self.to_dict()))
+
+    def __len__(self):
+        return len(self.pct)
+
+    def cell_of(self, x, y):
+        """Índice de celda de la rejilla espacial para arrays de puntos; -1 fuera del mapa."""
+        cx = np.floor((np.asarray(x) - self._x0) / CELL_SIZE).astype(np.int64)
+        cy = np.floor((np.asarray(y) - self._y0) / CELL_SIZE).astype(np.int64)
+        inside = (cx >= 0) & (cx < self._nx) & (cy >= 0) & (cy < self._ny)
+        return np.where(inside, cx * self._ny + cy, -1)
+
+    def point_at(self, pct):
+        """(x, y, tx, ty, heading): punto de la referencia en LapDistPct = pct, tangente unitaria y rumbo, O(1)."""
+        cell = int(pct % 1.0 * GRID_SIZE)
+        return self.grid_x[cell], self.grid_y[cell], self.grid_tx[cell], self.grid_ty[cell], self.grid_heading[cell]
+
+    def deviation(self, x, y, pct=None):
+        """
+        Distancia con signo (m, + a la izquierda) de (x, y) a la trazada de referencia; None si
+        está a más de MAX_DEVIATION. Con pct solo cuentan segmentos a menos de PCT_WINDOW.
+        """
+        cx = math.floor((x - self._x0) / CELL_SIZE)
+        cy = math.floor((y - self._y0) / CELL_SIZE)
+        if not (0 <= cx < self._nx and 0 <= cy < self._ny):
+            return None
+        cell = cx * self._ny + cy
+        segments = self._cell_segments[self._cell_start[cell]:self._cell_start[cell + 1]]
+        if not len(segments):
+            return None
+        distance = self._signed_distance(self._segments[:, segments], x, y)
+        score = np.abs(distance)
+        if pct is not None:
+            score[np.abs((self._segments[4, segments].real - pct + 0.5) % 1.0 - 0.5) >= PCT_WINDOW] = np.inf
+        best = int(score.argmin())
+        return float(distance[best]) if score[best] <= MAX_DEVIATION else None
+
+    def deviation_many(self, x, y, pct=None):
+        """Igual que deviation() para arrays de puntos, vectorizado; NaN donde no hay valor."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        result = np.full(len(x), np.nan)
+        cells = self.cell_of(np.nan_to_num(x, nan=-1e12), np.nan_to_num(y, nan=-1e12))
+        counts = np.where(cells >= 0, self._cell_start[cells + 1] - self._cell_start[np.maximum(cells, 0)], 0)
+        if not counts.sum():
+            return result
+
+        # Todos los pares (punto, segmento candidato) en arrays planos
+        points = np.repeat(np.arange(len(x)), counts)
+        first = np.repeat(self._cell_start[np.maximum(cells, 0)] - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+        segments = self._cell_segments[first + np.arange(len(points))]
+        distance = self._signed_distance(self._segments[:, segments], x[points], y[points])
+        score = np.abs(distance)
+        if pct is not None:
+            pct = np.asarray(pct, dtype=np.float64)
+            score[np.abs((self._segments[4, segments].real - pct[points] + 0.5) % 1.0 - 0.5) >= PCT_WINDOW] = np.inf
+
+        # Mínimo por punto: ordenar por (punto, score) y quedarse con el primero de cada punto
+        order = np.lexsort((score, points))
+        points, score, distance = points[order], score[order], distance[order]
+        first = np.flatnonzero(np.concatenate(([True], points[1:] != points[:-1])))
+        best = first[score[first] <= MAX_DEVIATION]
+        result[points[best]] = distance[best]
+        return result
+
+    @staticmethod
+    def _signed_distance(segments, x, y):
+        """Distancia de (x, y) a cada segmento (columnas de _segments), negativa a la derecha."""
+        start, vector, conjugate, inverse_length2, _ = segments
+        offset = (x + 1j * y) - start
+        # Parte real: proyección sobre el segmento; imaginaria: producto vectorial (lado)
+        product = offset * conjugate
+        t = np.minimum(np.maximum(product.real * inverse_length2.real, 0.0), 1.0)
+        return np.copysign(np.abs(offset - t * vector), product.imag)
+
+
+def _thin(x, y, min_distance):
+    """Índices de los puntos que quedan al quitar los que están a menos de min_distance del anterior."""
+    distance = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))))
+    # Un punto por cada tramo de min_distance recorrido (siempre el primero)
+    _, keep = np.unique(np.floor(distance / min_distance), return_index=True)
+    return keep
+
+
+def lap_positions(track_map, columns):
+    """
+    Posición x/y de cada muestra de una vuelta respecto al mapa (vectorizado). Con GPS es la
+    proyección; si no, el punto de la referencia con el mismo LapDistPct más el desplazamiento
+    lateral integrado con YawNorth desde la línea de meta; sin ninguno de los dos, NaN.
+    Devuelve (pct, x, y) en orden de tiempo.
+    """
+    columns = _lap_columns(columns)
+    pct = columns["LapDistPct"]
+    if track_map.origin is not None and _has_values(columns["latitude"]) and _has_values(columns["longitude"]):
+        x, y = project(columns["latitude"], columns["longitude"], track_map.origin)
+        return pct, x, y
+    if not _has_values(columns["yaw_north"]):
+        nan = np.full(len(pct), np.nan)
+        return pct, nan, nan
+
+    cells = (pct % 1.0 * GRID_SIZE).astype(np.int64)
+    tx, ty, reference = track_map.grid_tx[cells], track_map.grid_ty[cells], track_map.grid_heading[cells]
+    # Como TrackPosition, se vuelve a empezar sobre la referencia en cada cruce de meta
+    start = np.flatnonzero(np.diff(pct, prepend=np.inf) < -0.5)
+    start = start[np.searchsorted(start, np.arange(len(pct)), side="right") - 1]
+    theta = _headings(columns)
+    steps = _steps(columns["speed"], columns["session_time"]) * np.sin(theta - reference)
+    steps[start] = 0.0
+    lateral = np.cumsum(steps)
+    lateral -= lateral[start]
+    return pct, track_map.grid_x[cells] - ty * lateral, track_map.grid_y[cells] + tx * lateral
+
+
+def lap_deviation(track_map, columns):
+    """Canal de desviación lateral (m) de una vuelta entera: (pct, desviación) en orden de tiempo."""
+    pct, x, y = lap_positions(track_map, columns)
+    return pct, track_map.deviation_many(x, y, pct)
+
+
+class TrackPosition:
+    """
+    Lo mismo que lap_positions() pero tick a tick (O(1)), para la captura en vivo: sin GPS
+    (que en vivo no hay), así que solo con YawNorth.
+    """
+    def __init__(self, track_map):
+        self.track_map = track_map
+        self.reset()
+
+    def reset(self):
+        self.lateral = 0.0
+        self.heading = None
+        self._last = None  # (pct, speed, session_time)
+
+    def update(self, pct, speed, session_time, yaw_north):
+        """(x, y) estimada de esta muestra (speed en km/h), o None si faltan datos (YawNorth incluido)."""
+        if pct is None or session_time is None or yaw_north is None:
+            # Sin rumbo no se puede seguir integrando: se vuelve a empezar cuando lo haya
+            self.reset()
+            return None
+
+        x, y, tx, ty, reference = self.track_map.point_at(pct)
+        speed = speed or 0.0
+        self.heading = math.pi / 2 - yaw_north
+        if self._last is None or pct < self._last[0] - 0.5:
+            # Primera muestra o línea de meta: se empieza sobre la trazada de referencia
+            self.lateral = 0.0
+        else:
+            last_pct, last_speed, last_time = self._last
+            ds = (speed + last_speed) / 2 / 3.6 * (session_time - last_time)
+            self.lateral += ds * math.sin(self.heading - reference)
+        self._last = (pct, speed, session_time)
+        return x - ty * self.lateral, y + tx * self.lateral
+
+
+def _load_ibt_laps(path):
+    """Vueltas cronometradas de un .ibt de iRacing, con Lat/Lon (ver IBT_GPS_VARS)."""
+    import irsdk
+    from telemetry_vars import TELEMETRY_VARS
+
+    ibt_vars = dict({key: TELEMETRY_VARS.get(key, key) for key in TRACK_MAP_KEYS}, **IBT_GPS_VARS)
+    ibt = irsdk.IBT()
+    ibt.open(path)
+    try:
+        columns = ibt.get_columns(ibt_vars.values())
+        laps = []
+        for lap in ibt.laps():
+            if lap["lap_time"] is None:
+                continue
+            # Copia (get_columns son vistas del archivo abierto)
+            lap_columns = {key: np.array(columns[ir_var][lap["start"]:lap["end"]], dtype=np.float64)
+                           for key, ir_var in ibt_vars.items() if ir_var in columns}
+            if "speed" in lap_columns:
+                lap_columns["speed"] *= 3.6
+            laps.append((f"{path}:{lap['lap']}", lap_columns))
+        return laps
+    finally:
+        ibt.close()
+
+
+def _load_laps(files):
+    """Vueltas (dicts canal -> array) de .ibt, lap stores y JSON con el formato de lap_*.json."""
+    from lap_store import LapStoreReader, STORE_SUFFIX
+
+    laps = []
+    for path in files:
+        if path.endswith(".ibt"):
+            laps += _load_ibt_laps(path)
+        elif path.endswith(STORE_SUFFIX):
+            reader = LapStoreReader(path)
+            for i, lap in enumerate(reader.laps):
+                if lap["lap_time"] is not None:
+                    laps.append((f"{path}:{i}", {key: np.array(reader.read(key, lap=i), dtype=np.float64)
+                                                 for key in TRACK_MAP_KEYS if key in reader.keys}))
+            reader.close()
+        else:
+            with open(path, "r") as f:
+                lap_data = json.load(f).get("lap_data", [])
+            laps.append((path, {key: np.array([data.get(key) for data in lap_data], dtype=np.float64)
+                                for key in TRACK_MAP_KEYS}))
+    return laps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mapa del circuito y desviación lateral respecto a la trazada de referencia")
+    parser.add_argument("files", nargs="+",
+                        help=".ibt de iRacing, lap stores (.laps) o JSON de vueltas (lap_*.json, best_lap.json)")
+    parser.add_argument("-o", "--output", default=TRACK_MAP_FILE, help=f"mapa (por defecto {TRACK_MAP_FILE})")
+    parser.add_argument("--deviation", action="store_true",
+                        help="calcular la desviación de cada vuelta con el mapa de --output en lugar de construirlo")
+    args = parser.parse_args()
+
+    laps = _load_laps(args.files)
+    if not args.deviation:
+        name, columns = laps[0]
+        track_map = TrackMap.from_lap(columns)
+        track_map.save(args.output)
+        length = float(np.sum(np.hypot(track_map._dx, track_map._dy)))
+        print(f"Mapa de {name}: {len(track_map)} puntos, {length:.0f} m -> {args.output}")
+        return
+
+    track_map = TrackMap.load(args.output)
+    if track_map is None:
+        print(f"No se encontró {args.output}; constrúyelo primero sin --deviation.")
+        return
+    for name, columns in laps:
+        _, deviation = lap_deviation(track_map, columns)
+        valid = deviation[~np.isnan(deviation)]
+        if not len(valid):
+            print(f"{name}: sin datos")
+            continue
+        print(f"{name}: desviación media {np.mean(np.abs(valid)):.2f} m, máx. {np.max(np.abs(valid)):.2f} m, "
+              f"{len(deviation) - len(valid)} muestras fuera del mapa")
+
+
+if __name__ == "__main__":
+    main()